@@ -4,16 +4,38 @@
 """
 多光谱影像手动调整脚本
 应用用户指定的偏移量调整已配准影像
+默认只更新地理变换 (输出 .vrt 时调整耗时与影像大小无关)
 """
 
 import sys
 import os
+import argparse
+
+# 命令行传入 --profile-imports 时，在导入依赖之前开始记录导入耗时
+if __name__ == "__main__":
+    import import_profiler
+    import_profiler.enable_if_requested()
+
+# GDAL 只在读写影像时按需导入
 import numpy as np
-import gdal
-from osgeo import osr
+
+import raster_profiles
+
+# 重采样偏移支持的方法
+RESAMPLE_METHODS = ('near', 'bilinear', 'cubic', 'cubicspline', 'lanczos', 'average')
+
+def _import_gdal():
+    """按需导入GDAL，兼容旧版本的顶层 gdal 模块"""
+    try:
+        from osgeo import gdal
+    except ImportError:
+        import gdal
+    return gdal
 
 def read_geotiff(filepath):
     """读取GeoTIFF影像，返回影像数据和地理信息"""
+    gdal = _import_gdal()
+    
     ds = gdal.Open(filepath)
     if ds is None:
         raise Exception(f"无法打开影像文件: {filepath}")
@@ -58,8 +80,8 @@ def apply_shift(geo_transform, dx, dy):
     
     return tuple(new_geo)
 
-def write_geotiff(filepath, data, geo_transform, projection, datatype=gdal.GDT_Float32):
-    """将影像数据写入GeoTIFF文件"""
+def write_geotiff(filepath, data, geo_transform, projection, datatype=None, output_options=None):
+    """将影像数据写入GeoTIFF文件 (分块、压缩设置见 raster_profiles)"""
     if len(data.shape) > 2 and data.shape[0] > 1:
         # 多波段影像
         bands, height, width = data.shape
@@ -72,8 +94,15 @@ def write_geotiff(filepath, data, geo_transform, projection, datatype=gdal.GDT_F
             bands = 1
             height, width = data.shape
     
+    gdal = _import_gdal()
+    if datatype is None:
+        datatype = gdal.GDT_Float32
+    
+    creation = raster_profiles.gdal_creation_options(
+        output_options, gdal.GetDataTypeName(datatype).lower()
+    )
     driver = gdal.GetDriverByName('GTiff')
-    out_ds = driver.Create(filepath, width, height, bands, datatype)
+    out_ds = driver.Create(filepath, width, height, bands, datatype, options=creation)
     
     if out_ds is None:
         raise Exception(f"无法创建输出文件: {filepath}")
@@ -93,36 +122,171 @@ def write_geotiff(filepath, data, geo_transform, projection, datatype=gdal.GDT_F
     out_ds.FlushCache()
     return out_ds
 
+def shift_georeference(input_path, output_path, dx, dy, output_options=None):
+    """
+    只修改地理变换参数完成偏移，不重采样像素
+    输出为 .vrt 时写出引用输入影像的VRT，耗时与影像大小无关；
+    输出为GeoTIFF时按偏移后的地理变换复制出独立的影像 (逐块复制像素，连同金字塔整理为COG布局)，
+    不在副本上原地修改地理变换，以免重写的IFD破坏COG布局
+    
+    Args:
+        input_path: 输入影像路径
+        output_path: 输出路径 (.vrt 或 GeoTIFF)
+        dx: X方向偏移量（像素，可为小数）
+        dy: Y方向偏移量（像素，可为小数）
+        output_options: 输出设置 (raster_profiles.output_options)，只用于GeoTIFF输出
+    
+    Returns:
+        output_path: 调整后的影像路径
+    """
+    gdal = _import_gdal()
+    
+    src_ds = gdal.Open(input_path)
+    if src_ds is None:
+        raise Exception(f"无法打开影像文件: {input_path}")
+    new_geo = apply_shift(src_ds.GetGeoTransform(), dx, dy)
+    
+    if output_path.lower().endswith('.vrt'):
+        src_ds = None
+        print(f"Writing VRT: {output_path}")
+        out_ds = gdal.Translate(output_path, input_path, format='VRT')
+        if out_ds is None:
+            raise Exception(f"无法创建输出文件: {output_path}")
+        out_ds.SetGeoTransform(new_geo)
+        out_ds = None
+        return output_path
+    
+    # 内存中的VRT只改变地理变换，作为复制的源 (金字塔随源影像一起暴露)
+    print(f"Writing shifted GeoTIFF: {output_path}")
+    shifted = gdal.Translate('', src_ds, format='VRT')
+    shifted.SetGeoTransform(new_geo)
+    
+    band = src_ds.GetRasterBand(1)
+    nbits = band.GetMetadataItem('NBITS', 'IMAGE_STRUCTURE')
+    creation = raster_profiles.gdal_creation_options(
+        output_options, gdal.GetDataTypeName(band.DataType).lower(), nbits
+    ) + ['COPY_SRC_OVERVIEWS=YES']
+    out_ds = gdal.Translate(output_path, shifted, format='GTiff', creationOptions=creation)
+    if out_ds is None:
+        raise Exception(f"无法创建输出文件: {output_path}")
+    out_ds = None
+    
+    shifted = None
+    src_ds = None
+    return output_path
+
+def resample_shift(input_path, output_path, dx, dy, resample='bilinear', output_options=None):
+    """
+    在原像素网格上按(亚像素)偏移重采样影像
+    输出为 .vrt 时写出按需重采样的Warped VRT；否则由 gdal.Warp 分块重采样并写出GeoTIFF
+    
+    Args:
+        input_path: 输入影像路径
+        output_path: 输出路径 (.vrt 或 GeoTIFF)
+        dx: X方向偏移量（像素，可为小数）
+        dy: Y方向偏移量（像素，可为小数）
+        resample: 重采样方法 (near, bilinear, cubic, ...)
+        output_options: 输出设置 (raster_profiles.output_options)
+    
+    Returns:
+        output_path: 调整后的影像路径
+    """
+    gdal = _import_gdal()
+    
+    src_ds = gdal.Open(input_path)
+    if src_ds is None:
+        raise Exception(f"无法打开影像文件: {input_path}")
+    
+    geo = src_ds.GetGeoTransform()
+    width, height = src_ds.RasterXSize, src_ds.RasterYSize
+    bounds = (
+        geo[0],
+        geo[3] + height * geo[5],
+        geo[0] + width * geo[1],
+        geo[3]
+    )
+    
+    # 内存中的VRT只改变地理变换，作为重采样的源
+    shifted = gdal.Translate('', src_ds, format='VRT')
+    shifted.SetGeoTransform(apply_shift(geo, dx, dy))
+    
+    warp_args = dict(
+        outputBounds=bounds,
+        width=width,
+        height=height,
+        resampleAlg=resample,
+        multithread=True
+    )
+    
+    if output_path.lower().endswith('.vrt'):
+        print(f"Writing warped VRT: {output_path}")
+        out_ds = gdal.Warp(output_path, shifted, format='VRT', **warp_args)
+        if out_ds is None:
+            raise Exception(f"无法创建输出文件: {output_path}")
+        out_ds = None
+    else:
+        print(f"Resampling image: {output_path}")
+        band = src_ds.GetRasterBand(1)
+        creation = raster_profiles.gdal_creation_options(
+            output_options, gdal.GetDataTypeName(band.DataType).lower()
+        )
+        out_ds = gdal.Warp(output_path, shifted, format='GTiff', creationOptions=creation, **warp_args)
+        if out_ds is None:
+            raise Exception(f"无法创建输出文件: {output_path}")
+        out_ds = None
+        raster_profiles.finalize_output_gdal(output_path, output_options)
+    
+    shifted = None
+    src_ds = None
+    return output_path
+
+def adjust_image(input_path, output_path, dx, dy, resample=None, output_options=None):
+    """
+    对已配准影像应用手动偏移并写出结果
+    默认只更新地理变换 (VRT或按新地理变换复制的GeoTIFF)，不重采样；指定重采样方法时在原像素网格上重采样
+    
+    Args:
+        input_path: 输入影像路径
+        output_path: 输出路径 (.vrt 或 GeoTIFF)
+        dx: X方向偏移量（像素）
+        dy: Y方向偏移量（像素）
+        resample: 重采样方法，为None时不重采样
+        output_options: 输出设置 (raster_profiles.output_options)，用于GeoTIFF输出
+    
+    Returns:
+        output_path: 调整后的影像路径
+    """
+    print(f"Reading input image: {input_path}")
+    print(f"Applying shift: dx={dx}, dy={dy}")
+    
+    if resample:
+        resample_shift(input_path, output_path, dx, dy, resample, output_options)
+    else:
+        shift_georeference(input_path, output_path, dx, dy, output_options)
+    
+    print("Manual adjustment completed successfully")
+    return output_path
+
 def main():
     """主函数"""
-    if len(sys.argv) != 5:
-        print("用法: python adjust_image.py <输入影像> <输出路径> <X偏移> <Y偏移>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='对已配准影像应用手动偏移')
+    parser.add_argument('input_path', help='输入影像')
+    parser.add_argument('output_path', help='输出路径 (.vrt 输出只引用输入影像)')
+    parser.add_argument('dx', type=float, help='X偏移 (像素)')
+    parser.add_argument('dy', type=float, help='Y偏移 (像素)')
+    parser.add_argument('--resample', choices=RESAMPLE_METHODS,
+                        help='在原像素网格上重采样 (亚像素偏移)，默认只更新地理变换')
+    parser.add_argument('--profile-imports', action='store_true', help='输出各依赖模块的导入耗时 (标准错误)')
     
-    input_path = sys.argv[1]
-    output_path = sys.argv[2]
-    dx = float(sys.argv[3])
-    dy = float(sys.argv[4])
+    args = parser.parse_args()
     
     try:
-        # 读取输入影像
-        print(f"Reading input image: {input_path}")
-        data, geo, proj, bands = read_geotiff(input_path)
-        
-        # 应用偏移
-        print(f"Applying shift: dx={dx}, dy={dy}")
-        new_geo = apply_shift(geo, dx, dy)
-        
-        # 写入结果
-        print(f"Writing output image: {output_path}")
-        write_geotiff(output_path, data, new_geo, proj)
-        
-        print("Manual adjustment completed successfully")
+        adjust_image(args.input_path, args.output_path, args.dx, args.dy, resample=args.resample)
         sys.exit(0)
-        
+    
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
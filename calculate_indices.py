@@ -3,168 +3,429 @@
 
 """
 光谱指数计算脚本
-用于计算多光谱影像的各种植被指数 (NDVI, EVI, SAVI等)
+用于计算多光谱影像的各种植被指数 (NDVI, EVI, SAVI, NDRE, GNDVI, MSAVI, NDWI)
+各波段只读取一次，所有指数以float32按公式计算；安装numexpr时使用numexpr融合求值
 """
 
 import os
 import sys
 import argparse
 import glob
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 命令行传入 --profile-imports 时，在导入依赖之前开始记录导入耗时
+if __name__ == "__main__":
+    import import_profiler
+    import_profiler.enable_if_requested()
+
 import rasterio
 import numpy as np
-from rasterio.mask import mask
-from rasterio.warp import calculate_default_transform, reproject, Resampling
 
-def get_band_file(input_dir, band_keyword):
+import raster_profiles
+import raster_interchange
+
+# 波段文件名关键字；红波段需要排除红边波段文件
+BAND_KEYWORDS = {
+    'blue': ('blue', ()),
+    'green': ('green', ()),
+    'red': ('red', ('rededge', 'red_edge', 'red-edge')),
+    'rededge': ('rededge', ()),
+    'nir': ('nir', ()),
+}
+
+# 光谱指数定义：所需波段、计算公式 (numexpr语法，也可由numpy逐块求值) 和默认参数
+# 分母不大于0的像素结果为0，计算结果限制在[-1, 1]范围内
+INDICES = {
+    'ndvi': {
+        'name': 'NDVI (归一化植被指数)',
+        'bands': ('red', 'nir'),
+        'expr': 'where(nir + red > 0, (nir - red) / (nir + red), 0)',
+        'params': {},
+    },
+    'evi': {
+        'name': 'EVI (增强型植被指数)',
+        'bands': ('blue', 'red', 'nir'),
+        'expr': 'where(nir + c1 * red - c2 * blue + l > 0, '
+                'g * (nir - red) / (nir + c1 * red - c2 * blue + l), 0)',
+        'params': {'g': 2.5, 'c1': 6.0, 'c2': 7.5, 'l': 1.0},
+    },
+    'savi': {
+        'name': 'SAVI (土壤调节植被指数)',
+        'bands': ('red', 'nir'),
+        'expr': 'where(nir + red + l > 0, (nir - red) / (nir + red + l) * (1 + l), 0)',
+        'params': {'l': 0.5},
+    },
+    'ndre': {
+        'name': 'NDRE (归一化红边指数)',
+        'bands': ('rededge', 'nir'),
+        'expr': 'where(nir + rededge > 0, (nir - rededge) / (nir + rededge), 0)',
+        'params': {},
+    },
+    'gndvi': {
+        'name': 'GNDVI (绿色归一化植被指数)',
+        'bands': ('green', 'nir'),
+        'expr': 'where(nir + green > 0, (nir - green) / (nir + green), 0)',
+        'params': {},
+    },
+    'msavi': {
+        'name': 'MSAVI (修正土壤调节植被指数)',
+        'bands': ('red', 'nir'),
+        'expr': 'where((2 * nir + 1) ** 2 - 8 * (nir - red) >= 0, '
+                '(2 * nir + 1 - sqrt((2 * nir + 1) ** 2 - 8 * (nir - red))) / 2, 0)',
+        'params': {},
+    },
+    'ndwi': {
+        'name': 'NDWI (归一化水体指数)',
+        'bands': ('green', 'nir'),
+        'expr': 'where(green + nir > 0, (green - nir) / (green + nir), 0)',
+        'params': {},
+    },
+}
+
+# 未安装numexpr时，逐块求值的行数，限制临时数组的大小
+DEFAULT_BLOCK_ROWS = 256
+
+
+# numpy求值时公式中可用的函数
+_NUMPY_FUNCTIONS = {'where': np.where, 'sqrt': np.sqrt, 'abs': np.abs, 'log': np.log, 'exp': np.exp}
+
+def get_band_file(input_dir, band_keyword, exclude=()):
     """根据关键字查找对应的波段文件"""
     pattern = os.path.join(input_dir, f"*{band_keyword}*.tif")
-    files = glob.glob(pattern)
+    files = [f for f in sorted(glob.glob(pattern))
+             if not any(word in os.path.basename(f).lower() for word in exclude)]
     if not files:
         print(f"警告: 找不到包含关键字 '{band_keyword}' 的文件")
         return None
     return files[0]
 
-def calculate_ndvi(red_file, nir_file, output_file):
-    """计算NDVI (归一化植被指数)"""
-    print(f"正在计算NDVI: {output_file}")
+def find_band_files(input_dir, bands=None):
+    """
+    在输入目录中查找各波段文件
     
-    with rasterio.open(red_file) as red_src:
-        red = red_src.read(1).astype(float)
-        profile = red_src.profile
-        
-    with rasterio.open(nir_file) as nir_src:
-        nir = nir_src.read(1).astype(float)
+    Args:
+        input_dir: 输入多光谱影像目录
+        bands: 需要查找的波段名列表，默认查找全部已知波段
     
-    # 避免除零错误
-    denominator = nir + red
-    ndvi = np.zeros_like(denominator)
-    valid_mask = denominator > 0
-    ndvi[valid_mask] = (nir[valid_mask] - red[valid_mask]) / denominator[valid_mask]
-    
-    # 将NDVI值限制在[-1, 1]范围内
-    ndvi = np.clip(ndvi, -1.0, 1.0)
+    Returns:
+        band_files: 波段名到文件路径的字典 (只包含找到的波段)
+    """
+    band_files = {}
+    for band in bands or BAND_KEYWORDS:
+        keyword, exclude = BAND_KEYWORDS[band]
+        band_file = get_band_file(input_dir, keyword, exclude)
+        if band_file:
+            band_files[band] = band_file
+    return band_files
+
+def _get_numexpr():
+    """按需导入numexpr，未安装时返回None"""
+    try:
+        import numexpr
+    except ImportError:
+        return None
+    return numexpr
+
+def evaluate_index(expr, bands, params, out, block_rows=DEFAULT_BLOCK_ROWS):
+    """
+    按公式计算光谱指数，结果写入预先分配的float32数组
     
-    # 更新profile
-    profile.update(
-        dtype=rasterio.float32,
-        count=1,
-        nodata=0
-    )
+    Args:
+        expr: 指数计算公式
+        bands: 波段名到float32数组的字典
+        params: 公式中的常数参数
+        out: 输出数组
+        block_rows: numpy求值时每块的行数
     
-    with rasterio.open(output_file, 'w', **profile) as dst:
-        dst.write(ndvi.astype(rasterio.float32), 1)
+    Returns:
+        out: 输出数组
+    """
+    numexpr = _get_numexpr()
+    if numexpr is not None:
+        # numexpr在内部分块并融合整个表达式，不产生整幅临时数组
+        local_dict = dict(bands)
+        local_dict.update({k: np.float32(v) for k, v in params.items()})
+        numexpr.evaluate(expr, local_dict=local_dict, out=out, casting='same_kind')
+    else:
+        # 逐块求值，临时数组大小不超过 block_rows 行
+        code = compile(expr, '<index>', 'eval')
+        scalars = {k: np.float32(v) for k, v in params.items()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for row in range(0, out.shape[0], block_rows):
+                rows = slice(row, row + block_rows)
+                local_dict = {name: data[rows] for name, data in bands.items()}
+                local_dict.update(scalars)
+                out[rows] = eval(code, {'__builtins__': {}, **_NUMPY_FUNCTIONS}, local_dict)
     
-    print(f"NDVI计算完成: {output_file}")
-    return output_file
+    # 将结果限制在[-1, 1]范围内
+    np.clip(out, -1.0, 1.0, out=out)
+    return out
 
-def calculate_evi(blue_file, red_file, nir_file, output_file, g=2.5, c1=6.0, c2=7.5, l=1.0):
-    """计算EVI (增强型植被指数)"""
-    print(f"正在计算EVI: {output_file}")
+def select_indices(band_files, outputs, params=None):
+    """
+    检查要计算的指数及其所需波段，合并指数参数
     
-    with rasterio.open(blue_file) as blue_src:
-        blue = blue_src.read(1).astype(float)
-        profile = blue_src.profile
-        
-    with rasterio.open(red_file) as red_src:
-        red = red_src.read(1).astype(float)
+    Args:
+        band_files: 波段名到文件路径的字典
+        outputs: 指数名到输出路径的字典
+        params: 各指数的参数覆盖
     
-    with rasterio.open(nir_file) as nir_src:
-        nir = nir_src.read(1).astype(float)
+    Returns:
+        selected: 指数名到 (公式, 参数, 输出路径) 的字典，缺少波段的指数被跳过
+    """
+    params = params or {}
     
-    # EVI计算公式: G * ((NIR - Red) / (NIR + C1 * Red - C2 * Blue + L))
-    denominator = nir + c1 * red - c2 * blue + l
-    evi = np.zeros_like(denominator)
-    valid_mask = denominator > 0
-    evi[valid_mask] = g * (nir[valid_mask] - red[valid_mask]) / denominator[valid_mask]
+    selected = {}
+    for index, output_file in outputs.items():
+        if index not in INDICES:
+            print(f"警告: 未知的光谱指数 '{index}'，可选: {', '.join(INDICES)}")
+            continue
+        missing = [band for band in INDICES[index]['bands'] if not band_files.get(band)]
+        if missing:
+            print(f"警告: 计算{index.upper()}需要{', '.join(b.upper() for b in missing)}波段，但找不到对应的波段文件")
+            continue
+        index_params = dict(INDICES[index]['params'])
+        index_params.update(params.get(index, {}))
+        selected[index] = (INDICES[index]['expr'], index_params, output_file)
     
-    # 通常EVI的范围在-1到1之间，但可能略微超出
-    evi = np.clip(evi, -1.0, 1.0)
+    return selected
+
+def _output_profile(band_files, bands, options):
+    """检查各波段尺寸一致，返回输出文件的profile"""
+    profile = None
+    for band in bands:
+        with raster_interchange.open_raster(band_files[band]) as src:
+            if profile is None:
+                profile = src.profile
+            elif (src.height, src.width) != (profile['height'], profile['width']):
+                raise ValueError(f"{band.upper()}波段与其他波段的尺寸不一致")
     
-    # 更新profile
+    # 分块、压缩和编码设置由共用的输出配置决定
+    profile = raster_profiles.index_profile(profile, options)
     profile.update(
-        dtype=rasterio.float32,
         count=1,
         nodata=0
     )
+    return profile
+
+def _open_output(output_file, profile, options):
+    """创建指数输出文件，int16编码时写入缩放系数"""
+    dst = rasterio.open(output_file, 'w', **profile)
+    if options['encoding'] == 'int16':
+        dst.scales = (raster_profiles.index_scale(options),)
+    return dst
+
+def compute_indices(band_files, outputs, params=None, block_size=None, workers=None, output_options=None):
+    """
+    一次读取所需波段，计算并写出多个光谱指数
     
-    with rasterio.open(output_file, 'w', **profile) as dst:
-        dst.write(evi.astype(rasterio.float32), 1)
+    Args:
+        band_files: 波段名到文件路径的字典，如 {'red': ..., 'nir': ...}
+        outputs: 指数名到输出路径的字典，如 {'ndvi': 'ndvi.tif'}
+        params: 各指数的参数覆盖，如 {'savi': {'l': 0.5}}
+        block_size: 分块大小 (像素)，指定后按输出块流式处理，内存占用与影像大小无关
+        workers: 分块处理的线程数 (未指定分块大小时使用默认值)
+        output_options: 输出设置 (raster_profiles.output_options)，默认为分块压缩的COG
     
-    print(f"EVI计算完成: {output_file}")
-    return output_file
-
-def calculate_savi(red_file, nir_file, output_file, l=0.5):
-    """计算SAVI (土壤调节植被指数)"""
-    print(f"正在计算SAVI: {output_file}")
+    Returns:
+        output_files: 计算完成的输出文件路径列表
+    """
+    selected = select_indices(band_files, outputs, params)
+    if not selected:
+        return []
+    
+    # 流式处理时输出分块与计算块一致
+    options = output_options or raster_profiles.output_options()
+    if block_size:
+        options = raster_profiles.output_options(**dict(options, block_size=block_size))
     
-    with rasterio.open(red_file) as red_src:
-        red = red_src.read(1).astype(float)
-        profile = red_src.profile
+    needed = sorted({band for index in selected for band in INDICES[index]['bands']})
+    profile = _output_profile(band_files, needed, options)
+    
+    if block_size or workers:
+        output_files = compute_indices_blocks(
+            {band: band_files[band] for band in needed}, selected, profile, options,
+            workers=workers or 1
+        )
+        for output_file in output_files:
+            raster_profiles.finalize_output(output_file, options)
+        return output_files
+    
+    # 整幅模式：每个波段只读取一次，直接读为float32
+    bands = {}
+    for band in needed:
+        print(f"读取{band.upper()}波段: {band_files[band]}")
+        with raster_interchange.open_raster(band_files[band]) as src:
+            bands[band] = src.read(1, out_dtype='float32')
+    
+    output_files = []
+    out = np.empty((profile['height'], profile['width']), dtype=np.float32)
+    for index, (expr, index_params, output_file) in selected.items():
+        print(f"正在计算{INDICES[index]['name']}: {output_file}")
+        evaluate_index(expr, bands, index_params, out)
+        
+        with _open_output(output_file, profile, options) as dst:
+            dst.write(raster_profiles.encode_index(out, options), 1)
+        raster_profiles.finalize_output(output_file, options)
         
-    with rasterio.open(nir_file) as nir_src:
-        nir = nir_src.read(1).astype(float)
+        print(f"{index.upper()}计算完成: {output_file}")
+        output_files.append(output_file)
     
-    # SAVI计算公式: ((NIR - Red) / (NIR + Red + L)) * (1 + L)
-    denominator = nir + red + l
-    savi = np.zeros_like(denominator)
-    valid_mask = denominator > 0
-    savi[valid_mask] = ((nir[valid_mask] - red[valid_mask]) / denominator[valid_mask]) * (1 + l)
+    return output_files
+
+class _BandReader:
+    """按窗口读取波段数据；每个线程打开各自的数据集，rasterio数据集不能跨线程共享"""
     
-    # 通常SAVI值在-1到1之间
-    savi = np.clip(savi, -1.0, 1.0)
+    def __init__(self, band_files):
+        self.band_files = band_files
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.opened = []
     
-    # 更新profile
-    profile.update(
-        dtype=rasterio.float32,
-        count=1,
-        nodata=0
-    )
+    def read(self, window):
+        datasets = getattr(self.local, 'datasets', None)
+        if datasets is None:
+            datasets = {band: raster_interchange.open_raster(path) for band, path in self.band_files.items()}
+            self.local.datasets = datasets
+            with self.lock:
+                self.opened.extend(datasets.values())
+        return {band: src.read(1, window=window, out_dtype='float32') for band, src in datasets.items()}
+    
+    def close(self):
+        for src in self.opened:
+            src.close()
+
+def _compute_block(reader, selected, options, window):
+    """读取一个窗口的波段数据，计算全部指数并按输出编码转换"""
+    bands = reader.read(window)
+    results = {}
+    for index, (expr, index_params, _) in selected.items():
+        out = np.empty((window.height, window.width), dtype=np.float32)
+        results[index] = raster_profiles.encode_index(evaluate_index(expr, bands, index_params, out), options)
+    return window, results
+
+def compute_indices_blocks(band_files, selected, profile, options, workers=1):
+    """
+    按输出文件的内部分块流式计算光谱指数
+    每次只读取一个块的各波段数据，计算全部指数后写出，多线程时同时处理的块数有上限
+    
+    Args:
+        band_files: 所需波段名到文件路径的字典
+        selected: select_indices 返回的指数字典
+        profile: 输出文件的profile (分块存储，块窗口即为读取和计算的单位)
+        options: 输出设置
+        workers: 读取和计算的线程数
     
-    with rasterio.open(output_file, 'w', **profile) as dst:
-        dst.write(savi.astype(rasterio.float32), 1)
+    Returns:
+        output_files: 计算完成的输出文件路径列表
+    """
+    print(f"分块计算 {', '.join(index.upper() for index in selected)}，块大小 {options['block_size']}，线程数 {workers}")
     
-    print(f"SAVI计算完成: {output_file}")
+    reader = _BandReader(band_files)
+    destinations = {}
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for index, (_, _, output_file) in selected.items():
+            destinations[index] = _open_output(output_file, profile, options)
+        
+        def write_block(window, results):
+            for index, data in results.items():
+                destinations[index].write(data, 1, window=window)
+        
+        windows = [window for _, window in next(iter(destinations.values())).block_windows(1)]
+        
+        if executor is None:
+            for window in windows:
+                write_block(*_compute_block(reader, selected, options, window))
+        else:
+            # 按顺序写出，正在处理的块数不超过线程数的两倍，内存占用有界
+            pending = deque()
+            for window in windows:
+                pending.append(executor.submit(_compute_block, reader, selected, options, window))
+                if len(pending) >= workers * 2:
+                    write_block(*pending.popleft().result())
+            while pending:
+                write_block(*pending.popleft().result())
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for dst in destinations.values():
+            dst.close()
+        reader.close()
+    
+    output_files = []
+    for index, (_, _, output_file) in selected.items():
+        print(f"{index.upper()}计算完成: {output_file}")
+        output_files.append(output_file)
+    
+    return output_files
+
+def calculate_ndvi(red_file, nir_file, output_file):
+    """计算NDVI (归一化植被指数)"""
+    compute_indices({'red': red_file, 'nir': nir_file}, {'ndvi': output_file})
+    return output_file
+
+def calculate_evi(blue_file, red_file, nir_file, output_file, g=2.5, c1=6.0, c2=7.5, l=1.0):
+    """计算EVI (增强型植被指数)"""
+    compute_indices(
+        {'blue': blue_file, 'red': red_file, 'nir': nir_file},
+        {'evi': output_file},
+        params={'evi': {'g': g, 'c1': c1, 'c2': c2, 'l': l}}
+    )
+    return output_file
+
+def calculate_savi(red_file, nir_file, output_file, l=0.5):
+    """计算SAVI (土壤调节植被指数)"""
+    compute_indices({'red': red_file, 'nir': nir_file}, {'savi': output_file}, params={'savi': {'l': l}})
     return output_file
 
 def main():
     parser = argparse.ArgumentParser(description="计算多光谱影像的光谱指数")
     parser.add_argument("--input", required=True, help="输入多光谱影像目录")
     parser.add_argument("--output", required=True, help="输出光谱指数目录")
-    parser.add_argument("--indices", default="ndvi,evi,savi", help="要计算的光谱指数, 用逗号分隔")
+    parser.add_argument("--indices", default="ndvi,evi,savi", help=f"要计算的光谱指数, 用逗号分隔 (可选: {','.join(INDICES)})")
+    parser.add_argument("--block-size", type=int, help="按分块流式计算的块大小 (像素，16的倍数)，用于超大正射影像")
+    parser.add_argument("--workers", type=int, help="分块计算的线程数，指定后按分块流式计算")
+    parser.add_argument("--compress", default=raster_profiles.DEFAULT_COMPRESS, choices=raster_profiles.COMPRESS_METHODS,
+                        help=f"输出压缩方式 (默认: {raster_profiles.DEFAULT_COMPRESS})")
+    parser.add_argument("--encoding", default=raster_profiles.DEFAULT_ENCODING, choices=raster_profiles.INDEX_ENCODINGS,
+                        help="指数存储编码: float32、float16 (NBITS=16) 或 int16 (缩放10000) (默认: float32)")
+    parser.add_argument("--no-overviews", action="store_true", help="不生成内部金字塔")
+    parser.add_argument("--no-cog", action="store_true", help="不整理为COG布局")
+    parser.add_argument("--profile-imports", action="store_true", help="输出各依赖模块的导入耗时 (标准错误)")
     
     args = parser.parse_args()
     
     # 确保输出目录存在
     os.makedirs(args.output, exist_ok=True)
     
+    # 解析要计算的指数
+    indices = [index.strip().lower() for index in args.indices.split(",") if index.strip()]
+    
     # 准备输入文件
-    red_file = get_band_file(args.input, "red")
-    nir_file = get_band_file(args.input, "nir")
-    blue_file = get_band_file(args.input, "blue")
+    needed = {band for index in indices if index in INDICES for band in INDICES[index]['bands']}
+    band_files = find_band_files(args.input, [band for band in BAND_KEYWORDS if band in needed])
     
-    if not red_file or not nir_file:
+    if any(band in needed and band not in band_files for band in ("red", "nir")):
         print("错误: 找不到必要的红外(NIR)或红(RED)波段文件")
         sys.exit(1)
     
-    # 解析要计算的指数
-    indices = [index.strip().lower() for index in args.indices.split(",")]
-    
-    # 计算所选择的光谱指数
-    calculated_files = []
-    
-    if "ndvi" in indices:
-        ndvi_output = os.path.join(args.output, "ndvi.tif")
-        calculated_files.append(calculate_ndvi(red_file, nir_file, ndvi_output))
-    
-    if "evi" in indices and blue_file:
-        evi_output = os.path.join(args.output, "evi.tif")
-        calculated_files.append(calculate_evi(blue_file, red_file, nir_file, evi_output))
-    elif "evi" in indices:
-        print("警告: 计算EVI需要蓝(BLUE)波段，但找不到蓝波段文件")
-    
-    if "savi" in indices:
-        savi_output = os.path.join(args.output, "savi.tif")
-        calculated_files.append(calculate_savi(red_file, nir_file, savi_output))
+    # 一次读取波段，计算所选择的光谱指数
+    outputs = {index: os.path.join(args.output, f"{index}.tif") for index in indices}
+    options = raster_profiles.output_options(
+        compress=args.compress,
+        encoding=args.encoding,
+        overviews=not args.no_overviews,
+        cog=not args.no_cog
+    )
+    calculated_files = compute_indices(
+        band_files, outputs,
+        block_size=args.block_size,
+        workers=args.workers,
+        output_options=options
+    )
     
     # 输出结果
     print("\n计算完成的光谱指数:")
@@ -172,4 +433,4 @@ def main():
         print(f"- {file}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+树冠检测参数标定脚本
+在参数网格 (min_height、smooth_sigma、min_distance) 上运行树顶检测，
+用KD树将检测到的树顶与实测树木位置一一匹配，统计检测率、误检率和漏检率，输出排序后的结果表
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+import logging
+
+# 命令行传入 --profile-imports 时，在导入依赖之前开始记录导入耗时
+if __name__ == "__main__":
+    import import_profiler
+    import_profiler.enable_if_requested()
+
+from concurrent.futures import ProcessPoolExecutor
+import tempfile
+import numpy as np
+
+import raster_interchange
+from tree_crown_detection import ChmStages, tree_top_coordinates
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 默认匹配距离 (米)：检测树顶与实测树木之间超过该距离不视为匹配
+DEFAULT_MATCH_DISTANCE = 2.0
+
+# 实测树木CSV中可识别的坐标列名
+X_COLUMNS = ('x', 'easting', 'east', 'lon', 'longitude')
+Y_COLUMNS = ('y', 'northing', 'north', 'lat', 'latitude')
+
+# 结果表的列
+RESULT_FIELDS = [
+    'rank', 'smooth_sigma', 'min_height', 'min_distance', 'reference_count', 'detected_count',
+    'matched_count', 'detection_rate', 'commission_rate', 'omission_rate', 'f1_score', 'mean_offset_m'
+]
+
+def read_reference_points(reference_path):
+    """
+    读取实测树木位置
+    
+    Args:
+        reference_path: 点要素GeoJSON，或包含坐标列 (x/y、easting/northing 等) 的CSV，坐标系须与CHM一致
+    
+    Returns:
+        points: (N, 2) 坐标数组
+    """
+    try:
+        if reference_path.lower().endswith('.csv'):
+            with open(reference_path, 'r', encoding='utf-8-sig', newline='') as f:
+                reader = csv.DictReader(f)
+                columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+                x_col = next((columns[c] for c in X_COLUMNS if c in columns), None)
+                y_col = next((columns[c] for c in Y_COLUMNS if c in columns), None)
+                if x_col is None or y_col is None:
+                    raise ValueError(f"CSV中找不到坐标列，可用列名: {', '.join(X_COLUMNS)} / {', '.join(Y_COLUMNS)}")
+                points = [(float(row[x_col]), float(row[y_col])) for row in reader]
+        else:
+            with open(reference_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            points = [
+                feature['geometry']['coordinates'][:2]
+                for feature in data.get('features', [])
+                if feature.get('geometry') and feature['geometry'].get('type') == 'Point'
+            ]
+        
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            raise ValueError("实测树木文件中没有点位")
+        
+        logger.info(f"成功读取实测树木位置, 共 {len(points)} 棵")
+        return points
+    except Exception as e:
+        logger.error(f"读取实测树木文件失败: {str(e)}")
+        raise
+
+def match_trees(reference, detected, max_distance=DEFAULT_MATCH_DISTANCE):
+    """
+    一对一匹配实测树木和检测树顶：在 max_distance 内的候选对按距离从近到远贪心分配
+    
+    Args:
+        reference: 实测树木坐标 (N, 2)
+        detected: 检测树顶坐标 (M, 2)
+        max_distance: 最大匹配距离
+    
+    Returns:
+        pairs: 匹配对 (K, 2)，每行为 (实测索引, 检测索引)
+        distances: 各匹配对的距离 (K,)
+    """
+    from scipy.spatial import cKDTree
+    
+    if len(reference) == 0 or len(detected) == 0:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0)
+    
+    candidates = cKDTree(reference).sparse_distance_matrix(
+        cKDTree(detected), max_distance, output_type='ndarray'
+    )
+    order = np.argsort(candidates['v'], kind='stable')
+    
+    used_ref = np.zeros(len(reference), dtype=bool)
+    used_det = np.zeros(len(detected), dtype=bool)
+    pairs, distances = [], []
+    for k in order:
+        i, j = candidates['i'][k], candidates['j'][k]
+        if used_ref[i] or used_det[j]:
+            continue
+        used_ref[i] = used_det[j] = True
+        pairs.append((i, j))
+        distances.append(candidates['v'][k])
+    
+    return np.asarray(pairs, dtype=np.int64).reshape(-1, 2), np.asarray(distances, dtype=np.float64)
+
+def reference_extent(reference, margin):
+    """实测树木的外包矩形 (xmin, ymin, xmax, ymax)，四周扩展 margin"""
+    xmin, ymin = reference.min(axis=0) - margin
+    xmax, ymax = reference.max(axis=0) + margin
+    return xmin, ymin, xmax, ymax
+
+def score_detection(reference, detected, max_distance=DEFAULT_MATCH_DISTANCE, extent=None):
+    """
+    计算检测精度指标
+    
+    Args:
+        reference: 实测树木坐标 (N, 2)
+        detected: 检测树顶坐标 (M, 2)
+        max_distance: 最大匹配距离
+        extent: 只统计该范围 (xmin, ymin, xmax, ymax) 内的检测树顶，None表示不限制
+    
+    Returns:
+        scores: 指标字典
+            detection_rate: 检测率 (匹配数 / 实测数)
+            commission_rate: 误检率 (未匹配的检测数 / 检测数)
+            omission_rate: 漏检率 (未匹配的实测数 / 实测数)
+            f1_score: F1分数
+            mean_offset_m: 匹配对的平均距离
+    """
+    if extent is not None and len(detected):
+        xmin, ymin, xmax, ymax = extent
+        inside = ((detected[:, 0] >= xmin) & (detected[:, 0] <= xmax) &
+                  (detected[:, 1] >= ymin) & (detected[:, 1] <= ymax))
+        detected = detected[inside]
+    
+    pairs, distances = match_trees(reference, detected, max_distance)
+    n_ref, n_det, n_match = len(reference), len(detected), len(pairs)
+    
+    return {
+        'reference_count': n_ref,
+        'detected_count': n_det,
+        'matched_count': n_match,
+        'detection_rate': n_match / n_ref if n_ref else 0.0,
+        'commission_rate': (n_det - n_match) / n_det if n_det else 0.0,
+        'omission_rate': (n_ref - n_match) / n_ref if n_ref else 0.0,
+        'f1_score': 2 * n_match / (n_ref + n_det) if n_ref + n_det else 0.0,
+        'mean_offset_m': float(distances.mean()) if n_match else None,
+    }
+
+# 标定工作进程中的CHM阶段图，由 _init_calibration_worker 初始化
+_worker_graph = None
+
+def _init_calibration_worker(chm_path):
+    """
+    工作进程初始化：以内存映射打开共享的CHM中间数组，平滑和阈值结果在同一进程的任务之间复用
+    
+    Args:
+        chm_path: CHM中间数组 (.npy) 路径，各进程通过页缓存共享同一份像素
+    """
+    global _worker_graph
+    _worker_graph = ChmStages(chm_path, max_entries=2)
+
+def _calibration_task(task, graph=None):
+    """评估一组 (smooth_sigma, min_height) 下的全部 min_distance (在工作进程中执行时使用进程的阶段图)"""
+    smooth_sigma, min_height, min_distances, reference, max_distance, extent = task
+    graph = graph or _worker_graph
+    transform = graph.read()[1]
+    
+    results = []
+    for min_distance in min_distances:
+        tree_tops, _ = graph.detect(smooth_sigma, min_height, min_distance)
+        detected = tree_top_coordinates(tree_tops, transform)
+        scores = score_detection(reference, detected, max_distance, extent)
+        scores.update(smooth_sigma=smooth_sigma, min_height=min_height, min_distance=min_distance)
+        results.append(scores)
+    return results
+
+def calibrate_detection(
+    chm_path,
+    reference_path,
+    min_heights=(2.0,),
+    smooth_sigmas=(1.0,),
+    min_distances=(5,),
+    max_distance=DEFAULT_MATCH_DISTANCE,
+    clip_to_reference=True,
+    workers=1,
+    output_path=None
+):
+    """
+    在参数网格上标定树冠检测参数
+    
+    Args:
+        chm_path: CHM文件路径
+        reference_path: 实测树木位置文件 (GeoJSON点或CSV)
+        min_heights: 最小树高阈值列表
+        smooth_sigmas: 高斯平滑参数列表
+        min_distances: 树顶检测最小距离列表 (像素)
+        max_distance: 最大匹配距离 (米)
+        clip_to_reference: 是否只统计实测树木外包矩形 (扩展匹配距离) 内的检测树顶，
+                           适用于只调查了样地范围的情况
+        workers: 并行工作进程数
+        output_path: 结果CSV路径 (可选)
+    
+    Returns:
+        results: 按F1分数从高到低排序的结果列表
+    """
+    reference = read_reference_points(reference_path)
+    extent = reference_extent(reference, max_distance) if clip_to_reference else None
+    
+    # 每个任务对应一组 (smooth_sigma, min_height)，按 smooth_sigma 排列以便进程内复用平滑结果
+    tasks = [
+        (float(smooth_sigma), float(min_height), [int(d) for d in min_distances], reference, max_distance, extent)
+        for smooth_sigma in smooth_sigmas
+        for min_height in min_heights
+    ]
+    logger.info(f"参数网格共 {len(tasks) * len(min_distances)} 组参数，工作进程数: {workers}")
+    
+    if workers > 1:
+        # 只解码一次CHM：已有可用的中间数组时直接使用，否则导出到临时目录，
+        # 工作进程以内存映射打开同一份数组，不再各自解码整幅GeoTIFF
+        with tempfile.TemporaryDirectory(prefix='calibration_') as tmp_dir:
+            shared_path = raster_interchange.find(chm_path)
+            if shared_path is None:
+                shared_path = raster_interchange.export(chm_path, output_path=os.path.join(tmp_dir, 'chm.npy'))
+            
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_calibration_worker, initargs=(shared_path,)
+            ) as executor:
+                task_results = list(executor.map(_calibration_task, tasks))
+    else:
+        # 单进程时使用局部阶段图，返回后即释放，不在常驻工作进程中保留整幅数组
+        graph = ChmStages(chm_path, max_entries=2)
+        task_results = [_calibration_task(task, graph) for task in tasks]
+    
+    results = [scores for group in task_results for scores in group]
+    
+    # 按F1分数排序，分数相同时检测数更接近实测数的排在前面
+    results.sort(key=lambda r: (-r['f1_score'], abs(r['detected_count'] - r['reference_count'])))
+    for rank, scores in enumerate(results, start=1):
+        scores['rank'] = rank
+    
+    if output_path:
+        write_results(results, output_path)
+    
+    return results
+
+def write_results(results, output_path):
+    """将标定结果写入CSV"""
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    logger.info(f"标定结果已保存到: {output_path}")
+
+def format_results(results, limit=None):
+    """格式化结果表"""
+    lines = [
+        f"{'rank':>4} {'sigma':>6} {'min_h':>6} {'min_d':>6} {'ref':>6} {'det':>6} {'match':>6} "
+        f"{'detect':>7} {'commis':>7} {'omiss':>7} {'F1':>6} {'offset':>7}"
+    ]
+    for r in results[:limit]:
+        offset = f"{r['mean_offset_m']:.2f}" if r['mean_offset_m'] is not None else '-'
+        lines.append(
+            f"{r['rank']:>4} {r['smooth_sigma']:>6.2f} {r['min_height']:>6.2f} {r['min_distance']:>6} "
+            f"{r['reference_count']:>6} {r['detected_count']:>6} {r['matched_count']:>6} "
+            f"{r['detection_rate']:>7.1%} {r['commission_rate']:>7.1%} {r['omission_rate']:>7.1%} "
+            f"{r['f1_score']:>6.3f} {offset:>7}"
+        )
+    return '\n'.join(lines)
+
+def _parse_list(text, cast=float):
+    """解析逗号分隔的参数列表"""
+    return [cast(value) for value in text.split(',') if value.strip()]
+
+def main():
+    """命令行入口函数"""
+    parser = argparse.ArgumentParser(description='在参数网格上对照实测树木位置标定树冠检测参数')
+    parser.add_argument('chm_path', help='CHM GeoTIFF文件路径')
+    parser.add_argument('reference_path', help='实测树木位置 (GeoJSON点或带x/y列的CSV，坐标系与CHM一致)')
+    parser.add_argument('--min-heights', default='2.0', help='最小树高阈值列表，逗号分隔 (默认: 2.0)')
+    parser.add_argument('--smooth-sigmas', default='1.0', help='高斯平滑参数列表，逗号分隔 (默认: 1.0)')
+    parser.add_argument('--min-distances', default='5', help='树顶检测最小距离列表 (像素)，逗号分隔 (默认: 5)')
+    parser.add_argument('--match-distance', type=float, default=DEFAULT_MATCH_DISTANCE,
+                        help=f'检测树顶与实测树木的最大匹配距离 (米) (默认: {DEFAULT_MATCH_DISTANCE})')
+    parser.add_argument('--no-clip', action='store_true', help='统计整幅CHM的检测树顶，而不只是样地范围内的')
+    parser.add_argument('--workers', type=int, default=1, help='并行工作进程数 (默认: 1)')
+    parser.add_argument('--output', '-o', help='结果CSV路径')
+    parser.add_argument('--top', type=int, default=20, help='输出排名前N的参数组合 (默认: 20)')
+    parser.add_argument('--profile-imports', action='store_true', help='输出各依赖模块的导入耗时 (标准错误)')
+    
+    args = parser.parse_args()
+    
+    try:
+        results = calibrate_detection(
+            args.chm_path,
+            args.reference_path,
+            min_heights=_parse_list(args.min_heights),
+            smooth_sigmas=_parse_list(args.smooth_sigmas),
+            min_distances=_parse_list(args.min_distances, int),
+            max_distance=args.match_distance,
+            clip_to_reference=not args.no_clip,
+            workers=max(1, args.workers),
+            output_path=args.output
+        )
+        
+        print(format_results(results, args.top))
+        if results:
+            best = results[0]
+            print(f"BEST: {json.dumps({k: best[k] for k in ('min_height', 'smooth_sigma', 'min_distance')})}")
+        
+        return 0
+    except Exception as e:
+        logger.error(f"标定失败: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
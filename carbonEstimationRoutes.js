@@ -3,6 +3,7 @@ const router = express.Router();
 const { protect } = require('../utils/auth');
 const {
   calculateCarbonEstimation,
+  repriceCarbonEstimation,
   getCarbonJobStatus,
   getAllCarbonJobs
 } = require('../controllers/carbonEstimationController');
@@ -10,6 +11,9 @@ const {
 // 计算碳储量估算
 router.post('/calculate', protect, calculateCarbonEstimation);
 
+// 按新的生物量模型重新估算碳储量
+router.post('/reprice', protect, repriceCarbonEstimation);
+
 // 获取碳储量估算作业状态
 router.get('/job/:jobId', protect, getCarbonJobStatus);
 
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+特征点缓存
+将影像的关键点和描述子以npz格式缓存在磁盘上，键由影像文件内容哈希、
+8位转换参数和检测器参数组成；缓存总大小超过上限时按最近使用时间淘汰
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+# 默认缓存目录和容量，可通过环境变量覆盖
+DEFAULT_CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'forest_feature_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('FEATURE_CACHE_MAX_MB', 2048)) * 1024 * 1024
+
+# 文件哈希的读取块大小
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 文件哈希记录，每个源文件一个记录文件 (digest-<路径哈希>.json)，按 (路径, 大小, 修改时间) 复用，
+# 避免重复计算大文件的哈希；记录各自原子写入，并发进程之间不需要加锁
+DIGEST_PREFIX = 'digest-'
+
+def make_key(*parts):
+    """由任意可JSON序列化的参数生成缓存键"""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def keypoints_to_array(keypoints):
+    """将cv2.KeyPoint列表转换为 (N, 7) 数组: x, y, size, angle, response, octave, class_id"""
+    return np.array(
+        [(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id) for kp in keypoints],
+        dtype=np.float64
+    ).reshape(-1, 7)
+
+def array_to_keypoints(array):
+    """将 (N, 7) 数组还原为cv2.KeyPoint列表"""
+    import cv2
+    
+    return [
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id))
+        for x, y, size, angle, response, octave, class_id in array
+    ]
+
+def _atomic_write(path, write):
+    """写入临时文件后重命名，避免并发读取到不完整的文件"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _digest_record_path(path, index_dir):
+    """源文件对应的哈希记录文件路径"""
+    name = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(index_dir, f"{DIGEST_PREFIX}{name}.json")
+
+def file_digest(path, index_dir):
+    """
+    计算文件内容的SHA-256哈希；文件大小和修改时间未变时复用已记录的哈希
+    
+    Args:
+        path: 文件路径
+        index_dir: 哈希记录文件所在目录
+    
+    Returns:
+        digest: 十六进制哈希字符串
+    """
+    stat = os.stat(path)
+    stamp = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    record_path = _digest_record_path(path, index_dir)
+    
+    try:
+        with open(record_path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        if record['stamp'] == stamp:
+            return record['digest']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    
+    # 只替换该文件自己的记录，并发写入不会覆盖其他文件的记录
+    record = {'stamp': stamp, 'digest': digest}
+    _atomic_write(record_path, lambda f: f.write(json.dumps(record).encode('utf-8')))
+    return digest
+
+class FeatureCache:
+    """
+    关键点和描述子的磁盘缓存
+    """
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+    
+    def file_digest(self, path):
+        """计算文件内容的SHA-256哈希 (见 file_digest)"""
+        return file_digest(path, self.cache_dir)
+    
+    def get(self, key):
+        """
+        读取缓存的关键点和描述子
+        
+        Returns:
+            (keypoints, descriptors)，未命中时返回None
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                keypoints = array_to_keypoints(data['keypoints'])
+                descriptors = data['descriptors']
+        except (OSError, KeyError, ValueError):
+            return None
+        
+        # 更新修改时间，作为LRU淘汰的最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        
+        return keypoints, (descriptors if descriptors.size else None)
+    
+    def put(self, key, keypoints, descriptors):
+        """写入关键点和描述子，并按容量上限淘汰旧条目"""
+        if descriptors is None:
+            descriptors = np.empty((0, 0), dtype=np.float32)
+        arrays = {'keypoints': keypoints_to_array(keypoints), 'descriptors': descriptors}
+        _atomic_write(self._path(key), lambda f: np.savez(f, **arrays))
+        self.evict()
+    
+    def get_or_compute(self, key, compute):
+        """
+        命中时返回缓存结果，否则调用 compute() 计算并写入缓存
+        
+        Args:
+            key: 缓存键
+            compute: 返回 (keypoints, descriptors) 的函数
+        
+        Returns:
+            (keypoints, descriptors)
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        
+        keypoints, descriptors = compute()
+        self.put(key, keypoints, descriptors)
+        return keypoints, descriptors
+    
+    def evict(self):
+        """缓存总大小超过上限时，按最近使用时间从旧到新删除条目"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
\ No newline at end of file
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模块导入耗时分析工具
+各分析脚本在命令行中传入 --profile-imports 时启用，记录每个依赖模块的首次导入耗时，
+并在进程退出时输出到标准错误，用于检查短作业的启动开销
+"""
+
+import sys
+import time
+import atexit
+import builtins
+import threading
+
+PROFILE_FLAG = '--profile-imports'
+
+# 导入耗时记录: [(模块名, 耗时秒数)]
+_import_times = []
+_original_import = None
+_state = threading.local()
+_start_time = None
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """替换内置 __import__，只统计最外层且确实加载了新模块的导入"""
+    depth = getattr(_state, 'depth', 0)
+    if depth > 0 or level > 0:
+        return _original_import(name, globals, locals, fromlist, level)
+    
+    loaded = len(sys.modules)
+    start = time.perf_counter()
+    _state.depth = depth + 1
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _state.depth = depth
+        if len(sys.modules) > loaded:
+            label = f"{name} ({', '.join(fromlist)})" if fromlist else name
+            _import_times.append((label, time.perf_counter() - start))
+
+def report(stream=None):
+    """输出导入耗时统计"""
+    stream = stream or sys.stderr
+    total = sum(elapsed for _, elapsed in _import_times)
+    
+    print("Import profile (cumulative, first import only):", file=stream)
+    for label, elapsed in sorted(_import_times, key=lambda item: item[1], reverse=True):
+        print(f"  {elapsed * 1000:8.1f} ms  {label}", file=stream)
+    print(f"  {total * 1000:8.1f} ms  total import time", file=stream)
+    print(f"  {(time.perf_counter() - _start_time) * 1000:8.1f} ms  total run time since profiling started", file=stream)
+
+def enable():
+    """开始记录导入耗时，进程退出时输出统计"""
+    global _original_import, _start_time
+    if _original_import is not None:
+        return
+    
+    _original_import = builtins.__import__
+    _start_time = time.perf_counter()
+    builtins.__import__ = _timed_import
+    atexit.register(report)
+
+def enable_if_requested(argv=None):
+    """
+    如果命令行参数中包含 --profile-imports，则开始记录导入耗时
+    需要在导入重量级依赖之前调用；该参数会从参数列表中移除，不影响脚本原有的参数解析
+    
+    Args:
+        argv: 命令行参数列表，默认使用 sys.argv
+    
+    Returns:
+        enabled: 是否启用了导入耗时分析
+    """
+    argv = sys.argv if argv is None else argv
+    if PROFILE_FLAG not in argv:
+        return False
+    
+    while PROFILE_FLAG in argv:
+        argv.remove(PROFILE_FLAG)
+    enable()
+    return True
\ No newline at end of file
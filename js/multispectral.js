@@ -301,7 +301,8 @@ const MultispectralProcessor = {
     document.getElementById('orthoDownloadLink').href = outputs.ortho;
     document.getElementById('registeredDownloadLink').href = outputs.registered;
     if (outputs.final) {
-      document.getElementById('finalDownloadLink').href = outputs.final;
+      // final 为VRT，浏览器无法直接使用，下载时由服务端导出GeoTIFF
+      document.getElementById('finalDownloadLink').href = outputs.final_image || outputs.final;
       document.getElementById('finalDownloadLink').classList.remove('hidden');
     } else {
       document.getElementById('finalDownloadLink').classList.add('hidden');
@@ -390,7 +391,7 @@ const MultispectralProcessor = {
       // 如果有最终调整影像
       if (outputs.final) {
         this.layers.final = L.imageOverlay(
-          outputs.final,
+          outputs.final_image || outputs.final,
           bounds,
           { opacity: 0.7 }
         );
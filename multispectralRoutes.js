@@ -5,6 +5,7 @@ const {
   uploadMultispectralImages,
   processMultispectralImages,
   adjustMultispectralImages,
+  downloadFinalImage,
   getJobStatus,
   monitorProgress
 } = require('../controllers/multispectralController');
@@ -57,6 +58,9 @@ router.post('/adjust', protect, adjustMultispectralImages);
 // 获取作业状态
 router.get('/job/:jobId', protect, getJobStatus);
 
+// 下载手动调整后的影像 (GeoTIFF)，与 /outputs 静态文件一样供链接和图层直接引用
+router.get('/job/:jobId/final.tif', downloadFinalImage);
+
 // 监听处理进度
 router.get('/progress/:jobId', protect, monitorProgress);
 
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+栅格中间格式
+流水线各阶段之间交换已解码的栅格：像素保存为 .npy 数组 (可用 np.load(mmap_mode=...) 零拷贝打开)，
+仿射变换、坐标系和无效值保存在 .npy.json 头文件中。
+中间文件与源文件放在一起 (<源文件>.npy)，头文件记录源文件的大小和修改时间，源文件变化后自动失效；
+相邻阶段通过操作系统页缓存共享解码后的像素，不再重复解码GeoTIFF
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import numpy as np
+
+FORMAT_NAME = 'forest-raster-interchange'
+FORMAT_VERSION = 1
+
+ARRAY_SUFFIX = '.npy'
+HEADER_SUFFIX = '.json'
+
+# 导出时每次读取的行数
+EXPORT_BLOCK_ROWS = 1024
+
+def array_path(path):
+    """源文件对应的中间数组路径 (<源文件>.npy)；传入的已是 .npy 文件时原样返回"""
+    return path if path.endswith(ARRAY_SUFFIX) else path + ARRAY_SUFFIX
+
+def header_path(path):
+    """中间数组对应的头文件路径"""
+    return array_path(path) + HEADER_SUFFIX
+
+def transform_from_gdal(geo_transform):
+    """GDAL地理变换 (c, a, b, f, d, e) 转换为仿射变换系数 (a, b, c, d, e, f)"""
+    c, a, b, f, d, e = geo_transform
+    return [a, b, c, d, e, f]
+
+def transform_to_gdal(transform):
+    """仿射变换系数 (a, b, c, d, e, f) 转换为GDAL地理变换"""
+    a, b, c, d, e, f = transform[:6]
+    return (c, a, b, f, d, e)
+
+def _source_stamp(path):
+    """源文件的大小和修改时间，用于判断中间文件是否过期"""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def read_header(path):
+    """读取中间数组的头文件"""
+    with open(header_path(path), 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT_NAME:
+        raise ValueError(f"不是栅格中间格式的头文件: {header_path(path)}")
+    return header
+
+def find(path):
+    """
+    查找可用的中间数组
+    
+    Args:
+        path: 源文件路径，或中间数组 (.npy) 路径
+    
+    Returns:
+        array_path: 中间数组路径；不存在、头文件无效或源文件已变化时返回None
+    """
+    npy_path = array_path(path)
+    if not (os.path.exists(npy_path) and os.path.exists(header_path(npy_path))):
+        return None
+    
+    try:
+        header = read_header(npy_path)
+    except (OSError, ValueError):
+        return None
+    
+    if header.get('version') != FORMAT_VERSION:
+        return None
+    
+    # 中间文件旁边仍有源文件时，源文件变化后中间文件失效
+    if npy_path != path and os.path.exists(path) and header.get('source') != _source_stamp(path):
+        return None
+    
+    return npy_path
+
+def _write_header(path, header):
+    """写入头文件 (先写临时文件再重命名)"""
+    target = header_path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _make_header(shape, dtype, transform, crs, nodata, source):
+    if crs is not None and not isinstance(crs, str):
+        crs = crs.to_wkt()
+    return {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'shape': list(shape),
+        'dtype': np.dtype(dtype).str,
+        'transform': [float(v) for v in tuple(transform)[:6]],
+        'crs': crs or None,
+        'nodata': None if nodata is None else float(nodata),
+        'source': _source_stamp(source) if source and os.path.exists(source) else None,
+    }
+
+def write(path, data, transform, crs=None, nodata=None, source=None):
+    """
+    写出中间数组和头文件
+    
+    Args:
+        path: 源文件路径 (写到 <源文件>.npy) 或 .npy 路径
+        data: 栅格数组，(height, width) 或 (bands, height, width)
+        transform: 仿射变换系数 (a, b, c, d, e, f)，可直接传入rasterio的Affine
+        crs: 坐标系 (WKT字符串或带 to_wkt() 方法的对象)
+        nodata: 无效值
+        source: 源文件路径，记录其大小和修改时间用于失效判断，默认为 path (不是 .npy 时)
+    
+    Returns:
+        array_path: 中间数组路径
+    """
+    npy_path = array_path(path)
+    if source is None and npy_path != path:
+        source = path
+    
+    data = np.asarray(data)
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    
+    tmp_path = npy_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, npy_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    _write_header(npy_path, _make_header(data.shape, data.dtype, transform, crs, nodata, source))
+    return npy_path
+
+def export(path, block_rows=EXPORT_BLOCK_ROWS, output_path=None):
+    """
+    将GeoTIFF解码为中间格式，按行块写入内存映射数组，不需要把整幅影像读入内存
+    
+    Args:
+        path: GeoTIFF文件路径
+        block_rows: 每次读取的行数
+        output_path: 中间数组 (.npy) 路径，默认为 <源文件>.npy
+    
+    Returns:
+        array_path: 中间数组路径
+    """
+    import rasterio
+    from rasterio.windows import Window
+    
+    npy_path = array_path(output_path or path)
+    tmp_path = npy_path + '.tmp'
+    with rasterio.open(path) as src:
+        shape = (src.count, src.height, src.width)
+        try:
+            out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=src.dtypes[0], shape=shape)
+            for row_off in range(0, src.height, block_rows):
+                rows = min(block_rows, src.height - row_off)
+                out[:, row_off:row_off + rows] = src.read(window=Window(0, row_off, src.width, rows))
+            out.flush()
+            del out
+            os.replace(tmp_path, npy_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        header = _make_header(shape, src.dtypes[0], src.transform, src.crs, src.nodata, path)
+    
+    _write_header(npy_path, header)
+    return npy_path
+
+def load(path, mmap_mode='c'):
+    """
+    以内存映射方式打开中间数组
+    
+    Args:
+        path: 中间数组路径 (或源文件路径)
+        mmap_mode: np.load 的映射模式，默认写时复制 ('c')，修改数组不会写回文件
+    
+    Returns:
+        data: (bands, height, width) 内存映射数组
+        header: 头文件字典
+    """
+    npy_path = array_path(path)
+    header = read_header(npy_path)
+    data = np.load(npy_path, mmap_mode=mmap_mode)
+    if list(data.shape) != header['shape']:
+        raise ValueError(f"中间数组与头文件的形状不一致: {npy_path}")
+    return data, header
+
+class ArrayDataset:
+    """
+    中间数组的只读数据集，提供与rasterio数据集相同的常用属性和 read() 接口
+    读取结果是内存映射数组的写时复制视图，不复制像素
+    """
+    
+    def __init__(self, path):
+        from affine import Affine
+        
+        self.array, self.header = load(path)
+        self.name = array_path(path)
+        self.count, self.height, self.width = self.array.shape
+        self.shape = (self.height, self.width)
+        self.transform = Affine(*self.header['transform'])
+        self.nodata = self.header['nodata']
+        self.dtypes = (str(self.array.dtype),) * self.count
+        self.closed = False
+        
+        self.crs = None
+        if self.header['crs']:
+            from rasterio.crs import CRS
+            self.crs = CRS.from_wkt(self.header['crs'])
+    
+    @property
+    def meta(self):
+        return {
+            'driver': 'GTiff',
+            'dtype': self.dtypes[0],
+            'nodata': self.nodata,
+            'width': self.width,
+            'height': self.height,
+            'count': self.count,
+            'crs': self.crs,
+            'transform': self.transform,
+        }
+    
+    @property
+    def profile(self):
+        return self.meta
+    
+    def read(self, indexes=None, window=None, out_dtype=None):
+        """
+        读取波段数据
+        
+        Args:
+            indexes: 波段序号 (从1开始)，整数返回二维数组，列表或None返回三维数组
+            window: rasterio Window 或 ((row_start, row_stop), (col_start, col_stop))
+            out_dtype: 输出数据类型
+        
+        Returns:
+            data: 波段数组
+        """
+        if window is None:
+            rows, cols = slice(None), slice(None)
+        elif hasattr(window, 'toslices'):
+            rows, cols = window.toslices()
+        else:
+            (row_start, row_stop), (col_start, col_stop) = window
+            rows, cols = slice(row_start, row_stop), slice(col_start, col_stop)
+        
+        if indexes is None:
+            bands = slice(None)
+        elif isinstance(indexes, int):
+            bands = indexes - 1
+        else:
+            bands = [i - 1 for i in indexes]
+        
+        data = np.asarray(self.array[bands, rows, cols])
+        if out_dtype is not None:
+            data = data.astype(out_dtype, copy=False)
+        return data
+    
+    def close(self):
+        self.array = None
+        self.closed = True
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def open_raster(path):
+    """
+    打开栅格：存在可用的中间数组时返回 ArrayDataset，否则使用rasterio打开源文件
+    
+    Args:
+        path: 栅格文件路径
+    
+    Returns:
+        src: ArrayDataset 或 rasterio 数据集
+    """
+    npy_path = find(path)
+    if npy_path is not None:
+        return ArrayDataset(npy_path)
+    
+    import rasterio
+    return rasterio.open(path)
+
+def main():
+    """命令行入口：把GeoTIFF导出为中间格式，供后续阶段零拷贝读取"""
+    parser = argparse.ArgumentParser(description='将GeoTIFF导出为内存映射中间格式 (<文件>.npy + <文件>.npy.json)')
+    parser.add_argument('inputs', nargs='+', help='GeoTIFF文件')
+    parser.add_argument('--block-rows', type=int, default=EXPORT_BLOCK_ROWS,
+                        help=f'每次读取的行数 (默认: {EXPORT_BLOCK_ROWS})')
+    
+    args = parser.parse_args()
+    
+    try:
+        for path in args.inputs:
+            print(f"导出中间数组: {export(path, args.block_rows)}")
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+栅格输出配置
+各脚本写出GeoTIFF时共用的分块、压缩、编码、金字塔和COG布局设置，
+同时提供rasterio profile和GDAL创建选项两种形式
+"""
+
+import os
+
+# 默认输出设置
+DEFAULT_BLOCK_SIZE = 512
+DEFAULT_COMPRESS = 'deflate'
+DEFAULT_ENCODING = 'float32'
+
+# 支持的压缩方式和光谱指数编码
+COMPRESS_METHODS = ('deflate', 'zstd', 'lzw', 'none')
+INDEX_ENCODINGS = ('float32', 'float16', 'int16')
+
+# int16编码时光谱指数的缩放系数：存储值 = round(指数 * 10000)
+INDEX_INT16_SCALE = 10000
+
+# 金字塔最小边长 (像素)，小于该尺寸的层级不再生成
+MIN_OVERVIEW_SIZE = 256
+
+def output_options(
+    compress=DEFAULT_COMPRESS,
+    encoding=DEFAULT_ENCODING,
+    overviews=True,
+    cog=True,
+    block_size=DEFAULT_BLOCK_SIZE
+):
+    """
+    创建输出设置
+    
+    Args:
+        compress: 压缩方式 (deflate, zstd, lzw, none)
+        encoding: 光谱指数的存储编码 (float32, float16, int16)，只影响指数输出
+        overviews: 是否生成内部金字塔
+        cog: 是否整理为云优化GeoTIFF (COG) 布局
+        block_size: 分块大小 (像素，16的倍数)
+    
+    Returns:
+        options: 输出设置字典
+    """
+    compress = (compress or 'none').lower()
+    if compress not in COMPRESS_METHODS:
+        raise ValueError(f"不支持的压缩方式: {compress}，可选: {', '.join(COMPRESS_METHODS)}")
+    
+    encoding = (encoding or DEFAULT_ENCODING).lower()
+    if encoding not in INDEX_ENCODINGS:
+        raise ValueError(f"不支持的编码: {encoding}，可选: {', '.join(INDEX_ENCODINGS)}")
+    
+    if block_size % 16 != 0:
+        raise ValueError("分块大小必须是16的倍数")
+    
+    return {
+        'compress': compress,
+        'encoding': encoding,
+        'overviews': overviews,
+        'cog': cog,
+        'block_size': block_size,
+    }
+
+def creation_options(options=None, dtype='float32', nbits=None):
+    """
+    生成GTiff创建选项
+    
+    Args:
+        options: output_options 返回的输出设置，默认使用默认设置
+        dtype: 存储数据类型
+        nbits: 浮点数据的存储位数 (16表示半精度浮点)
+    
+    Returns:
+        creation: GDAL创建选项字典 (键为大写选项名)
+    """
+    options = options or output_options()
+    
+    creation = {
+        'TILED': 'YES',
+        'BLOCKXSIZE': str(options['block_size']),
+        'BLOCKYSIZE': str(options['block_size']),
+        'BIGTIFF': 'IF_SAFER',
+    }
+    
+    if options['compress'] != 'none':
+        creation['COMPRESS'] = options['compress'].upper()
+        # 浮点数据使用浮点预测器，整数数据使用水平差分预测器
+        creation['PREDICTOR'] = '3' if str(dtype).startswith('float') else '2'
+        if options['compress'] == 'deflate':
+            creation['ZLEVEL'] = '6'
+        elif options['compress'] == 'zstd':
+            creation['ZSTD_LEVEL'] = '9'
+    
+    if nbits:
+        creation['NBITS'] = str(nbits)
+    
+    return creation
+
+def gdal_creation_options(options=None, dtype='float32', nbits=None):
+    """生成GDAL driver.Create 使用的 KEY=VALUE 形式创建选项"""
+    return [f"{key}={value}" for key, value in creation_options(options, dtype, nbits).items()]
+
+def rasterio_profile(profile, options=None, dtype='float32', nbits=None):
+    """
+    在输入profile的基础上生成输出profile
+    
+    Args:
+        profile: 输入影像的profile
+        options: 输出设置
+        dtype: 存储数据类型
+        nbits: 浮点数据的存储位数
+    
+    Returns:
+        profile: 输出profile
+    """
+    profile = dict(profile)
+    
+    # 去掉输入文件自身的存储设置
+    for key in ('blockxsize', 'blockysize', 'tiled', 'compress', 'predictor', 'interleave', 'nbits', 'photometric'):
+        profile.pop(key, None)
+    
+    profile['driver'] = 'GTiff'
+    profile['dtype'] = dtype
+    profile.update({key.lower(): value for key, value in creation_options(options, dtype, nbits).items()})
+    return profile
+
+def index_profile(profile, options=None):
+    """
+    光谱指数输出的profile，按编码选择存储类型
+    
+    Args:
+        profile: 输入影像的profile
+        options: 输出设置
+    
+    Returns:
+        profile: 输出profile (float32、NBITS=16的半精度浮点或int16)
+    """
+    options = options or output_options()
+    
+    if options['encoding'] == 'int16':
+        return rasterio_profile(profile, options, dtype='int16')
+    if options['encoding'] == 'float16':
+        return rasterio_profile(profile, options, dtype='float32', nbits=16)
+    return rasterio_profile(profile, options, dtype='float32')
+
+def encode_index(data, options=None):
+    """
+    按编码转换光谱指数数组；int16编码按 INDEX_INT16_SCALE 缩放，无效值0保持为0
+    
+    Args:
+        data: float32指数数组
+        options: 输出设置
+    
+    Returns:
+        data: 可直接写出的数组
+    """
+    options = options or output_options()
+    
+    if options['encoding'] == 'int16':
+        import numpy as np
+        scaled = np.multiply(data, INDEX_INT16_SCALE, dtype=np.float32)
+        return np.rint(scaled, out=scaled).astype(np.int16)
+    return data
+
+def index_scale(options=None):
+    """光谱指数存储值到实际值的缩放系数，写入文件元数据供读取端还原"""
+    options = options or output_options()
+    return 1.0 / INDEX_INT16_SCALE if options['encoding'] == 'int16' else 1.0
+
+def overview_factors(width, height, min_size=MIN_OVERVIEW_SIZE):
+    """计算金字塔层级，直到较长边小于 min_size"""
+    factors = []
+    factor = 2
+    while max(width, height) / factor >= min_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+def _cog_path(path):
+    """COG整理时的临时文件路径"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.cog.tmp{ext}"
+
+def finalize_output(path, options=None, resampling='average'):
+    """
+    使用rasterio为已写出的GeoTIFF生成金字塔，并整理为COG布局
+    COG布局通过带金字塔的复制完成 (COPY_SRC_OVERVIEWS)，金字塔位于影像数据之前
+    
+    Args:
+        path: GeoTIFF文件路径
+        options: 输出设置
+        resampling: 金字塔重采样方法
+    
+    Returns:
+        path: 文件路径
+    """
+    import rasterio
+    import rasterio.shutil
+    from rasterio.enums import Resampling
+    
+    options = options or output_options()
+    
+    if options['overviews']:
+        with rasterio.open(path, 'r+') as dst:
+            factors = overview_factors(dst.width, dst.height)
+            if factors:
+                dst.build_overviews(factors, Resampling[resampling])
+                dst.update_tags(ns='rio_overview', resampling=resampling)
+    
+    if options['cog']:
+        tmp_path = _cog_path(path)
+        with rasterio.open(path) as src:
+            nbits = src.tags(1, ns='IMAGE_STRUCTURE').get('NBITS')
+            creation = creation_options(options, src.dtypes[0], nbits)
+        creation['COPY_SRC_OVERVIEWS'] = 'YES'
+        try:
+            rasterio.shutil.copy(path, tmp_path, driver='GTiff', **creation)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    return path
+
+def finalize_output_gdal(path, options=None, resampling='average'):
+    """
+    使用GDAL为已写出的GeoTIFF生成金字塔，并整理为COG布局 (供基于GDAL的脚本使用)
+    
+    Args:
+        path: GeoTIFF文件路径
+        options: 输出设置
+        resampling: 金字塔重采样方法
+    
+    Returns:
+        path: 文件路径
+    """
+    try:
+        from osgeo import gdal
+    except ImportError:
+        import gdal
+    
+    options = options or output_options()
+    
+    if options['overviews']:
+        ds = gdal.Open(path, gdal.GA_Update)
+        factors = overview_factors(ds.RasterXSize, ds.RasterYSize)
+        if factors:
+            ds.BuildOverviews(resampling.upper(), factors)
+        ds = None
+    
+    if options['cog']:
+        tmp_path = _cog_path(path)
+        ds = gdal.Open(path)
+        band = ds.GetRasterBand(1)
+        nbits = band.GetMetadataItem('NBITS', 'IMAGE_STRUCTURE')
+        dtype = gdal.GetDataTypeName(band.DataType).lower()
+        creation = gdal_creation_options(options, dtype, nbits) + ['COPY_SRC_OVERVIEWS=YES']
+        try:
+            out_ds = gdal.Translate(tmp_path, ds, format='GTiff', creationOptions=creation)
+            if out_ds is None:
+                raise Exception(f"无法创建COG文件: {path}")
+            out_ds = None
+            ds = None
+            os.replace(tmp_path, path)
+        finally:
+            ds = None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    return path
\ No newline at end of file
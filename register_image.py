@@ -3,15 +3,36 @@
 
 """
 多光谱影像与CHM配准脚本
-使用SIFT特征检测和RANSAC算法进行图像配准
+使用SIFT/ORB/AKAZE特征检测和MAGSAC/RANSAC算法进行图像配准
 """
 
 import sys
 import os
-import cv2
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 命令行传入 --profile-imports 时，在导入依赖之前开始记录导入耗时
+if __name__ == "__main__":
+    import import_profiler
+    import_profiler.enable_if_requested()
+
+# cv2 和 GDAL 只在用到的函数中按需导入
 import numpy as np
-import gdal
-from osgeo import osr
+
+import raster_profiles
+import feature_cache
+import raster_interchange
+
+def _import_gdal():
+    """按需导入GDAL，兼容旧版本的顶层 gdal 模块"""
+    try:
+        from osgeo import gdal
+    except ImportError:
+        import gdal
+    return gdal
 
 def print_progress(message):
     """输出进度信息到标准输出"""
@@ -19,7 +40,19 @@ def print_progress(message):
     sys.stdout.flush()
 
 def read_geotiff(filepath):
-    """读取GeoTIFF影像，返回影像数据和地理信息"""
+    """读取GeoTIFF影像，返回影像数据和地理信息；存在可用的内存映射中间数组时直接映射"""
+    array_path = raster_interchange.find(filepath)
+    if array_path is not None:
+        data, header = raster_interchange.load(array_path)
+        if data.shape[0] == 1:
+            data = data[0]
+        else:
+            data = data.astype(np.float32, copy=False)
+        geo_transform = raster_interchange.transform_to_gdal(header['transform'])
+        return data, geo_transform, header['crs'] or '', header['shape'][0]
+    
+    gdal = _import_gdal()
+    
     ds = gdal.Open(filepath)
     if ds is None:
         raise Exception(f"无法打开影像文件: {filepath}")
@@ -41,25 +74,43 @@ def read_geotiff(filepath):
     
     return data, geo_transform, projection, ds.RasterCount
 
-def convert_to_8bit(img, percentile=(2, 98)):
-    """将影像数据转换为8位灰度图，用于特征检测"""
+def to_gray(img):
+    """多波段影像取各波段平均值，单波段直接使用，返回float32灰度图"""
     if len(img.shape) > 2 and img.shape[0] > 1:
-        # 多波段，取第一个波段或计算平均值
-        gray = np.mean(img, axis=0).astype(np.float32)
-    else:
-        # 单波段，直接使用
-        if len(img.shape) > 2:
-            gray = img[0].astype(np.float32)
-        else:
-            gray = img.astype(np.float32)
-    
-    # 去除异常值，做直方图拉伸
-    min_val = np.percentile(gray, percentile[0])
-    max_val = np.percentile(gray, percentile[1])
+        # 多波段，计算平均值
+        return np.mean(img, axis=0, dtype=np.float32)
+    # 单波段，直接使用
+    if len(img.shape) > 2:
+        return img[0].astype(np.float32, copy=False)
+    return img.astype(np.float32, copy=False)
+
+def gray_range(img, percentile=(2, 98)):
+    """计算直方图拉伸使用的灰度范围 (按百分位数去除异常值)"""
+    gray = to_gray(img)
+    min_val = float(np.percentile(gray, percentile[0]))
+    max_val = float(np.percentile(gray, percentile[1]))
     
     # 避免除以0
     if max_val == min_val:
         max_val = min_val + 1.0
+    return min_val, max_val
+
+def convert_to_8bit(img, percentile=(2, 98), value_range=None):
+    """
+    将影像数据转换为8位灰度图，用于特征检测
+    
+    Args:
+        img: 影像数组
+        percentile: 直方图拉伸的百分位数
+        value_range: 指定的拉伸范围 (min, max)，用于让同一影像的多个分块使用一致的拉伸
+    
+    Returns:
+        gray_8bit: 8位灰度图
+    """
+    gray = to_gray(img)
+    
+    # 去除异常值，做直方图拉伸
+    min_val, max_val = value_range or gray_range(gray, percentile)
     
     # 进行归一化
     gray = (gray - min_val) / (max_val - min_val)
@@ -69,45 +120,247 @@ def convert_to_8bit(img, percentile=(2, 98)):
     gray_8bit = (gray * 255).astype(np.uint8)
     return gray_8bit
 
-def detect_and_match_features(src_img, dst_img):
-    """使用SIFT检测特征点并进行匹配"""
-    print_progress("Extracting features from images")
+# 支持的特征检测器；ORB和AKAZE输出二进制描述子，使用LSH索引匹配
+# (AKAZE在OpenCV 5中需要contrib模块，当前环境可用的检测器见 available_detectors)
+FEATURE_DETECTORS = ('sift', 'orb', 'akaze')
+
+# 支持的单应性矩阵估计方法；默认RANSAC，MAGSAC只在显式指定时使用
+HOMOGRAPHY_METHODS = ('ransac', 'magsac')
+
+# ORB未指定特征点数时的默认上限
+ORB_DEFAULT_FEATURES = 5000
+
+# 按网格限制特征点时，ORB先检测的候选特征点倍数
+ORB_GRID_OVERSAMPLE = 4
+
+# FLANN索引类型
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+def feature_options(
+    detector='sift',
+    max_features=None,
+    grid_size=None,
+    max_per_cell=None,
+    method='ransac',
+    confidence=0.995,
+    max_iters=2000
+):
+    """
+    创建特征检测、匹配和单应性估计设置
+    设置字典会写入特征点缓存键，检测参数变化时缓存自动失效
+    
+    Args:
+        detector: 特征检测器 (sift, orb, akaze)
+        max_features: 每幅影像 (或每个分块) 保留的最多特征点数，按响应值排序，None表示不限制
+        grid_size: 空间网格边长 (像素)，与 max_per_cell 一起使用
+        max_per_cell: 每个网格单元保留的最多特征点数，避免特征点集中在纹理丰富的区域
+        method: 单应性矩阵估计方法 (ransac; magsac: USAC_MAGSAC，当前OpenCV不支持时回退到RANSAC)
+        confidence: 估计置信度，达到该置信度所需的迭代次数后提前结束
+        max_iters: 最大迭代次数
+    
+    Returns:
+        options: 设置字典
+    """
+    detector = (detector or 'sift').lower()
+    if detector not in FEATURE_DETECTORS:
+        raise ValueError(f"不支持的特征检测器: {detector}，可选: {', '.join(FEATURE_DETECTORS)}")
+    
+    method = (method or 'ransac').lower()
+    if method not in HOMOGRAPHY_METHODS:
+        raise ValueError(f"不支持的估计方法: {method}，可选: {', '.join(HOMOGRAPHY_METHODS)}")
+    
+    if (grid_size is None) != (max_per_cell is None):
+        raise ValueError("grid_size 和 max_per_cell 需要同时指定")
+    
+    return {
+        'detector': detector,
+        'max_features': max_features,
+        'grid_size': grid_size,
+        'max_per_cell': max_per_cell,
+        'method': method,
+        'confidence': confidence,
+        'max_iters': max_iters,
+    }
+
+def _akaze_factory(cv2):
+    """返回AKAZE检测器的构造函数；OpenCV 5 将AKAZE移到了contrib模块，未安装时返回None"""
+    if hasattr(cv2, 'AKAZE_create'):
+        return cv2.AKAZE_create
+    if hasattr(cv2, 'xfeatures2d') and hasattr(cv2.xfeatures2d, 'AKAZE_create'):
+        return cv2.xfeatures2d.AKAZE_create
+    return None
+
+def available_detectors():
+    """当前OpenCV可用的特征检测器 (FEATURE_DETECTORS 的子集)"""
+    import cv2
+    
+    return tuple(d for d in FEATURE_DETECTORS if d != 'akaze' or _akaze_factory(cv2) is not None)
+
+def create_detector(options=None):
+    """按设置创建OpenCV特征检测器"""
+    import cv2
+    
+    options = options or feature_options()
+    detector = options['detector']
+    
+    if detector == 'orb':
+        nfeatures = options['max_features'] or ORB_DEFAULT_FEATURES
+        if options['grid_size']:
+            # 先多检测一些候选点，再按网格筛选
+            nfeatures *= ORB_GRID_OVERSAMPLE
+        return cv2.ORB_create(nfeatures=nfeatures)
     
-    # 转换为8位灰度图
-    src_gray = convert_to_8bit(src_img)
-    dst_gray = convert_to_8bit(dst_img)
+    if detector == 'akaze':
+        factory = _akaze_factory(cv2)
+        if factory is None:
+            raise Exception("当前OpenCV版本不包含AKAZE检测器 (OpenCV 5 需要安装 opencv-contrib-python)")
+        return factory()
     
     # 创建SIFT检测器
     try:
-        sift = cv2.SIFT_create()
+        return cv2.SIFT_create()
     except AttributeError:
         # OpenCV 3.x 或更早版本
-        sift = cv2.xfeatures2d.SIFT_create()
+        return cv2.xfeatures2d.SIFT_create()
+
+def limit_keypoints(keypoints, grid_size=None, max_per_cell=None, max_features=None):
+    """
+    按响应值筛选关键点：每个网格单元最多保留 max_per_cell 个，总数最多保留 max_features 个
     
-    # 检测关键点和计算描述子
-    kp1, des1 = sift.detectAndCompute(src_gray, None)
-    kp2, des2 = sift.detectAndCompute(dst_gray, None)
+    Args:
+        keypoints: cv2.KeyPoint 列表
+        grid_size: 网格边长 (像素)
+        max_per_cell: 每个网格单元保留的最多关键点数
+        max_features: 保留的最多关键点总数
     
-    print_progress(f"Found {len(kp1)} features in source image")
-    print_progress(f"Found {len(kp2)} features in target image")
+    Returns:
+        keypoints: 筛选后的关键点列表 (按响应值从高到低排列)
+    """
+    if not keypoints:
+        return list(keypoints)
     
-    if len(kp1) < 10 or len(kp2) < 10:
-        raise Exception("检测到的特征点太少，无法进行可靠配准")
+    response = np.array([kp.response for kp in keypoints], dtype=np.float32)
+    order = np.argsort(-response, kind='stable')
     
-    # 使用FLANN匹配器
-    print_progress("Matching features")
-    FLANN_INDEX_KDTREE = 1
-    index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
+    if grid_size and max_per_cell:
+        pts = np.array([kp.pt for kp in keypoints], dtype=np.float32)[order]
+        cols = int(pts[:, 0].max() // grid_size) + 1
+        cell = (pts[:, 1] // grid_size).astype(np.int64) * cols + (pts[:, 0] // grid_size).astype(np.int64)
+        
+        # 在每个网格单元内按响应值排名，保留排名靠前的关键点
+        by_cell = np.argsort(cell, kind='stable')
+        sorted_cell = cell[by_cell]
+        starts = np.flatnonzero(np.r_[True, sorted_cell[1:] != sorted_cell[:-1]])
+        counts = np.diff(np.r_[starts, len(sorted_cell)])
+        rank = np.arange(len(sorted_cell)) - np.repeat(starts, counts)
+        
+        keep = np.zeros(len(order), dtype=bool)
+        keep[by_cell[rank < max_per_cell]] = True
+        order = order[keep]
+    
+    if max_features:
+        order = order[:max_features]
+    
+    return [keypoints[i] for i in order]
+
+def detect_features(gray, options=None):
+    """
+    检测关键点并计算描述子
+    
+    Args:
+        gray: 8位灰度图
+        options: feature_options 返回的设置，默认使用SIFT
+    
+    Returns:
+        (keypoints, descriptors)
+    """
+    options = options or feature_options()
+    detector = create_detector(options)
+    
+    limit_grid = options['grid_size'] and options['max_per_cell']
+    limit_total = options['max_features'] and options['detector'] != 'orb'
+    if not (limit_grid or limit_total):
+        return detector.detectAndCompute(gray, None)
+    
+    # 先检测关键点并筛选，只为保留的关键点计算描述子
+    keypoints = detector.detect(gray, None)
+    keypoints = limit_keypoints(keypoints, options['grid_size'], options['max_per_cell'], options['max_features'])
+    if not keypoints:
+        return [], None
+    return detector.compute(gray, keypoints)
+
+def cached_features(cache, image_key, params, gray_fn, options=None):
+    """
+    检测特征点，提供缓存时先按影像内容哈希、8位转换参数和检测设置查找缓存
+    
+    Args:
+        cache: feature_cache.FeatureCache，为None时直接检测
+        image_key: 影像文件的内容哈希
+        params: 影响8位灰度图的参数 (层级、窗口、拉伸范围等)
+        gray_fn: 返回8位灰度图的函数，缓存命中时不会调用
+        options: 特征检测设置
+    
+    Returns:
+        (keypoints, descriptors)
+    """
+    options = options or feature_options()
+    if cache is None or image_key is None:
+        return detect_features(gray_fn(), options)
+    
+    # 估计方法不影响特征点，不写入缓存键
+    detector_params = {k: options[k] for k in ('detector', 'max_features', 'grid_size', 'max_per_cell')}
+    key = feature_cache.make_key('features', image_key, params, detector_params)
+    return cache.get_or_compute(key, lambda: detect_features(gray_fn(), options))
+
+def match_features(des1, des2, ratio=0.75):
+    """
+    使用FLANN匹配描述子，并应用Lowe比率测试保留好的匹配
+    浮点描述子 (SIFT) 使用KD树索引，二进制描述子 (ORB、AKAZE) 使用LSH索引
+    """
+    import cv2
+    
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return []
+    
+    if des1.dtype == np.uint8:
+        index_params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+    else:
+        index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
     search_params = dict(checks=50)
     flann = cv2.FlannBasedMatcher(index_params, search_params)
     
     matches = flann.knnMatch(des1, des2, k=2)
     
-    # 应用Lowe比率测试，保留好的匹配
     good_matches = []
-    for m, n in matches:
-        if m.distance < 0.75 * n.distance:
-            good_matches.append(m)
+    for pair in matches:
+        if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance:
+            good_matches.append(pair[0])
+    return good_matches
+
+def matched_points(kp1, kp2, good_matches):
+    """提取匹配点坐标，返回 (N, 2) 的源影像和目标影像坐标数组"""
+    src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 2)
+    dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 2)
+    return src_pts, dst_pts
+
+def detect_and_match_features(src_img, dst_img, cache=None, src_key=None, dst_key=None, options=None):
+    """检测特征点并进行匹配 (默认SIFT)；提供缓存和影像内容哈希时复用缓存的特征点"""
+    print_progress("Extracting features from images")
+    
+    # 转换为8位灰度图，检测关键点和计算描述子
+    kp1, des1 = cached_features(cache, src_key, ('full', (2, 98)), lambda: convert_to_8bit(src_img), options)
+    kp2, des2 = cached_features(cache, dst_key, ('full', (2, 98)), lambda: convert_to_8bit(dst_img), options)
+    
+    print_progress(f"Found {len(kp1)} features in source image")
+    print_progress(f"Found {len(kp2)} features in target image")
+    
+    if len(kp1) < 10 or len(kp2) < 10:
+        raise Exception("检测到的特征点太少，无法进行可靠配准")
+    
+    # 使用FLANN匹配器
+    print_progress("Matching features")
+    good_matches = match_features(des1, des2)
     
     print_progress(f"Found {len(good_matches)} good matches")
     
@@ -116,19 +369,52 @@ def detect_and_match_features(src_img, dst_img):
     
     return kp1, kp2, good_matches
 
-def compute_homography(kp1, kp2, good_matches):
+def estimate_homography(src_pts, dst_pts, threshold=5.0, options=None):
+    """
+    使用RANSAC (默认) 或USAC_MAGSAC方法计算单应性矩阵
+    迭代次数随内点比例自适应，达到设置的置信度后提前结束；MAGSAC不可用或失败时回退到RANSAC
+    
+    Returns:
+        H: 单应性矩阵
+        inlier_mask: 内点掩膜 (布尔数组)
+    """
+    import cv2
+    
+    options = options or feature_options()
+    src_pts = src_pts.reshape(-1, 1, 2)
+    dst_pts = dst_pts.reshape(-1, 1, 2)
+    
+    H, mask = None, None
+    if options['method'] == 'magsac' and hasattr(cv2, 'USAC_MAGSAC'):
+        try:
+            H, mask = cv2.findHomography(
+                src_pts, dst_pts, cv2.USAC_MAGSAC, threshold,
+                maxIters=options['max_iters'], confidence=options['confidence']
+            )
+        except cv2.error:
+            H = None
+    
+    if H is None:
+        H, mask = cv2.findHomography(
+            src_pts, dst_pts, cv2.RANSAC, threshold,
+            maxIters=options['max_iters'], confidence=options['confidence']
+        )
+    if H is None:
+        raise Exception("无法计算单应性矩阵")
+    return H, mask.ravel().astype(bool)
+
+def compute_homography(kp1, kp2, good_matches, options=None):
     """计算单应性矩阵"""
     print_progress("Computing homography matrix")
     
     # 提取匹配点坐标
-    src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+    src_pts, dst_pts = matched_points(kp1, kp2, good_matches)
     
-    # 使用RANSAC方法计算单应性矩阵
-    H, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+    # 使用MAGSAC/RANSAC方法计算单应性矩阵
+    H, mask = estimate_homography(src_pts, dst_pts, 5.0, options)
     
     # 计算内点数量
-    inliers = mask.ravel().sum()
+    inliers = mask.sum()
     print_progress(f"Homography computed with {inliers} inliers out of {len(good_matches)} matches")
     
     if inliers < 4:
@@ -136,8 +422,219 @@ def compute_homography(kp1, kp2, good_matches):
     
     return H
 
+def project_points(H, pts):
+    """用单应性矩阵变换 (N, 2) 坐标数组"""
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+    projected = np.hstack([pts, np.ones((len(pts), 1))]) @ H.T
+    return projected[:, :2] / projected[:, 2:3]
+
+def homography_stats(H, src_pts, dst_pts, inlier_mask):
+    """统计内点数量、内点比例和内点的重投影均方根误差 (像素)"""
+    n_inliers = int(inlier_mask.sum())
+    rmse = 0.0
+    if n_inliers:
+        errors = project_points(H, src_pts[inlier_mask]) - dst_pts[inlier_mask]
+        rmse = float(np.sqrt(np.mean(np.sum(errors ** 2, axis=1))))
+    return {
+        'matches': int(len(src_pts)),
+        'inliers': n_inliers,
+        'inlier_ratio': n_inliers / len(src_pts) if len(src_pts) else 0.0,
+        'rmse_px': rmse,
+    }
+
+def open_geotiff(filepath):
+    """打开GeoTIFF影像，返回GDAL数据集"""
+    gdal = _import_gdal()
+    
+    ds = gdal.Open(filepath)
+    if ds is None:
+        raise Exception(f"无法打开影像文件: {filepath}")
+    return ds
+
+def read_decimated(ds, max_size):
+    """
+    读取降采样后的整幅影像，GDAL会优先使用影像内部的金字塔
+    
+    Args:
+        ds: GDAL数据集
+        max_size: 降采样后影像的最大边长
+    
+    Returns:
+        data: 降采样影像 (单波段为二维数组，多波段为 (bands, height, width))
+        scale: 原始像素坐标与降采样坐标之比 (sx, sy)
+    """
+    gdal = _import_gdal()
+    
+    factor = max(1.0, max(ds.RasterXSize, ds.RasterYSize) / max_size)
+    width = max(1, int(round(ds.RasterXSize / factor)))
+    height = max(1, int(round(ds.RasterYSize / factor)))
+    
+    data = ds.ReadAsArray(
+        buf_xsize=width, buf_ysize=height, resample_alg=gdal.GRIORA_Average
+    ).astype(np.float32)
+    return data, (ds.RasterXSize / width, ds.RasterYSize / height)
+
+def read_window(ds, xoff, yoff, xsize, ysize):
+    """
+    读取原始分辨率的影像窗口，窗口超出影像范围时自动裁剪
+    
+    Returns:
+        data: 窗口影像，窗口为空时返回None
+        offset: 裁剪后窗口左上角的像素坐标 (xoff, yoff)
+    """
+    x0, y0 = max(0, int(xoff)), max(0, int(yoff))
+    x1 = min(ds.RasterXSize, int(xoff + xsize))
+    y1 = min(ds.RasterYSize, int(yoff + ysize))
+    if x1 - x0 < 16 or y1 - y0 < 16:
+        return None, (x0, y0)
+    
+    data = ds.ReadAsArray(x0, y0, x1 - x0, y1 - y0).astype(np.float32)
+    return data, (x0, y0)
+
+def _report_level(name, stats, elapsed):
+    """输出单个层级的配准统计"""
+    print_progress(
+        f"Level {name}: {stats['inliers']} inliers out of {stats['matches']} matches "
+        f"({stats['inlier_ratio']:.1%}), RMSE {stats['rmse_px']:.2f} px, {elapsed:.2f} s"
+    )
+
+def register_pyramid(src_ds, dst_ds, coarse_size=2048, patch_grid=4, patch_size=512, search_margin=None,
+                     min_patch_matches=8, cache=None, src_key=None, dst_key=None, options=None):
+    """
+    由粗到精的金字塔配准：先在降采样影像上估计单应性矩阵，
+    再在目标影像的网格分块及其预测对应位置读取原始分辨率窗口，汇总分块匹配点精化变换
+    配准耗时取决于分块数量，与影像面积无关
+    
+    Args:
+        src_ds: 源影像 (正射影像) GDAL数据集
+        dst_ds: 目标影像 (CHM) GDAL数据集
+        coarse_size: 粗配准降采样影像的最大边长
+        patch_grid: 精配准分块网格大小 (patch_grid x patch_grid 个分块)
+        patch_size: 精配准目标分块边长 (像素)
+        search_margin: 源影像窗口四周的搜索余量 (像素)，默认根据粗配准的降采样倍数确定
+        min_patch_matches: 分块参与精配准所需的最少匹配点数
+        cache: 特征点缓存 (feature_cache.FeatureCache)，为None时不使用缓存
+        src_key: 源影像文件的内容哈希，作为缓存键的一部分
+        dst_key: 目标影像文件的内容哈希
+        options: 特征检测和单应性估计设置 (feature_options)
+    
+    Returns:
+        H: 原始分辨率下源影像到目标影像的单应性矩阵
+        levels: 各层级的统计信息列表
+    """
+    levels = []
+    
+    # 粗配准：降采样影像
+    start = time.perf_counter()
+    print_progress("Extracting features from images (coarse level)")
+    src_small, src_scale = read_decimated(src_ds, coarse_size)
+    dst_small, dst_scale = read_decimated(dst_ds, coarse_size)
+    
+    # 整幅影像的拉伸范围，精配准分块沿用，保证灰度一致
+    src_range = gray_range(src_small)
+    dst_range = gray_range(dst_small)
+    
+    kp1, des1 = cached_features(cache, src_key, ('coarse', src_small.shape, src_range),
+                                lambda: convert_to_8bit(src_small, value_range=src_range), options)
+    kp2, des2 = cached_features(cache, dst_key, ('coarse', dst_small.shape, dst_range),
+                                lambda: convert_to_8bit(dst_small, value_range=dst_range), options)
+    print_progress(f"Found {len(kp1)} features in source image")
+    print_progress(f"Found {len(kp2)} features in target image")
+    
+    print_progress("Matching features (coarse level)")
+    good_matches = match_features(des1, des2)
+    if len(good_matches) < 10:
+        raise Exception("粗配准匹配的特征点太少，无法进行可靠配准")
+    
+    # 坐标换算到原始分辨率
+    src_pts, dst_pts = matched_points(kp1, kp2, good_matches)
+    src_pts = src_pts * np.float32(src_scale)
+    dst_pts = dst_pts * np.float32(dst_scale)
+    
+    print_progress("Computing homography matrix (coarse level)")
+    coarse_factor = max(dst_scale)
+    H, mask = estimate_homography(src_pts, dst_pts, 5.0 * coarse_factor, options)
+    stats = homography_stats(H, src_pts, dst_pts, mask)
+    stats.update(level='coarse', scale=coarse_factor, time_s=time.perf_counter() - start)
+    levels.append(stats)
+    _report_level(f"coarse (1/{coarse_factor:.1f})", stats, stats['time_s'])
+    
+    if stats['inliers'] < 4:
+        raise Exception("内点数量太少，变换矩阵可能不可靠")
+    
+    # 精配准：原始分辨率分块
+    start = time.perf_counter()
+    if search_margin is None:
+        search_margin = int(max(32, 8 * coarse_factor))
+    H_inv = np.linalg.inv(H)
+    
+    # 源影像相对目标影像的尺度，决定源窗口大小
+    src_per_dst = float(np.sqrt(abs(np.linalg.det(H_inv[:2, :2]))))
+    src_window = int(np.ceil(patch_size * src_per_dst)) + 2 * search_margin
+    
+    print_progress(f"Matching features ({patch_grid}x{patch_grid} full-resolution patches)")
+    all_src, all_dst = [], []
+    used_patches = 0
+    for i in range(patch_grid):
+        for j in range(patch_grid):
+            # 目标分块中心及其在源影像中的预测位置
+            cx = (j + 0.5) * dst_ds.RasterXSize / patch_grid
+            cy = (i + 0.5) * dst_ds.RasterYSize / patch_grid
+            sx, sy = project_points(H_inv, [(cx, cy)])[0]
+            
+            dst_patch, dst_offset = read_window(dst_ds, cx - patch_size / 2, cy - patch_size / 2,
+                                                patch_size, patch_size)
+            src_patch, src_offset = read_window(src_ds, sx - src_window / 2, sy - src_window / 2,
+                                                src_window, src_window)
+            if dst_patch is None or src_patch is None:
+                continue
+            
+            # 目标分块位于固定网格上，重复配准同一CHM时可直接命中缓存
+            kp1, des1 = cached_features(cache, src_key, ('patch', src_offset, src_patch.shape, src_range),
+                                        lambda: convert_to_8bit(src_patch, value_range=src_range), options)
+            kp2, des2 = cached_features(cache, dst_key, ('patch', dst_offset, dst_patch.shape, dst_range),
+                                        lambda: convert_to_8bit(dst_patch, value_range=dst_range), options)
+            patch_matches = match_features(des1, des2)
+            if len(patch_matches) < min_patch_matches:
+                continue
+            
+            patch_src, patch_dst = matched_points(kp1, kp2, patch_matches)
+            patch_src = patch_src + np.float32(src_offset)
+            patch_dst = patch_dst + np.float32(dst_offset)
+            
+            # 只保留与粗配准预测一致的匹配
+            error = np.linalg.norm(project_points(H, patch_src) - patch_dst, axis=1)
+            consistent = error < search_margin
+            if consistent.sum() < min_patch_matches:
+                continue
+            
+            all_src.append(patch_src[consistent])
+            all_dst.append(patch_dst[consistent])
+            used_patches += 1
+    
+    if used_patches == 0:
+        print_progress("No full-resolution patch produced enough matches, using coarse homography")
+        return H, levels
+    
+    print_progress("Computing homography matrix (full-resolution patches)")
+    all_src = np.concatenate(all_src)
+    all_dst = np.concatenate(all_dst)
+    H_fine, mask = estimate_homography(all_src, all_dst, 5.0, options)
+    stats = homography_stats(H_fine, all_src, all_dst, mask)
+    stats.update(level='fine', scale=1.0, patches=used_patches, time_s=time.perf_counter() - start)
+    levels.append(stats)
+    _report_level(f"fine ({used_patches}/{patch_grid * patch_grid} patches)", stats, stats['time_s'])
+    
+    if stats['inliers'] < 10:
+        print_progress("Too few inliers at full resolution, using coarse homography")
+        return H, levels
+    
+    return H_fine, levels
+
 def warp_image(src_img, dst_shape, H):
     """应用单应性矩阵变换源图像"""
+    import cv2
+    
     print_progress("Warping image")
     
     height, width = dst_shape
@@ -156,6 +653,183 @@ def warp_image(src_img, dst_shape, H):
     
     return warped
 
+def source_window(H_inv, x0, y0, width, height, src_width, src_height, margin=2):
+    """
+    计算输出块经逆单应性变换后在源影像中覆盖的窗口
+    
+    Args:
+        H_inv: 目标影像到源影像的逆单应性矩阵
+        x0, y0, width, height: 输出块的位置和大小
+        src_width, src_height: 源影像大小
+        margin: 插值所需的窗口余量 (像素)
+    
+    Returns:
+        window: 源影像窗口 (x0, y0, x1, y1)，输出块不覆盖源影像时返回None
+    """
+    corners = [(x0, y0), (x0 + width, y0), (x0, y0 + height), (x0 + width, y0 + height)]
+    pts = project_points(H_inv, corners)
+    if not np.all(np.isfinite(pts)):
+        return 0, 0, src_width, src_height
+    
+    sx0 = max(0, int(np.floor(pts[:, 0].min())) - margin)
+    sy0 = max(0, int(np.floor(pts[:, 1].min())) - margin)
+    sx1 = min(src_width, int(np.ceil(pts[:, 0].max())) + margin + 1)
+    sy1 = min(src_height, int(np.ceil(pts[:, 1].max())) + margin + 1)
+    if sx1 <= sx0 or sy1 <= sy0:
+        return None
+    return sx0, sy0, sx1, sy1
+
+# 分块变换：源窗口读取分辨率不超过输出块的倍数 (更粗的源影像按块平均降采样读取)，以及默认线程数上限
+MAX_SOURCE_SCALE = 2
+DEFAULT_WARP_WORKERS = 4
+
+def warp_block(src_ds, H_inv, x0, y0, width, height):
+    """
+    计算一个输出块：只读取逆变换覆盖的源影像窗口，并逐波段重映射
+    源窗口大于输出块的 MAX_SOURCE_SCALE 倍时 (源影像分辨率远高于输出网格)，
+    由GDAL按平均值降采样读取，读取的数组大小不超过 MAX_SOURCE_SCALE 倍输出块
+    
+    Args:
+        src_ds: 源影像GDAL数据集
+        H_inv: 目标影像到源影像的逆单应性矩阵
+        x0, y0, width, height: 输出块的位置和大小
+    
+    Returns:
+        block: (bands, height, width) 的float32数组，源影像以外的像素为0
+    """
+    import cv2
+    gdal = _import_gdal()
+    
+    block = np.zeros((src_ds.RasterCount, height, width), dtype=np.float32)
+    window = source_window(H_inv, x0, y0, width, height, src_ds.RasterXSize, src_ds.RasterYSize)
+    if window is None:
+        return block
+    
+    sx0, sy0, sx1, sy1 = window
+    buf_width = min(sx1 - sx0, MAX_SOURCE_SCALE * width)
+    buf_height = min(sy1 - sy0, MAX_SOURCE_SCALE * height)
+    scale_x = (sx1 - sx0) / buf_width
+    scale_y = (sy1 - sy0) / buf_height
+    
+    # 直接读取为float32，不再另外转换类型
+    src = src_ds.ReadAsArray(
+        sx0, sy0, sx1 - sx0, sy1 - sy0, buf_xsize=buf_width, buf_ysize=buf_height,
+        buf_type=gdal.GDT_Float32, resample_alg=gdal.GRIORA_Average
+    )
+    if src.ndim == 2:
+        src = src[np.newaxis]
+    
+    # 输出块各像素在读取数组中的坐标 (降采样读取时按像素中心换算)
+    u, v = np.meshgrid(
+        np.arange(x0, x0 + width, dtype=np.float64),
+        np.arange(y0, y0 + height, dtype=np.float64)
+    )
+    w = H_inv[2, 0] * u + H_inv[2, 1] * v + H_inv[2, 2]
+    map_x = (H_inv[0, 0] * u + H_inv[0, 1] * v + H_inv[0, 2]) / w - sx0
+    map_y = (H_inv[1, 0] * u + H_inv[1, 1] * v + H_inv[1, 2]) / w - sy0
+    if scale_x != 1:
+        map_x = (map_x + 0.5) / scale_x - 0.5
+    if scale_y != 1:
+        map_y = (map_y + 0.5) / scale_y - 0.5
+    map_x = map_x.astype(np.float32)
+    map_y = map_y.astype(np.float32)
+    
+    for i in range(src.shape[0]):
+        block[i] = cv2.remap(src[i], map_x, map_y, cv2.INTER_LINEAR,
+                             borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    return block
+
+class _SourceReader:
+    """每个线程打开各自的源影像数据集，GDAL数据集不能跨线程共享"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+    
+    def dataset(self):
+        ds = getattr(self.local, 'ds', None)
+        if ds is None:
+            ds = self.local.ds = open_geotiff(self.path)
+        return ds
+
+def warp_to_geotiff(src_path, output_path, H, dst_shape, geo_transform, projection,
+                    output_options=None, workers=None):
+    """
+    分块流式变换源影像并写出分块GeoTIFF
+    每个输出块由逆单应性矩阵确定需要读取的源影像窗口，在线程池中逐波段重映射 (cv2释放GIL)，
+    按顺序写入输出文件；源窗口按不超过 MAX_SOURCE_SCALE 倍输出块的分辨率读取 (见 warp_block)，
+    内存占用只与块大小、波段数和线程数有关
+    
+    Args:
+        src_path: 源影像路径
+        output_path: 输出路径
+        H: 源影像到目标影像的单应性矩阵
+        dst_shape: 输出影像形状 (height, width)
+        geo_transform: 输出地理变换参数
+        projection: 输出投影
+        output_options: 输出设置 (raster_profiles.output_options)，分块大小同时作为变换块大小
+        workers: 线程数，默认不超过 DEFAULT_WARP_WORKERS (在常驻工作进程池中运行时避免线程过多)
+    
+    Returns:
+        output_path: 输出路径
+    """
+    gdal = _import_gdal()
+    
+    print_progress("Warping image")
+    
+    options = output_options or raster_profiles.output_options()
+    block_size = options['block_size']
+    workers = workers or min(DEFAULT_WARP_WORKERS, os.cpu_count() or 1)
+    height, width = dst_shape
+    H_inv = np.linalg.inv(H)
+    
+    reader = _SourceReader(src_path)
+    n_bands = reader.dataset().RasterCount
+    
+    driver = gdal.GetDriverByName('GTiff')
+    out_ds = driver.Create(output_path, width, height, n_bands, gdal.GDT_Float32,
+                           options=raster_profiles.gdal_creation_options(options, 'float32'))
+    if out_ds is None:
+        raise Exception(f"无法创建输出文件: {output_path}")
+    out_ds.SetGeoTransform(geo_transform)
+    out_ds.SetProjection(projection)
+    
+    blocks = [
+        (x0, y0, min(block_size, width - x0), min(block_size, height - y0))
+        for y0 in range(0, height, block_size)
+        for x0 in range(0, width, block_size)
+    ]
+    
+    def compute(block):
+        return block, warp_block(reader.dataset(), H_inv, *block)
+    
+    pending = deque()
+    report_every = max(1, len(blocks) // 10)
+    
+    def write_next():
+        block, data = pending.popleft().result()
+        x0, y0 = block[0], block[1]
+        for i in range(n_bands):
+            out_ds.GetRasterBand(i + 1).WriteArray(data[i], x0, y0)
+        done = len(blocks) - len(remaining) - len(pending)
+        if done % report_every == 0:
+            print_progress(f"Warped {done}/{len(blocks)} blocks")
+    
+    # 按顺序写出，正在处理的块数不超过线程数的两倍
+    remaining = deque(blocks)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while remaining:
+            pending.append(executor.submit(compute, remaining.popleft()))
+            if len(pending) >= workers * 2:
+                write_next()
+        while pending:
+            write_next()
+    
+    out_ds.FlushCache()
+    out_ds = None
+    raster_profiles.finalize_output_gdal(output_path, options)
+    return output_path
+
 def update_geo_transform(geo_transform, H, shape):
     """根据单应性矩阵更新GeoTransform"""
     # 这是一个简化的实现，实际应用中需要更详细的计算
@@ -171,8 +845,8 @@ def update_geo_transform(geo_transform, H, shape):
     
     return tuple(new_geo)
 
-def write_geotiff(filepath, data, geo_transform, projection, datatype=gdal.GDT_Float32):
-    """将影像数据写入GeoTIFF文件"""
+def write_geotiff(filepath, data, geo_transform, projection, datatype=None, output_options=None):
+    """将影像数据写入GeoTIFF文件 (分块、压缩设置见 raster_profiles)"""
     if len(data.shape) > 2 and data.shape[0] > 1:
         # 多波段影像
         bands, height, width = data.shape
@@ -185,8 +859,15 @@ def write_geotiff(filepath, data, geo_transform, projection, datatype=gdal.GDT_F
             bands = 1
             height, width = data.shape
     
+    gdal = _import_gdal()
+    if datatype is None:
+        datatype = gdal.GDT_Float32
+    
+    creation = raster_profiles.gdal_creation_options(
+        output_options, gdal.GetDataTypeName(datatype).lower()
+    )
     driver = gdal.GetDriverByName('GTiff')
-    out_ds = driver.Create(filepath, width, height, bands, datatype)
+    out_ds = driver.Create(filepath, width, height, bands, datatype, options=creation)
     
     if out_ds is None:
         raise Exception(f"无法创建输出文件: {filepath}")
@@ -206,17 +887,59 @@ def write_geotiff(filepath, data, geo_transform, projection, datatype=gdal.GDT_F
     out_ds.FlushCache()
     return out_ds
 
-def main():
-    """主函数"""
-    if len(sys.argv) != 4:
-        print("用法: python register_image.py <正射影像> <CHM影像> <输出路径>")
-        sys.exit(1)
+def register_images(ortho_path, chm_path, output_path, output_options=None, pyramid=False,
+                    coarse_size=2048, patch_grid=4, patch_size=512, workers=None, use_cache=True,
+                    cache_dir=None, cache_size_mb=None, detector='sift', max_features=None, grid_size=None,
+                    max_per_cell=None, homography_method='ransac'):
+    """
+    将正射影像配准到CHM并写出结果
     
-    ortho_path = sys.argv[1]
-    chm_path = sys.argv[2]
-    output_path = sys.argv[3]
+    Args:
+        ortho_path: 正射影像路径
+        chm_path: CHM影像路径
+        output_path: 输出路径
+        output_options: 输出设置 (raster_profiles.output_options)，默认为分块压缩的COG
+        pyramid: 是否使用由粗到精的金字塔配准，适用于大幅影像
+        coarse_size: 金字塔配准时粗配准影像的最大边长
+        patch_grid: 金字塔配准时精配准的分块网格大小
+        patch_size: 金字塔配准时精配准的分块边长 (像素)
+        workers: 分块变换的线程数，默认不超过 DEFAULT_WARP_WORKERS
+        use_cache: 是否使用特征点磁盘缓存 (按影像内容哈希复用关键点和描述子)
+        cache_dir: 缓存目录，默认使用 feature_cache.DEFAULT_CACHE_DIR
+        cache_size_mb: 缓存容量上限 (MB)，超出时按最近使用时间淘汰
+        detector: 特征检测器 (sift, orb, akaze)，ORB速度最快
+        max_features: 每幅影像 (或每个分块) 保留的最多特征点数
+        grid_size: 特征点网格筛选的网格边长 (像素)
+        max_per_cell: 每个网格单元保留的最多特征点数
+        homography_method: 单应性矩阵估计方法 (ransac, magsac)
     
-    try:
+    Returns:
+        output_path: 配准后的影像路径
+    """
+    options = feature_options(detector, max_features, grid_size, max_per_cell, homography_method)
+    
+    cache, src_key, dst_key = None, None, None
+    if use_cache:
+        cache = feature_cache.FeatureCache(
+            cache_dir or feature_cache.DEFAULT_CACHE_DIR,
+            cache_size_mb * 1024 * 1024 if cache_size_mb else feature_cache.DEFAULT_MAX_BYTES
+        )
+        src_key = cache.file_digest(ortho_path)
+        dst_key = cache.file_digest(chm_path)
+    
+    if pyramid:
+        # 金字塔配准只读取降采样影像和少量原始分辨率分块
+        src_ds = open_geotiff(ortho_path)
+        dst_ds = open_geotiff(chm_path)
+        H, levels = register_pyramid(
+            src_ds, dst_ds, coarse_size=coarse_size, patch_grid=patch_grid, patch_size=patch_size,
+            cache=cache, src_key=src_key, dst_key=dst_key, options=options
+        )
+        dst_shape = (dst_ds.RasterYSize, dst_ds.RasterXSize)
+        dst_geo, dst_proj = dst_ds.GetGeoTransform(), dst_ds.GetProjection()
+        src_ds = None
+        dst_ds = None
+    else:
         # 读取源影像和目标影像
         print_progress("Reading source image (orthophoto)")
         src_img, src_geo, src_proj, src_bands = read_geotiff(ortho_path)
@@ -225,30 +948,177 @@ def main():
         dst_img, dst_geo, dst_proj, dst_bands = read_geotiff(chm_path)
         
         # 检测特征点并匹配
-        kp1, kp2, good_matches = detect_and_match_features(src_img, dst_img)
+        kp1, kp2, good_matches = detect_and_match_features(src_img, dst_img, cache, src_key, dst_key, options)
         
         # 计算单应性矩阵
-        H = compute_homography(kp1, kp2, good_matches)
+        H = compute_homography(kp1, kp2, good_matches, options)
         
-        # 变换源影像
+        # 输出影像形状
         if len(dst_img.shape) > 2:
             dst_shape = dst_img[0].shape
         else:
             dst_shape = dst_img.shape
-            
-        warped_img = warp_image(src_img, dst_shape, H)
         
-        # 更新地理变换参数（这一步可能需要根据实际情况调整）
-        # 在实际应用中，通常直接使用目标影像的地理参考
-        new_geo = dst_geo  # 简化处理，使用目标影像的地理参考
+        # 变换时按窗口重新读取源影像，不再保留整幅数组
+        src_img = None
+        dst_img = None
+    
+    # 更新地理变换参数（这一步可能需要根据实际情况调整）
+    # 在实际应用中，通常直接使用目标影像的地理参考
+    new_geo = dst_geo  # 简化处理，使用目标影像的地理参考
+    
+    # 分块流式变换源影像并写出结果
+    print_progress("Writing output image")
+    warp_to_geotiff(ortho_path, output_path, H, dst_shape, new_geo, dst_proj,
+                    output_options=output_options, workers=workers)
+    
+    print_progress("Registration completed successfully")
+    return output_path
+
+def benchmark_backends(ortho_path, chm_path, detectors=None, pyramid=False, coarse_size=2048,
+                       patch_grid=4, patch_size=512, reference='sift', **kwargs):
+    """
+    比较各特征检测器的配准精度和耗时 (不使用缓存，不写出影像)
+    精度以内点重投影误差，以及与参考检测器的变换结果在目标影像网格点上的平均偏差衡量
+    
+    Args:
+        ortho_path: 正射影像路径
+        chm_path: CHM影像路径
+        detectors: 参与比较的特征检测器，默认为当前OpenCV可用的全部检测器；不可用的检测器跳过
+        pyramid: 是否使用金字塔配准
+        coarse_size, patch_grid, patch_size: 金字塔配准参数
+        reference: 计算偏差时作为参考的检测器
+        **kwargs: 其余特征设置 (max_features, grid_size, max_per_cell, method 等)
+    
+    Returns:
+        results: 每个检测器的结果字典列表
+    """
+    if pyramid:
+        src_ds = open_geotiff(ortho_path)
+        dst_ds = open_geotiff(chm_path)
+        dst_size = (dst_ds.RasterXSize, dst_ds.RasterYSize)
+    else:
+        # 整幅影像只读取一次，耗时统计不包含读取时间
+        src_img = read_geotiff(ortho_path)[0]
+        dst_img = read_geotiff(chm_path)[0]
+        dst_size = dst_img.shape[-1], dst_img.shape[-2]
+    
+    available = available_detectors()
+    results = []
+    for detector in (available if detectors is None else detectors):
+        if detector not in available:
+            print_progress(f"Skipping detector not available in this OpenCV build: {detector}")
+            continue
+        print_progress(f"Benchmarking detector: {detector}")
+        options = feature_options(detector, **kwargs)
+        start = time.perf_counter()
+        try:
+            if pyramid:
+                H, levels = register_pyramid(src_ds, dst_ds, coarse_size=coarse_size, patch_grid=patch_grid,
+                                             patch_size=patch_size, options=options)
+                stats = dict(levels[-1])
+            else:
+                kp1, kp2, good_matches = detect_and_match_features(src_img, dst_img, options=options)
+                src_pts, dst_pts = matched_points(kp1, kp2, good_matches)
+                H, mask = estimate_homography(src_pts, dst_pts, 5.0, options)
+                stats = homography_stats(H, src_pts, dst_pts, mask)
+        except Exception as e:
+            results.append({'detector': detector, 'error': str(e)})
+            continue
         
-        # 写入结果
-        print_progress("Writing output image")
-        write_geotiff(output_path, warped_img, new_geo, dst_proj)
+        stats.update(detector=detector, time_s=time.perf_counter() - start, H=H)
+        results.append(stats)
+    
+    # 目标影像上 10x10 网格点映射到源影像的位置偏差
+    xs, ys = np.meshgrid(np.linspace(0, dst_size[0], 10), np.linspace(0, dst_size[1], 10))
+    grid = np.column_stack([xs.ravel(), ys.ravel()])
+    ref = next((r for r in results if r['detector'] == reference and 'H' in r), None)
+    for r in results:
+        if 'H' in r and ref is not None:
+            projected = project_points(np.linalg.inv(r['H']), grid)
+            expected = project_points(np.linalg.inv(ref['H']), grid)
+            r['deviation_px'] = float(np.mean(np.linalg.norm(projected - expected, axis=1)))
+        if 'H' in r:
+            r['H'] = r['H'].tolist()
+    
+    print_progress(f"{'detector':<10}{'time (s)':>10}{'matches':>10}{'inliers':>10}{'ratio':>8}"
+                   f"{'rmse (px)':>11}{f'dev vs {reference} (px)':>22}")
+    for r in results:
+        if 'error' in r:
+            print_progress(f"{r['detector']:<10}  failed: {r['error']}")
+            continue
+        deviation = f"{r['deviation_px']:.2f}" if 'deviation_px' in r else '-'
+        print_progress(f"{r['detector']:<10}{r['time_s']:>10.2f}{r['matches']:>10}{r['inliers']:>10}"
+                       f"{r['inlier_ratio']:>8.1%}{r['rmse_px']:>11.2f}{deviation:>22}")
+    
+    return results
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='将多光谱正射影像配准到CHM')
+    parser.add_argument('ortho_path', help='正射影像')
+    parser.add_argument('chm_path', help='CHM影像')
+    parser.add_argument('output_path', nargs='?', help='输出路径 (--benchmark 时不需要)')
+    parser.add_argument('--pyramid', action='store_true',
+                        help='由粗到精的金字塔配准：降采样影像粗配准，原始分辨率分块精配准')
+    parser.add_argument('--coarse-size', type=int, default=2048, help='粗配准影像的最大边长 (默认: 2048)')
+    parser.add_argument('--patch-grid', type=int, default=4, help='精配准分块网格大小 (默认: 4，即4x4个分块)')
+    parser.add_argument('--patch-size', type=int, default=512, help='精配准分块边长 (像素) (默认: 512)')
+    parser.add_argument('--workers', type=int, help=f'分块变换的线程数 (默认: CPU核心数，不超过 {DEFAULT_WARP_WORKERS})')
+    parser.add_argument('--detector', choices=FEATURE_DETECTORS, default='sift',
+                        help='特征检测器 (默认: sift；orb最快，akaze介于两者之间)')
+    parser.add_argument('--max-features', type=int, help='每幅影像 (或每个分块) 保留的最多特征点数')
+    parser.add_argument('--grid-size', type=int, help='特征点网格筛选的网格边长 (像素)，需与 --max-per-cell 同时使用')
+    parser.add_argument('--max-per-cell', type=int, help='每个网格单元保留的最多特征点数')
+    parser.add_argument('--homography-method', choices=HOMOGRAPHY_METHODS, default='ransac',
+                        help='单应性矩阵估计方法 (默认: ransac；magsac不可用时回退到ransac)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='比较各特征检测器的配准精度和耗时，不写出影像')
+    parser.add_argument('--no-cache', action='store_true', help='不使用特征点磁盘缓存')
+    parser.add_argument('--cache-dir', help=f'特征点缓存目录 (默认: {feature_cache.DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-size-mb', type=int, help='特征点缓存容量上限 (MB) (默认: 2048)')
+    parser.add_argument('--profile-imports', action='store_true', help='输出各依赖模块的导入耗时 (标准错误)')
+    
+    args = parser.parse_args()
+    if not args.benchmark and not args.output_path:
+        parser.error("缺少输出路径 output_path")
+    
+    try:
+        if args.benchmark:
+            benchmark_backends(
+                args.ortho_path,
+                args.chm_path,
+                pyramid=args.pyramid,
+                coarse_size=args.coarse_size,
+                patch_grid=args.patch_grid,
+                patch_size=args.patch_size,
+                max_features=args.max_features,
+                grid_size=args.grid_size,
+                max_per_cell=args.max_per_cell,
+                method=args.homography_method
+            )
+            sys.exit(0)
         
-        print_progress("Registration completed successfully")
+        register_images(
+            args.ortho_path,
+            args.chm_path,
+            args.output_path,
+            pyramid=args.pyramid,
+            coarse_size=args.coarse_size,
+            patch_grid=args.patch_grid,
+            patch_size=args.patch_size,
+            workers=args.workers,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+            cache_size_mb=args.cache_size_mb,
+            detector=args.detector,
+            max_features=args.max_features,
+            grid_size=args.grid_size,
+            max_per_cell=args.max_per_cell,
+            homography_method=args.homography_method
+        )
         sys.exit(0)
-        
+    
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
         sys.exit(1)
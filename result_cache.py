@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分析结果缓存
+按内容寻址缓存树冠检测和碳储量计算的结果：键由输入文件内容哈希、参数和脚本源码哈希组成，
+每个条目是一个目录，保存输出文件 (GeoJSON、CSV、可视化图像)、JSON元数据和中间数组。
+条目先写入临时目录再整体重命名，多个进程同时写入同一条目时只保留先完成的一份；
+缓存总大小超过上限或条目超过保留期限时按最近使用时间淘汰
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+import feature_cache
+
+# 默认缓存目录、容量和保留期限，可通过环境变量覆盖
+DEFAULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'forest_result_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_MB', 1024)) * 1024 * 1024
+DEFAULT_MAX_AGE = float(os.environ.get('RESULT_CACHE_MAX_AGE_DAYS', 30)) * 24 * 3600
+
+META_FILE = 'meta.json'
+ARRAYS_FILE = 'arrays.npz'
+TMP_PREFIX = '.tmp-'
+
+# 脚本源码哈希，按文件路径记录
+_code_versions = {}
+
+def code_version(*paths):
+    """
+    计算脚本源码的哈希，作为缓存键的一部分，脚本修改后旧结果自动失效
+    
+    Args:
+        *paths: 脚本文件路径 (通常传入模块的 __file__)
+    
+    Returns:
+        version: 十六进制哈希字符串
+    """
+    sha = hashlib.sha256()
+    for path in paths:
+        path = os.path.abspath(path)
+        if path not in _code_versions:
+            with open(path, 'rb') as f:
+                _code_versions[path] = hashlib.sha256(f.read()).hexdigest()
+        sha.update(_code_versions[path].encode('ascii'))
+    return sha.hexdigest()
+
+def _dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+class CacheEntry:
+    """
+    缓存条目：目录中的输出文件、元数据和中间数组
+    """
+    
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+    
+    def has_file(self, name):
+        return os.path.exists(os.path.join(self.path, name))
+    
+    def restore(self, name, output_path):
+        """把条目中的文件复制到输出路径"""
+        shutil.copyfile(os.path.join(self.path, name), output_path)
+        return output_path
+    
+    def arrays(self):
+        """读取条目中保存的数组，没有数组时返回空字典"""
+        arrays_path = os.path.join(self.path, ARRAYS_FILE)
+        if not os.path.exists(arrays_path):
+            return {}
+        with np.load(arrays_path) as data:
+            return {name: data[name] for name in data.files}
+
+class ResultCache:
+    """
+    内容寻址的结果缓存
+    """
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def file_digest(self, path):
+        """输入文件的内容哈希，文件未变化时复用已记录的哈希"""
+        return feature_cache.file_digest(path, self.cache_dir)
+    
+    def key(self, *parts):
+        """由任意可JSON序列化的参数生成缓存键"""
+        return feature_cache.make_key(*parts)
+    
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+    
+    def get(self, key):
+        """
+        查找缓存条目
+        
+        Returns:
+            entry: CacheEntry，未命中时返回None
+        """
+        path = self._entry_path(key)
+        try:
+            with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        # 更新修改时间，作为淘汰时的最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        
+        return CacheEntry(path, meta)
+    
+    def put(self, key, files=None, meta=None, arrays=None):
+        """
+        写入缓存条目；条目已存在 (其他进程先完成写入) 时保留已有条目
+        
+        Args:
+            key: 缓存键
+            files: 条目文件名到源文件路径的字典，源文件会被复制到条目中
+            meta: 可JSON序列化的元数据
+            arrays: 数组名到numpy数组的字典，保存为npz
+        
+        Returns:
+            entry: 写入 (或已存在) 的 CacheEntry
+        """
+        tmp_dir = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=self.cache_dir)
+        try:
+            for name, src_path in (files or {}).items():
+                shutil.copyfile(src_path, os.path.join(tmp_dir, name))
+            if arrays:
+                np.savez(os.path.join(tmp_dir, ARRAYS_FILE), **arrays)
+            
+            # 元数据最后写入，读取时以元数据文件存在作为条目完整的标志
+            with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(meta or {}, f)
+            
+            try:
+                os.rename(tmp_dir, self._entry_path(key))
+            except OSError:
+                # 其他进程已写入同一条目，内容相同，保留已有条目
+                pass
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+        self.evict()
+        return self.get(key)
+    
+    def _remove(self, path):
+        """先重命名再删除，避免其他进程读到删除了一半的条目"""
+        trash = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=self.cache_dir)
+        try:
+            os.rename(path, os.path.join(trash, 'entry'))
+        except OSError:
+            pass
+        shutil.rmtree(trash, ignore_errors=True)
+    
+    def evict(self):
+        """删除超过保留期限的条目，总大小超过上限时按最近使用时间从旧到新删除条目"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(TMP_PREFIX) or not os.path.isdir(path):
+                continue
+            try:
+                mtime = os.stat(path).st_mtime
+                size = _dir_size(path)
+            except OSError:
+                continue
+            
+            if self.max_age and now - mtime > self.max_age:
+                self._remove(path)
+                continue
+            entries.append((mtime, size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+def open_cache(cache_dir=None, max_size_mb=None, max_age_days=None):
+    """
+    按参数或默认设置创建结果缓存
+    
+    Args:
+        cache_dir: 缓存目录
+        max_size_mb: 容量上限 (MB)
+        max_age_days: 条目保留天数 (按最近使用时间)
+    
+    Returns:
+        cache: ResultCache
+    """
+    return ResultCache(
+        cache_dir or DEFAULT_CACHE_DIR,
+        max_size_mb * 1024 * 1024 if max_size_mb else DEFAULT_MAX_BYTES,
+        max_age_days * 24 * 3600 if max_age_days else DEFAULT_MAX_AGE
+    )
\ No newline at end of file
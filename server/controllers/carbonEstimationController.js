@@ -1,7 +1,7 @@
 const fs = require('fs');
 const path = require('path');
-const { spawn } = require('child_process');
 const { pool } = require('../config/db');
+const { pythonWorker } = require('../services/pythonWorker');
 
 // 创建我们自己的 asyncHandler 函数替代 express-async-handler
 const asyncHandler = fn => (req, res, next) => {
@@ -81,9 +81,6 @@ const calculateCarbonEstimation = asyncHandler(async (req, res) => {
       carbonJobId
     });
     
-    // 准备Python脚本路径
-    const scriptPath = path.join(process.cwd(), 'server', 'scripts', 'tree_attributes.py');
-    
     // 准备GeoJSON文件的完整路径
     const geojsonPath = path.join(process.cwd(), results.geojson.replace(/^\//, ''));
     
@@ -93,99 +90,161 @@ const calculateCarbonEstimation = asyncHandler(async (req, res) => {
     const c = modelParams?.c || 1.0;
     const carbonFactor = modelParams?.carbonFactor || 0.5;
     
-    // 构建Python脚本参数
-    let pythonArgs = [
-      scriptPath,
-      '--geojson', geojsonPath,
-      '--chm', chmPath,
-      '--output-dir', outputDir,
-      '--a', a.toString(),
-      '--b', b.toString(),
-      '--c', c.toString(),
-      '--carbon-factor', carbonFactor.toString()
-    ];
-    
-    // 如果提供了DEM路径，添加到参数列表
+    // 如果提供了DEM路径，添加到参数中
+    let fullDemPath = null;
     if (demPath) {
-      const fullDemPath = path.join(process.cwd(), demPath.replace(/^\//, ''));
-      if (fs.existsSync(fullDemPath)) {
-        pythonArgs.push('--dem', fullDemPath);
+      const candidate = path.join(process.cwd(), demPath.replace(/^\//, ''));
+      if (fs.existsSync(candidate)) {
+        fullDemPath = candidate;
       }
     }
     
-    // 启动Python进程
-    const python = spawn('python', pythonArgs);
-    
-    let stdout = '';
-    let stderr = '';
+    try {
+      // 由常驻Python工作服务计算单株属性和碳储量
+      const { csv: csvPath, summary } = await pythonWorker.call(
+        'process_tree_attributes',
+        {
+          geojson_path: geojsonPath,
+          chm_path: chmPath,
+          dem_path: fullDemPath,
+          output_dir: outputDir,
+          a: Number(a),
+          b: Number(b),
+          c: Number(c),
+          carbon_factor: Number(carbonFactor)
+        },
+        (message) => console.log(`碳储量估算输出: ${message}`)
+      );
+      
+      if (!csvPath || !summary) {
+        throw new Error('未找到生成的CSV文件路径或摘要信息');
+      }
+      
+      // 相对于静态资源目录的路径，用于前端访问
+      const baseDir = process.cwd();
+      const relCsvPath = csvPath.replace(baseDir, '').replace(/\\/g, '/');
+      
+      // 更新作业结果
+      const results = {
+        csv: relCsvPath,
+        summary: summary,
+        modelParams: {
+          a,
+          b,
+          c,
+          carbonFactor
+        }
+      };
+      
+      await pool.query(
+        'UPDATE carbon_estimation_jobs SET status = $1, results = $2, updated_at = NOW() WHERE job_id = $3',
+        ['completed', JSON.stringify(results), carbonJobId]
+      );
+      
+      console.log(`碳储量估算成功完成，总碳储量: ${summary.total_carbon_t.toFixed(2)} 吨`);
+    } catch (error) {
+      console.error('碳储量估算失败:', error);
+      await pool.query(
+        'UPDATE carbon_estimation_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
+        ['failed', error.message, carbonJobId]
+      );
+    }
     
-    python.stdout.on('data', (data) => {
-      stdout += data.toString();
-      console.log(`碳储量估算输出: ${data}`);
+  } catch (error) {
+    console.error('碳储量估算请求失败:', error);
+    res.status(500).json({ 
+      success: false, 
+      message: '服务器处理请求时出错',
+      error: error.message
     });
+  }
+});
+
+/**
+ * 按新的生物量模型重新估算已完成作业的碳储量
+ * 使用作业保存的单株属性表，不重新读取CHM/DEM和树冠多边形，可一次估算多个模型 (如各森林亚类)
+ * @route POST /api/carbon-estimation/reprice
+ * @access Private
+ */
+const repriceCarbonEstimation = asyncHandler(async (req, res) => {
+  try {
+    const { carbonJobId, models } = req.body;
     
-    python.stderr.on('data', (data) => {
-      stderr += data.toString();
-      console.error(`碳储量估算错误: ${data}`);
-    });
+    if (!carbonJobId) {
+      return res.status(400).json({
+        success: false,
+        message: '缺少碳储量估算作业ID'
+      });
+    }
     
-    python.on('close', async (code) => {
-      try {
-        if (code !== 0) {
-          console.error(`碳储量估算失败，退出代码: ${code}`);
-          await pool.query(
-            'UPDATE carbon_estimation_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
-            ['failed', stderr, carbonJobId]
-          );
-          return;
-        }
-        
-        // 从输出中提取CSV路径和摘要
-        const csvPath = stdout.match(/CSV: (.+)/)?.[1]?.trim();
-        const summaryMatch = stdout.match(/SUMMARY: (.+)/)?.[1]?.trim();
-        
-        if (!csvPath || !summaryMatch) {
-          throw new Error('未找到生成的CSV文件路径或摘要信息');
-        }
-        
-        // 解析摘要JSON
-        const summary = JSON.parse(summaryMatch);
-        
-        // 相对于静态资源目录的路径，用于前端访问
-        const baseDir = process.cwd();
-        const relCsvPath = csvPath.replace(baseDir, '').replace(/\\/g, '/');
-        
-        // 更新作业结果
-        const results = {
-          csv: relCsvPath,
-          summary: summary,
-          modelParams: {
-            a,
-            b,
-            c,
-            carbonFactor
-          }
-        };
-        
-        await pool.query(
-          'UPDATE carbon_estimation_jobs SET status = $1, results = $2, updated_at = NOW() WHERE job_id = $3',
-          ['completed', JSON.stringify(results), carbonJobId]
-        );
-        
-        console.log(`碳储量估算成功完成，总碳储量: ${summary.total_carbon_t.toFixed(2)} 吨`);
-      } catch (error) {
-        console.error('处理碳储量估算结果失败:', error);
-        await pool.query(
-          'UPDATE carbon_estimation_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
-          ['failed', error.message, carbonJobId]
-        );
-      }
+    if (!Array.isArray(models) || models.length === 0) {
+      return res.status(400).json({
+        success: false,
+        message: '缺少生物量模型参数'
+      });
+    }
+    
+    const result = await pool.query(
+      'SELECT * FROM carbon_estimation_jobs WHERE job_id = $1',
+      [carbonJobId]
+    );
+    
+    if (result.rows.length === 0) {
+      return res.status(404).json({
+        success: false,
+        message: '找不到指定的碳储量估算作业'
+      });
+    }
+    
+    const job = result.rows[0];
+    const results = job.results ? JSON.parse(job.results) : {};
+    if (job.status !== 'completed' || !results.csv) {
+      return res.status(400).json({
+        success: false,
+        message: '碳储量估算作业尚未完成，无法重新估算'
+      });
+    }
+    
+    // 准备属性表的完整路径，Python端读取其旁边保存的单株属性表
+    const attributesPath = path.join(process.cwd(), results.csv.replace(/^\//, ''));
+    
+    // 准备模型参数，未提供的参数使用默认值
+    const modelList = models.map(model => ({
+      name: model.name,
+      a: Number(model.a || 0.05),
+      b: Number(model.b || 2.0),
+      c: Number(model.c || 1.0),
+      carbon_factor: Number(model.carbonFactor || 0.5)
+    }));
+    
+    const summaries = await pythonWorker.call(
+      'reprice_tree_attributes',
+      {
+        attributes_path: attributesPath,
+        models: modelList
+      },
+      (message) => console.log(`碳储量重新估算输出: ${message}`)
+    );
+    
+    res.status(200).json({
+      success: true,
+      carbonJobId,
+      results: summaries.map(({ model, summary }) => ({
+        modelParams: {
+          name: model.name,
+          a: model.a,
+          b: model.b,
+          c: model.c,
+          carbonFactor: model.carbon_factor
+        },
+        summary
+      }))
     });
     
   } catch (error) {
-    console.error('碳储量估算请求失败:', error);
-    res.status(500).json({ 
-      success: false, 
+    console.error('碳储量重新估算失败:', error);
+    res.status(500).json({
+      success: false,
       message: '服务器处理请求时出错',
       error: error.message
     });
@@ -294,6 +353,7 @@ const getAllCarbonJobs = asyncHandler(async (req, res) => {
 
 module.exports = {
   calculateCarbonEstimation,
+  repriceCarbonEstimation,
   getCarbonJobStatus,
   getAllCarbonJobs
 }; 
\ No newline at end of file
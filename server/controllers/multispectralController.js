@@ -1,6 +1,7 @@
 const fs = require('fs');
 const path = require('path');
 const { spawn } = require('child_process');
+const { pythonWorker } = require('../services/pythonWorker');
 const { pool } = require('../config/db');
 // 创建我们自己的 asyncHandler 函数替代 express-async-handler
 const asyncHandler = fn => (req, res, next) => {
@@ -241,56 +242,42 @@ const performImageRegistration = (jobId, orthoPath, chmPath) => {
     const outputDir = path.join(jobDir, 'registered');
     const registeredOutputPath = path.join(outputDir, 'registered.tif');
     
-    // 准备Python脚本路径
-    const scriptPath = path.join(process.cwd(), 'server', 'scripts', 'register_image.py');
-    
-    // 检查Python脚本是否存在
-    if (!fs.existsSync(scriptPath)) {
-      reject(new Error('配准脚本不存在'));
-      return;
-    }
-    
-    // 启动Python配准脚本
+    // 由常驻Python工作服务执行配准
     progressManager.updateProgress(jobId, 'processing', 60, '启动图像配准处理...');
-    const python = spawn('python', [scriptPath, orthoPath, chmPath, registeredOutputPath]);
-    
-    let stderr = '';
-    
-    python.stdout.on('data', (data) => {
-      const output = data.toString();
-      console.log(`配准输出: ${output}`);
-      
-      // 解析进度信息
-      if (output.includes('Extracting features')) {
-        progressManager.updateProgress(jobId, 'processing', 65, '正在提取图像特征...');
-      } else if (output.includes('Matching features')) {
-        progressManager.updateProgress(jobId, 'processing', 70, '正在匹配特征点...');
-      } else if (output.includes('Computing homography')) {
-        progressManager.updateProgress(jobId, 'processing', 80, '计算变换矩阵...');
-      } else if (output.includes('Warping image')) {
-        progressManager.updateProgress(jobId, 'processing', 85, '正在变换影像...');
-      }
-    });
-    
-    python.stderr.on('data', (data) => {
-      stderr += data.toString();
-      console.error(`配准错误: ${data}`);
-    });
-    
-    python.on('close', (code) => {
-      if (code !== 0) {
-        progressManager.updateProgress(jobId, 'error', 0, `影像配准失败，错误代码: ${code}`);
-        reject(new Error(`影像配准失败: ${stderr}`));
-      } else {
-        progressManager.updateProgress(jobId, 'processing', 90, '影像配准完成');
+    pythonWorker.call(
+      'register_images',
+      {
+        ortho_path: orthoPath,
+        chm_path: chmPath,
+        output_path: registeredOutputPath
+      },
+      (output) => {
+        console.log(`配准输出: ${output}`);
         
-        // 检查输出文件是否存在
-        if (fs.existsSync(registeredOutputPath)) {
-          resolve(registeredOutputPath);
-        } else {
-          reject(new Error('配准处理完成但未找到输出文件'));
+        // 解析进度信息
+        if (output.includes('Extracting features')) {
+          progressManager.updateProgress(jobId, 'processing', 65, '正在提取图像特征...');
+        } else if (output.includes('Matching features')) {
+          progressManager.updateProgress(jobId, 'processing', 70, '正在匹配特征点...');
+        } else if (output.includes('Computing homography')) {
+          progressManager.updateProgress(jobId, 'processing', 80, '计算变换矩阵...');
+        } else if (output.includes('Warping image')) {
+          progressManager.updateProgress(jobId, 'processing', 85, '正在变换影像...');
         }
       }
+    ).then(() => {
+      progressManager.updateProgress(jobId, 'processing', 90, '影像配准完成');
+      
+      // 检查输出文件是否存在
+      if (fs.existsSync(registeredOutputPath)) {
+        resolve(registeredOutputPath);
+      } else {
+        reject(new Error('配准处理完成但未找到输出文件'));
+      }
+    }).catch((error) => {
+      console.error(`配准错误: ${error.message}`);
+      progressManager.updateProgress(jobId, 'error', 0, `影像配准失败: ${error.message}`);
+      reject(new Error(`影像配准失败: ${error.message}`));
     });
   });
 };
@@ -307,58 +294,82 @@ const applyManualAdjustment = (jobId, registeredPath, dx, dy) => {
   return new Promise((resolve, reject) => {
     progressManager.updateProgress(jobId, 'processing', 95, '应用手动调整...');
     
-    // 调整后输出路径
+    // 调整后输出路径：VRT只引用配准影像并记录偏移后的地理变换，每次调整不复制像素
     const jobDir = path.dirname(path.dirname(registeredPath));
     const outputDir = path.join(jobDir, 'registered');
-    const finalOutputPath = path.join(outputDir, 'final_adjusted.tif');
+    const finalOutputPath = path.join(outputDir, 'final_adjusted.vrt');
     
-    // 准备Python脚本路径
-    const scriptPath = path.join(process.cwd(), 'server', 'scripts', 'adjust_image.py');
-    
-    // 检查Python脚本是否存在
-    if (!fs.existsSync(scriptPath)) {
-      reject(new Error('调整脚本不存在'));
-      return;
+    // 上次调整导出的GeoTIFF已过期，下载时按新的VRT重新导出
+    const exportedPath = finalOutputPath.replace(/\.vrt$/i, '.tif');
+    if (fs.existsSync(exportedPath)) {
+      fs.unlinkSync(exportedPath);
     }
     
-    // 启动Python调整脚本
-    const python = spawn('python', [
-      scriptPath, 
-      registeredPath, 
-      finalOutputPath,
-      dx.toString(),
-      dy.toString()
-    ]);
-    
-    let stderr = '';
-    
-    python.stdout.on('data', (data) => {
-      console.log(`调整输出: ${data}`);
-    });
-    
-    python.stderr.on('data', (data) => {
-      stderr += data.toString();
-      console.error(`调整错误: ${data}`);
-    });
-    
-    python.on('close', (code) => {
-      if (code !== 0) {
-        progressManager.updateProgress(jobId, 'error', 0, `手动调整失败，错误代码: ${code}`);
-        reject(new Error(`手动调整失败: ${stderr}`));
+    // 由常驻Python工作服务执行调整
+    pythonWorker.call(
+      'adjust_image',
+      {
+        input_path: registeredPath,
+        output_path: finalOutputPath,
+        dx: Number(dx),
+        dy: Number(dy)
+      },
+      (output) => console.log(`调整输出: ${output}`)
+    ).then(() => {
+      progressManager.updateProgress(jobId, 'processing', 100, '处理完成');
+      
+      // 检查输出文件是否存在
+      if (fs.existsSync(finalOutputPath)) {
+        resolve(finalOutputPath);
       } else {
-        progressManager.updateProgress(jobId, 'processing', 100, '处理完成');
-        
-        // 检查输出文件是否存在
-        if (fs.existsSync(finalOutputPath)) {
-          resolve(finalOutputPath);
-        } else {
-          reject(new Error('调整处理完成但未找到输出文件'));
-        }
+        reject(new Error('调整处理完成但未找到输出文件'));
       }
+    }).catch((error) => {
+      console.error(`调整错误: ${error.message}`);
+      progressManager.updateProgress(jobId, 'error', 0, `手动调整失败: ${error.message}`);
+      reject(new Error(`手动调整失败: ${error.message}`));
     });
   });
 };
 
+// 正在导出的GeoTIFF，同一影像的并发下载共享一次导出
+const finalExports = {};
+
+/**
+ * 将手动调整的VRT导出为GeoTIFF，已导出时直接复用
+ * @param {string} vrtPath - 手动调整输出的VRT路径
+ * @returns {Promise<string>} - GeoTIFF路径
+ */
+const exportFinalImage = (vrtPath) => {
+  const tifPath = vrtPath.replace(/\.vrt$/i, '.tif');
+  if (fs.existsSync(tifPath)) {
+    return Promise.resolve(tifPath);
+  }
+  
+  if (!finalExports[tifPath]) {
+    // 先写到临时文件再改名，避免并发请求读到未写完的影像
+    const partPath = tifPath.replace(/\.tif$/i, '.part.tif');
+    
+    // VRT已记录偏移后的地理变换，按零偏移复制像素即可
+    finalExports[tifPath] = pythonWorker.call(
+      'adjust_image',
+      {
+        input_path: vrtPath,
+        output_path: partPath,
+        dx: 0,
+        dy: 0
+      },
+      (output) => console.log(`导出输出: ${output}`)
+    ).then(() => {
+      fs.renameSync(partPath, tifPath);
+      return tifPath;
+    }).finally(() => {
+      delete finalExports[tifPath];
+    });
+  }
+  return finalExports[tifPath];
+};
+
 /**
  * 完整的多光谱影像处理流程
  * @param {Object} job - 作业信息 
@@ -553,7 +564,9 @@ const adjustMultispectralImages = async (req, res) => {
       // 更新结果
       const updatedResults = {
         ...results,
-        final: `/outputs/multispectral/${jobId}/registered/final_adjusted.tif`
+        final: `/outputs/multispectral/${jobId}/registered/${path.basename(finalPath)}`,
+        // VRT只能由GDAL读取，下载和地图显示使用按需导出的GeoTIFF
+        final_image: `/api/multispectral/job/${jobId}/final.tif`
       };
       
       await saveJobResults(jobId, updatedResults);
@@ -655,10 +668,54 @@ const monitorProgress = (req, res) => {
   });
 };
 
+/**
+ * 下载手动调整后的影像 (首次请求时由VRT导出GeoTIFF)
+ * @route GET /api/multispectral/job/:jobId/final.tif
+ * @access Public (与 /outputs 下的结果文件一致，下载链接和地图图层无法携带token)
+ */
+const downloadFinalImage = async (req, res) => {
+  try {
+    const { jobId } = req.params;
+    
+    const result = await pool.query(
+      'SELECT * FROM multispectral_jobs WHERE job_id = $1',
+      [jobId]
+    );
+    
+    const results = result.rows.length > 0 && result.rows[0].results
+      ? JSON.parse(result.rows[0].results)
+      : {};
+    
+    if (!results.final) {
+      return res.status(404).json({ 
+        success: false, 
+        message: '作业没有手动调整结果' 
+      });
+    }
+    
+    // 早期作业的调整结果本身就是GeoTIFF
+    const finalPath = path.join(process.cwd(), results.final.replace(/^\//, ''));
+    const imagePath = finalPath.toLowerCase().endsWith('.vrt')
+      ? await exportFinalImage(finalPath)
+      : finalPath;
+    
+    res.download(imagePath, `${jobId}_final_adjusted.tif`);
+    
+  } catch (error) {
+    console.error('导出调整影像错误:', error);
+    res.status(500).json({ 
+      success: false, 
+      message: '导出调整影像时出错',
+      error: error.message
+    });
+  }
+};
+
 module.exports = {
   uploadMultispectralImages,
   processMultispectralImages,
   adjustMultispectralImages,
+  downloadFinalImage,
   getJobStatus,
   monitorProgress
 }; 
\ No newline at end of file
@@ -1,7 +1,7 @@
 const fs = require('fs');
 const path = require('path');
-const { spawn } = require('child_process');
 const { pool } = require('../config/db');
+const { pythonWorker } = require('../services/pythonWorker');
 
 // 创建我们自己的 asyncHandler 函数替代 express-async-handler
 const asyncHandler = fn => (req, res, next) => {
@@ -77,94 +77,53 @@ const processCHM = async (jobId, chmPath, outputDir) => {
       ['processing', jobId]
     );
     
-    // 准备Python脚本路径
-    const scriptPath = path.join(process.cwd(), 'server', 'scripts', 'tree_crown_detection.py');
-    
-    // 检查Python脚本是否存在
-    if (!fs.existsSync(scriptPath)) {
-      throw new Error('树冠检测脚本不存在');
-    }
-    
     // 通过配置从请求中获取参数，或使用默认值
     const minHeight = 2.0;           // 最小树高阈值
     const smoothSigma = 1.0;         // 高斯平滑参数
     const minDistance = 5;           // 树顶检测的最小距离
     
-    // 启动Python脚本执行树冠检测
-    const python = spawn('python', [
-      scriptPath,
-      chmPath,
-      '--output-dir', outputDir,
-      '--min-height', minHeight.toString(),
-      '--smooth', smoothSigma.toString(),
-      '--min-distance', minDistance.toString()
-    ]);
-    
-    let stdout = '';
-    let stderr = '';
-    
-    python.stdout.on('data', (data) => {
-      stdout += data.toString();
-      console.log(`树冠检测输出: ${data}`);
-    });
+    // 由常驻Python工作服务执行树冠检测
+    const { geojson: geojsonPath, visualization: vizPath } = await pythonWorker.call(
+      'process_chm',
+      {
+        chm_path: chmPath,
+        output_dir: outputDir,
+        min_height: minHeight,
+        smooth_sigma: smoothSigma,
+        min_distance: minDistance
+      },
+      (message) => console.log(`树冠检测输出: ${message}`)
+    );
     
-    python.stderr.on('data', (data) => {
-      stderr += data.toString();
-      console.error(`树冠检测错误: ${data}`);
-    });
+    if (!geojsonPath) {
+      throw new Error('未找到生成的GeoJSON文件路径');
+    }
     
-    python.on('close', async (code) => {
-      try {
-        if (code !== 0) {
-          console.error(`树冠检测失败，退出代码: ${code}`);
-          await pool.query(
-            'UPDATE tree_detection_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
-            ['failed', stderr, jobId]
-          );
-          return;
-        }
-        
-        // 从输出中提取GeoJSON和可视化图像的路径
-        const geojsonPath = stdout.match(/GeoJSON: (.+)/)?.[1]?.trim();
-        const vizPath = stdout.match(/Visualization: (.+)/)?.[1]?.trim();
-        
-        if (!geojsonPath) {
-          throw new Error('未找到生成的GeoJSON文件路径');
-        }
-        
-        // 相对于静态资源目录的路径，用于前端访问
-        const baseDir = process.cwd();
-        const relGeojsonPath = geojsonPath.replace(baseDir, '').replace(/\\/g, '/');
-        const relVizPath = vizPath ? vizPath.replace(baseDir, '').replace(/\\/g, '/') : null;
-        
-        // 获取检测到的树木数量
-        let treeCount = 0;
-        if (fs.existsSync(geojsonPath)) {
-          const geojsonContent = JSON.parse(fs.readFileSync(geojsonPath, 'utf8'));
-          treeCount = geojsonContent.features.filter(f => f.properties.type === 'tree_top').length;
-        }
-        
-        // 更新作业结果
-        const results = {
-          geojson: relGeojsonPath,
-          visualization: relVizPath,
-          treeCount: treeCount
-        };
-        
-        await pool.query(
-          'UPDATE tree_detection_jobs SET status = $1, results = $2, updated_at = NOW() WHERE job_id = $3',
-          ['completed', JSON.stringify(results), jobId]
-        );
-        
-        console.log(`树冠检测成功完成，检测到 ${treeCount} 棵树`);
-      } catch (error) {
-        console.error('处理树冠检测结果失败:', error);
-        await pool.query(
-          'UPDATE tree_detection_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
-          ['failed', error.message, jobId]
-        );
-      }
-    });
+    // 相对于静态资源目录的路径，用于前端访问
+    const baseDir = process.cwd();
+    const relGeojsonPath = geojsonPath.replace(baseDir, '').replace(/\\/g, '/');
+    const relVizPath = vizPath ? vizPath.replace(baseDir, '').replace(/\\/g, '/') : null;
+    
+    // 获取检测到的树木数量
+    let treeCount = 0;
+    if (fs.existsSync(geojsonPath)) {
+      const geojsonContent = JSON.parse(fs.readFileSync(geojsonPath, 'utf8'));
+      treeCount = geojsonContent.features.filter(f => f.properties.type === 'tree_top').length;
+    }
+    
+    // 更新作业结果
+    const results = {
+      geojson: relGeojsonPath,
+      visualization: relVizPath,
+      treeCount: treeCount
+    };
+    
+    await pool.query(
+      'UPDATE tree_detection_jobs SET status = $1, results = $2, updated_at = NOW() WHERE job_id = $3',
+      ['completed', JSON.stringify(results), jobId]
+    );
+    
+    console.log(`树冠检测成功完成，检测到 ${treeCount} 棵树`);
     
   } catch (error) {
     console.error('树冠检测处理失败:', error);
@@ -281,89 +240,61 @@ const processWithParams = asyncHandler(async (req, res) => {
       jobId
     });
     
-    // 准备Python脚本路径
-    const scriptPath = path.join(process.cwd(), 'server', 'scripts', 'tree_crown_detection.py');
-    
-    // 启动Python脚本执行树冠检测
-    const python = spawn('python', [
-      scriptPath,
-      chmPath,
-      '--output-dir', outputDir,
-      '--min-height', minHeight.toString(),
-      '--smooth', smoothSigma.toString(),
-      '--min-distance', minDistance.toString()
-    ]);
-    
-    let stdout = '';
-    let stderr = '';
-    
-    python.stdout.on('data', (data) => {
-      stdout += data.toString();
-      console.log(`树冠检测输出: ${data}`);
-    });
-    
-    python.stderr.on('data', (data) => {
-      stderr += data.toString();
-      console.error(`树冠检测错误: ${data}`);
-    });
-    
-    python.on('close', async (code) => {
-      try {
-        if (code !== 0) {
-          console.error(`树冠检测失败，退出代码: ${code}`);
-          await pool.query(
-            'UPDATE tree_detection_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
-            ['failed', stderr, jobId]
-          );
-          return;
-        }
-        
-        // 从输出中提取GeoJSON和可视化图像的路径
-        const geojsonPath = stdout.match(/GeoJSON: (.+)/)?.[1]?.trim();
-        const vizPath = stdout.match(/Visualization: (.+)/)?.[1]?.trim();
-        
-        if (!geojsonPath) {
-          throw new Error('未找到生成的GeoJSON文件路径');
-        }
-        
-        // 相对于静态资源目录的路径，用于前端访问
-        const baseDir = process.cwd();
-        const relGeojsonPath = geojsonPath.replace(baseDir, '').replace(/\\/g, '/');
-        const relVizPath = vizPath ? vizPath.replace(baseDir, '').replace(/\\/g, '/') : null;
-        
-        // 获取检测到的树木数量
-        let treeCount = 0;
-        if (fs.existsSync(geojsonPath)) {
-          const geojsonContent = JSON.parse(fs.readFileSync(geojsonPath, 'utf8'));
-          treeCount = geojsonContent.features.filter(f => f.properties.type === 'tree_top').length;
-        }
-        
-        // 更新作业结果
-        const results = {
-          geojson: relGeojsonPath,
-          visualization: relVizPath,
-          treeCount: treeCount,
-          parameters: {
-            minHeight,
-            smoothSigma,
-            minDistance
-          }
-        };
-        
-        await pool.query(
-          'UPDATE tree_detection_jobs SET status = $1, results = $2, updated_at = NOW() WHERE job_id = $3',
-          ['completed', JSON.stringify(results), jobId]
-        );
-        
-        console.log(`树冠检测成功完成，检测到 ${treeCount} 棵树`);
-      } catch (error) {
-        console.error('处理树冠检测结果失败:', error);
-        await pool.query(
-          'UPDATE tree_detection_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
-          ['failed', error.message, jobId]
-        );
+    try {
+      // 由常驻Python工作服务执行树冠检测
+      const { geojson: geojsonPath, visualization: vizPath } = await pythonWorker.call(
+        'process_chm',
+        {
+          chm_path: chmPath,
+          output_dir: outputDir,
+          min_height: Number(minHeight),
+          smooth_sigma: Number(smoothSigma),
+          min_distance: parseInt(minDistance, 10)
+        },
+        (message) => console.log(`树冠检测输出: ${message}`)
+      );
+      
+      if (!geojsonPath) {
+        throw new Error('未找到生成的GeoJSON文件路径');
       }
-    });
+      
+      // 相对于静态资源目录的路径，用于前端访问
+      const baseDir = process.cwd();
+      const relGeojsonPath = geojsonPath.replace(baseDir, '').replace(/\\/g, '/');
+      const relVizPath = vizPath ? vizPath.replace(baseDir, '').replace(/\\/g, '/') : null;
+      
+      // 获取检测到的树木数量
+      let treeCount = 0;
+      if (fs.existsSync(geojsonPath)) {
+        const geojsonContent = JSON.parse(fs.readFileSync(geojsonPath, 'utf8'));
+        treeCount = geojsonContent.features.filter(f => f.properties.type === 'tree_top').length;
+      }
+      
+      // 更新作业结果
+      const results = {
+        geojson: relGeojsonPath,
+        visualization: relVizPath,
+        treeCount: treeCount,
+        parameters: {
+          minHeight,
+          smoothSigma,
+          minDistance
+        }
+      };
+      
+      await pool.query(
+        'UPDATE tree_detection_jobs SET status = $1, results = $2, updated_at = NOW() WHERE job_id = $3',
+        ['completed', JSON.stringify(results), jobId]
+      );
+      
+      console.log(`树冠检测成功完成，检测到 ${treeCount} 棵树`);
+    } catch (error) {
+      console.error('树冠检测失败:', error);
+      await pool.query(
+        'UPDATE tree_detection_jobs SET status = $1, error_message = $2, updated_at = NOW() WHERE job_id = $3',
+        ['failed', error.message, jobId]
+      );
+    }
     
   } catch (error) {
     console.error('树冠检测请求失败:', error);
@@ -0,0 +1,125 @@
+const path = require('path');
+const readline = require('readline');
+const { spawn } = require('child_process');
+
+/**
+ * Python常驻工作服务客户端
+ * 启动一次 worker_service.py，通过标准输入/输出的JSON行协议提交作业，
+ * 避免每个作业都重新启动Python解释器并导入numpy、rasterio、cv2等依赖
+ */
+class PythonWorkerService {
+  /**
+   * @param {Object} options - 配置项
+   * @param {string} options.pythonPath - Python解释器路径
+   * @param {string} options.scriptPath - worker_service.py 路径
+   * @param {number} options.poolSize - 工作进程数
+   */
+  constructor(options = {}) {
+    this.pythonPath = options.pythonPath || process.env.PYTHON_PATH || 'python';
+    this.scriptPath = options.scriptPath || path.join(process.cwd(), 'server', 'scripts', 'worker_service.py');
+    this.poolSize = options.poolSize || parseInt(process.env.PYTHON_WORKER_POOL_SIZE, 10) || 2;
+    this.process = null;
+    this.pending = new Map();
+    this.nextId = 1;
+  }
+
+  /**
+   * 启动工作服务进程 (已启动时直接返回)
+   */
+  start() {
+    if (this.process) {
+      return;
+    }
+
+    const worker = spawn(this.pythonPath, [this.scriptPath, '--pool-size', this.poolSize.toString()]);
+    this.process = worker;
+
+    readline.createInterface({ input: worker.stdout }).on('line', (line) => this.handleMessage(line));
+
+    worker.stderr.on('data', (data) => {
+      console.error(`Python工作服务: ${data}`);
+    });
+
+    const handleExit = (reason) => {
+      if (this.process !== worker) {
+        return;
+      }
+      this.process = null;
+
+      // 工作服务退出时，所有未完成的作业均视为失败
+      for (const job of this.pending.values()) {
+        job.reject(new Error(`Python工作服务已退出: ${reason}`));
+      }
+      this.pending.clear();
+    };
+
+    worker.on('error', (error) => handleExit(error.message));
+    worker.on('exit', (code) => handleExit(`退出代码 ${code}`));
+  }
+
+  /**
+   * 处理一条协议消息
+   * @param {string} line - 标准输出中的一行JSON
+   */
+  handleMessage(line) {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (error) {
+      console.log(`Python工作服务输出: ${line}`);
+      return;
+    }
+
+    if (message.type === 'ready') {
+      console.log(`Python工作服务已就绪，工作进程数: ${message.pool_size}`);
+      return;
+    }
+
+    const job = this.pending.get(message.id);
+    if (!job) {
+      return;
+    }
+
+    if (message.type === 'progress') {
+      if (job.onProgress) {
+        job.onProgress(message.message);
+      }
+    } else if (message.type === 'result') {
+      this.pending.delete(message.id);
+      job.resolve(message.result);
+    } else if (message.type === 'error') {
+      this.pending.delete(message.id);
+      job.reject(new Error(message.error));
+    }
+  }
+
+  /**
+   * 调用Python函数
+   * @param {string} method - 方法名 (如 process_chm、process_tree_attributes、register_images)
+   * @param {Object} params - 关键字参数
+   * @param {Function} onProgress - 进度回调，参数为进度消息文本
+   * @returns {Promise<Object>} - 函数返回结果
+   */
+  call(method, params = {}, onProgress = null) {
+    this.start();
+
+    return new Promise((resolve, reject) => {
+      const id = (this.nextId++).toString();
+      this.pending.set(id, { resolve, reject, onProgress });
+      this.process.stdin.write(`${JSON.stringify({ id, method, params })}\n`);
+    });
+  }
+
+  /**
+   * 关闭工作服务 (等待已提交的作业完成)
+   */
+  stop() {
+    if (this.process) {
+      this.process.stdin.end();
+    }
+  }
+}
+
+const pythonWorker = new PythonWorkerService();
+
+module.exports = { pythonWorker, PythonWorkerService };
\ No newline at end of file
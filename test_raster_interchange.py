@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+栅格中间格式的回归测试：导出后读取的像素和地理信息应与源GeoTIFF一致，源文件变化后中间文件失效
+"""
+
+import os
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+import raster_interchange
+
+@pytest.fixture
+def geotiff(tmp_path):
+    rng = np.random.default_rng(0)
+    data = rng.uniform(0, 30, (2, 70, 90)).astype('float32')
+    data[:, :3, :3] = -9999
+    path = str(tmp_path / 'chm.tif')
+    with rasterio.open(path, 'w', driver='GTiff', width=90, height=70, count=2, dtype='float32',
+                       crs='EPSG:32650', transform=from_origin(500000.0, 3000000.0, 0.5, 0.5),
+                       nodata=-9999) as dst:
+        dst.write(data)
+    return path
+
+@pytest.mark.parametrize('block_rows', [16, 1024])
+def test_export_round_trip(geotiff, block_rows):
+    npy_path = raster_interchange.export(geotiff, block_rows=block_rows)
+    assert raster_interchange.find(geotiff) == npy_path
+    
+    window = Window(10, 5, 40, 30)
+    with rasterio.open(geotiff) as src, raster_interchange.open_raster(geotiff) as dataset:
+        assert isinstance(dataset, raster_interchange.ArrayDataset)
+        assert dataset.shape == src.shape and dataset.count == src.count
+        assert dataset.transform == src.transform
+        assert dataset.crs == src.crs
+        assert dataset.nodata == src.nodata
+        np.testing.assert_array_equal(dataset.read(), src.read())
+        np.testing.assert_array_equal(dataset.read(2, window=window), src.read(2, window=window))
+
+def test_export_to_other_path(geotiff, tmp_path):
+    npy_path = raster_interchange.export(geotiff, output_path=str(tmp_path / 'shared.npy'))
+    assert npy_path == str(tmp_path / 'shared.npy')
+    assert raster_interchange.find(geotiff) is None
+    
+    data, header = raster_interchange.load(npy_path)
+    with rasterio.open(geotiff) as src:
+        np.testing.assert_array_equal(data, src.read())
+        assert header['transform'] == list(src.transform)[:6]
+
+def test_write_load_round_trip(tmp_path):
+    data = np.arange(12, dtype=np.int16).reshape(3, 4)
+    path = str(tmp_path / 'labels.npy')
+    raster_interchange.write(path, data, from_origin(0.0, 10.0, 1.0, 1.0), nodata=0)
+    
+    loaded, header = raster_interchange.load(path)
+    np.testing.assert_array_equal(loaded[0], data)
+    assert loaded.dtype == data.dtype
+    assert header['nodata'] == 0
+    
+    # 默认写时复制，修改映射数组不写回文件
+    loaded[0, 0, 0] = 99
+    np.testing.assert_array_equal(raster_interchange.load(path)[0][0], data)
+
+def test_stale_after_source_change(geotiff):
+    raster_interchange.export(geotiff)
+    with rasterio.open(geotiff, 'r+') as dst:
+        dst.write(np.zeros((70, 90), dtype='float32'), 1)
+    stat = os.stat(geotiff)
+    os.utime(geotiff, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    
+    assert raster_interchange.find(geotiff) is None
+    with raster_interchange.open_raster(geotiff) as src:
+        assert not isinstance(src, raster_interchange.ArrayDataset)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+影像配准的回归测试：特征点网格筛选和默认设置
+"""
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+
+from register_image import FEATURE_DETECTORS, available_detectors, feature_options, limit_keypoints
+
+def _random_keypoints(n=2000, size=500, seed=0):
+    rng = np.random.default_rng(seed)
+    xs, ys = rng.uniform(0, size, n), rng.uniform(0, size, n)
+    # 响应值取整，制造相同响应值的关键点
+    responses = np.round(rng.uniform(0, 50, n))
+    return [cv2.KeyPoint(float(x), float(y), 5.0, -1, float(r)) for x, y, r in zip(xs, ys, responses)]
+
+def _reference(keypoints, grid_size, max_per_cell, max_features):
+    """逐个关键点按响应值从高到低选取，统计每个网格单元已保留的数量"""
+    order = sorted(range(len(keypoints)), key=lambda i: -keypoints[i].response)
+    counts, kept = {}, []
+    for i in order:
+        x, y = keypoints[i].pt
+        cell = (int(y // grid_size), int(x // grid_size))
+        if counts.get(cell, 0) < max_per_cell:
+            counts[cell] = counts.get(cell, 0) + 1
+            kept.append(i)
+    return kept[:max_features] if max_features else kept
+
+@pytest.mark.parametrize('max_features', [None, 300])
+def test_grid_cap(max_features):
+    keypoints = _random_keypoints()
+    kept = limit_keypoints(keypoints, grid_size=50, max_per_cell=4, max_features=max_features)
+    
+    cells = {}
+    for kp in kept:
+        cell = (int(kp.pt[1] // 50), int(kp.pt[0] // 50))
+        cells[cell] = cells.get(cell, 0) + 1
+    assert max(cells.values()) <= 4
+    
+    expected = [keypoints[i] for i in _reference(keypoints, 50, 4, max_features)]
+    assert [kp.pt for kp in kept] == [kp.pt for kp in expected]
+
+def test_max_features_only():
+    keypoints = _random_keypoints()
+    kept = limit_keypoints(keypoints, max_features=100)
+    assert len(kept) == 100
+    responses = [kp.response for kp in kept]
+    assert responses == sorted(responses, reverse=True)
+    assert min(responses) >= np.sort([kp.response for kp in keypoints])[-100]
+
+def test_defaults():
+    assert feature_options()['method'] == 'ransac'
+    assert set(available_detectors()) <= set(FEATURE_DETECTORS)
+    assert {'sift', 'orb'} <= set(available_detectors())
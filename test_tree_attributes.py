@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+单株属性提取的回归测试：树冠最大高度应与逐个多边形掩膜的结果一致，
+属性表和汇总统计应与逐树计算的旧实现一致，重新估算碳储量应与完整重算一致
+"""
+
+import csv
+import json
+import math
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+shapely = pytest.importorskip('shapely')
+from rasterio import features
+from rasterio.transform import from_origin
+
+from tree_attributes import (
+    build_tree_attributes, calculate_summary, process_tree_attributes, reprice_tree_attributes, write_csv,
+    zonal_max_height
+)
+
+CRS = 'EPSG:32650'
+CHM_TRANSFORM = from_origin(500000.0, 3000000.0, 0.5, 0.5)
+
+def _write_raster(path, array, transform):
+    with rasterio.open(path, 'w', driver='GTiff', width=array.shape[1], height=array.shape[0], count=1,
+                       dtype='float32', crs=CRS, transform=transform, nodata=-9999) as dst:
+        dst.write(array.astype('float32'), 1)
+    return rasterio.open(path)
+
+def _plane(rows, cols, transform):
+    """以像素中心坐标计算的倾斜平面 (双线性重采样后保持不变)"""
+    x, y = transform * (cols + 0.5, rows + 0.5)
+    return 0.01 * (x - 500000.0) + 0.02 * (3000000.0 - y)
+
+@pytest.fixture
+def chm_src(tmp_path):
+    rng = np.random.default_rng(0)
+    chm = rng.uniform(2, 30, (80, 100)).astype('float32')
+    src = _write_raster(tmp_path / 'chm.tif', chm, CHM_TRANSFORM)
+    yield src
+    src.close()
+
+def _crowns(radius):
+    """在影像内部排成网格的圆形树冠"""
+    centers = [(500005.0 + 8 * i, 2999995.0 - 8 * j) for i in range(5) for j in range(4)]
+    return np.array([shapely.Point(x, y).buffer(radius) for x, y in centers], dtype=object)
+
+def _reference(geoms, chm_src, dem=None):
+    """逐个多边形掩膜计算最大高度"""
+    heights = chm_src.read(1)
+    if dem is not None:
+        heights = heights - dem
+    result = []
+    for geom in geoms:
+        inside = features.geometry_mask([geom], out_shape=chm_src.shape, transform=chm_src.transform, invert=True)
+        result.append(heights[inside].max())
+    return np.array(result, dtype=np.float32)
+
+def test_disjoint_crowns(chm_src):
+    geoms = _crowns(3.0)
+    np.testing.assert_array_equal(zonal_max_height(geoms, chm_src), _reference(geoms, chm_src))
+
+def test_overlapping_crowns(chm_src):
+    # 半径5米的树冠与相邻树冠 (间距8米) 重叠，共享的像素计入每个树冠
+    geoms = _crowns(5.0)
+    np.testing.assert_array_equal(zonal_max_height(geoms, chm_src), _reference(geoms, chm_src))
+
+def test_dem_on_other_grid(chm_src, tmp_path):
+    rows, cols = np.mgrid[0:chm_src.height, 0:chm_src.width]
+    dem = _plane(rows, cols, chm_src.transform)
+    
+    # DEM像素为CHM的2倍，覆盖相同范围
+    coarse_transform = from_origin(500000.0, 3000000.0, 1.0, 1.0)
+    rows, cols = np.mgrid[0:chm_src.height // 2, 0:chm_src.width // 2]
+    with _write_raster(tmp_path / 'dem.tif', _plane(rows, cols, coarse_transform), coarse_transform) as dem_src:
+        geoms = _crowns(3.0)
+        np.testing.assert_allclose(zonal_max_height(geoms, chm_src, dem_src),
+                                   _reference(geoms, chm_src, dem), atol=1e-4)
+
+def _baseline_records(tree_ids, areas, heights, centroid_x, centroid_y, a, b, c, carbon_factor):
+    """重构前的逐树计算：每棵树一个字典，float64"""
+    records = []
+    for tree_id, area, height, cx, cy in zip(tree_ids, areas, heights, centroid_x, centroid_y):
+        crown_diameter = 2 * math.sqrt(area / math.pi)
+        dbh_cm = 10 * crown_diameter
+        biomass_kg = a * (dbh_cm ** b) * (height ** c)
+        records.append({
+            'tree_id': tree_id, 'height_m': height, 'crown_diameter_m': crown_diameter, 'crown_area_m2': area,
+            'dbh_cm': dbh_cm, 'biomass_kg': biomass_kg, 'carbon_kg': biomass_kg * carbon_factor,
+            'centroid_x': cx, 'centroid_y': cy
+        })
+    return records
+
+def _baseline_summary(records):
+    """重构前的 calculate_summary"""
+    total_carbon_t = sum(r['carbon_kg'] for r in records) / 1000
+    total_crown_area_ha = sum(r['crown_area_m2'] for r in records) / 10000
+    carbon_density = total_carbon_t / total_crown_area_ha
+    return {
+        'total_trees': len(records),
+        'total_carbon_kg': total_carbon_t * 1000,
+        'total_biomass_kg': sum(r['biomass_kg'] for r in records),
+        'total_crown_area_m2': total_crown_area_ha * 10000,
+        'mean_height_m': np.mean([r['height_m'] for r in records]),
+        'mean_dbh_cm': np.mean([r['dbh_cm'] for r in records]),
+        'mean_carbon_kg': np.mean([r['carbon_kg'] for r in records]),
+        'total_carbon_t': total_carbon_t,
+        'total_crown_area_ha': total_crown_area_ha,
+        'carbon_density_t_ha': carbon_density,
+        'total_co2e_t': total_carbon_t * 3.67,
+        'co2e_density_t_ha': carbon_density * 3.67,
+    }
+
+@pytest.mark.parametrize('id_format', ['tree_{}', 'plot-A/{}'])
+def test_table_matches_baseline(tmp_path, id_format):
+    rng = np.random.default_rng(1)
+    n = 1000
+    tree_ids = [id_format.format(i + 1) for i in range(n)]
+    measurements = (tree_ids, rng.uniform(2, 80, n), rng.uniform(2, 35, n),
+                    rng.uniform(500000, 501000, n), rng.uniform(2999000, 3000000, n))
+    model = (0.05, 2.0, 1.0, 0.5)
+    records = _baseline_records(*measurements, *model)
+    
+    table = build_tree_attributes(*measurements, *model)
+    write_csv(table, str(tmp_path / 'attributes.csv'))
+    with open(tmp_path / 'attributes.csv', newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    
+    assert list(rows[0].keys()) == list(records[0].keys())
+    assert [row['tree_id'] for row in rows] == tree_ids
+    for name in list(records[0].keys())[1:]:
+        np.testing.assert_allclose([float(row[name]) for row in rows], [r[name] for r in records], rtol=1e-6)
+    
+    summary = calculate_summary(table)
+    for name, value in _baseline_summary(records).items():
+        assert summary[name] == pytest.approx(value, rel=1e-6), name
+
+def _write_crowns(path, geoms):
+    features_list = [
+        {'type': 'Feature', 'geometry': shapely.geometry.mapping(geom),
+         'properties': {'tree_id': f'tree_{i + 1}', 'type': 'tree_crown'}}
+        for i, geom in enumerate(geoms)
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features_list}, f)
+    return str(path)
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_reprice_matches_rerun(chm_src, tmp_path, output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    crowns_path = _write_crowns(tmp_path / 'crowns.geojson', _crowns(3.0))
+    attributes_path, _ = process_tree_attributes(
+        crowns_path, chm_src.name, output_dir=str(tmp_path / 'first'), output_format=output_format
+    )
+    
+    models = [
+        {'a': 0.05, 'b': 2.0, 'c': 1.0, 'carbon_factor': 0.5},
+        {'a': 0.0673, 'b': 2.2, 'c': 0.85, 'carbon_factor': 0.47},
+    ]
+    results = reprice_tree_attributes(attributes_path, models)
+    assert len(results) == len(models)
+    
+    for model, result in zip(models, results):
+        _, summary = process_tree_attributes(
+            crowns_path, chm_src.name, output_dir=str(tmp_path / 'rerun'), output_format=output_format,
+            a=model['a'], b=model['b'], c=model['c'], carbon_factor=model['carbon_factor']
+        )
+        assert result['summary'].keys() == summary.keys()
+        for name, value in summary.items():
+            assert result['summary'][name] == pytest.approx(value, rel=1e-9), name
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+树顶检测的回归测试：固定窗口时 detect_tree_tops 的结果应与 peak_local_max 一致，
+分块处理 (单进程和多进程) 的树顶和树冠应与整幅处理一致
+"""
+
+import numpy as np
+import pytest
+
+from tree_crown_detection import ChmStages, check_crown_radius, detect_crowns_tiled, detect_tree_tops
+
+peak_local_max = pytest.importorskip('skimage.feature').peak_local_max
+
+def _synthetic_chm(seed=0, size=400, trees=600):
+    """随机树冠 (高斯形状) 叠加成的CHM"""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:size, 0:size]
+    chm = np.zeros((size, size), dtype=np.float32)
+    for r, c, h, w in zip(rng.uniform(0, size, trees), rng.uniform(0, size, trees),
+                          rng.uniform(3, 30, trees), rng.uniform(2, 8, trees)):
+        np.maximum(chm, h * np.exp(-((rows - r) ** 2 + (cols - c) ** 2) / (2 * w * w)), out=chm)
+    return chm
+
+def _reference(chm, mask, min_distance, min_height):
+    return peak_local_max(np.where(mask, chm, 0), min_distance=min_distance,
+                          threshold_abs=min_height, exclude_border=False)
+
+def _assert_matches(chm, min_distance=5, min_height=2.0):
+    mask = chm > min_height
+    tops, _ = detect_tree_tops(chm, mask, min_distance=min_distance, min_height=min_height)
+    expected = _reference(chm, mask, min_distance, min_height)
+    assert len(tops) == len(expected)
+    np.testing.assert_array_equal(tops, expected)
+
+def test_flat_top():
+    chm = np.zeros((40, 60), dtype=np.float32)
+    chm[10:20, 10:40] = 10.0
+    _assert_matches(chm)
+
+@pytest.mark.parametrize('min_distance', [3, 5])
+def test_synthetic_chm(min_distance):
+    _assert_matches(_synthetic_chm(), min_distance=min_distance)
+
+@pytest.mark.parametrize('min_distance', [3, 5])
+def test_quantized_chm(min_distance):
+    _assert_matches(np.round(_synthetic_chm(seed=1)), min_distance=min_distance)
+
+@pytest.mark.parametrize('crown_radius', [0, -3])
+def test_crown_radius_must_be_positive(crown_radius):
+    with pytest.raises(ValueError):
+        check_crown_radius(crown_radius, 100)
+
+def test_crown_radius_clamped_to_limit():
+    assert check_crown_radius(None, 100) is None
+    assert check_crown_radius(20, 100) == 20
+    assert check_crown_radius(5000, 256) == 256
+    assert check_crown_radius(5000, 921.4) == 922
+
+def _tops_and_crowns(geojson):
+    """树顶 (坐标, 高度) 列表和按面积、质心排序的树冠多边形"""
+    import shapely
+    from shapely.geometry import shape
+    
+    tops = sorted((tuple(f['geometry']['coordinates']), f['properties']['height'])
+                  for f in geojson['features'] if f['properties']['type'] == 'tree_top')
+    crowns = np.array([shape(f['geometry']) for f in geojson['features']
+                       if f['properties']['type'] == 'tree_crown'], dtype=object)
+    centroids = shapely.centroid(crowns)
+    order = np.lexsort((shapely.get_y(centroids), shapely.get_x(centroids), shapely.area(crowns)))
+    return tops, crowns[order]
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_tiled_matches_whole_image(tmp_path, workers):
+    import shapely
+    rasterio = pytest.importorskip('rasterio')
+    from rasterio.transform import from_origin
+    
+    chm = _synthetic_chm()
+    chm_path = str(tmp_path / 'chm.tif')
+    with rasterio.open(chm_path, 'w', driver='GTiff', width=chm.shape[1], height=chm.shape[0], count=1,
+                       dtype='float32', crs='EPSG:32650', transform=from_origin(500000.0, 3000000.0, 0.5, 0.5)) as dst:
+        dst.write(chm, 1)
+    
+    whole = ChmStages(chm_path).polygonize(1.0, 2.0, 5, crown_radius=10)
+    tiled = detect_crowns_tiled(chm_path, min_height=2.0, smooth_sigma=1.0, min_distance=5, tile_size=64,
+                                crown_radius=10, workers=workers)
+    
+    whole_tops, whole_crowns = _tops_and_crowns(whole)
+    tiled_tops, tiled_crowns = _tops_and_crowns(tiled)
+    assert tiled_tops == whole_tops
+    # 跨分块合并的树冠可能多出共线顶点，按几何相等比较
+    assert len(tiled_crowns) == len(whole_crowns)
+    assert shapely.equals(tiled_crowns, whole_crowns).all()
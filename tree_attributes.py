@@ -3,38 +3,58 @@
 
 """
 单株属性提取与碳储量估算脚本
-从树冠多边形(GeoJSON)、CHM和DEM中提取树木属性，并计算碳储量
-输出CSV格式的属性数据
+从树冠多边形(GeoJSON/GeoParquet/FlatGeobuf)、CHM和DEM中提取树木属性，并计算碳储量
+输出CSV、GeoParquet或FlatGeobuf格式的属性数据
 """
 
 import sys
 import os
 import json
 import argparse
-import csv
-import math
-import numpy as np
-import rasterio
-from rasterio.mask import mask
-from shapely.geometry import shape
 import logging
 
+# 命令行传入 --profile-imports 时，在导入依赖之前开始记录导入耗时
+if __name__ == "__main__":
+    import import_profiler
+    import_profiler.enable_if_requested()
+
+# shapely 只在处理树冠多边形时按需导入
+import numpy as np
+from rasterio import features
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+
+import raster_interchange
+import result_cache
+import vector_io
+import tree_table
+from tree_table import TreeTable, AttributeSummary, CSV_FIELDS, TREE_TABLE_DTYPE
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 结果缓存中的文件名 (扩展名随输出格式变化) 和单株测量数组名
+CACHED_ATTRIBUTES = 'attributes'
+CACHED_TABLE = 'table.npy'
+CACHED_TABLE_IDS = 'table' + tree_table.IDS_SUFFIX
+MEASUREMENT_FIELDS = ('tree_ids', 'areas', 'heights', 'centroid_x', 'centroid_y')
+
+# 流式计算和写出属性时每个分块的树木数
+ATTRIBUTE_CHUNK_SIZE = 65536
+
 def read_raster(raster_path):
     """
-    读取栅格数据(GeoTIFF)
+    读取栅格数据(GeoTIFF)；存在可用的内存映射中间数组时直接映射，不再解码GeoTIFF
     
     Args:
         raster_path: 栅格文件路径
     
     Returns:
-        src: 打开的栅格数据源
+        src: 打开的栅格数据源 (rasterio数据集或 raster_interchange.ArrayDataset)
     """
     try:
-        src = rasterio.open(raster_path)
+        src = raster_interchange.open_raster(raster_path)
         logger.info(f"成功读取栅格数据, 形状: {src.shape}, 坐标系统: {src.crs}")
         return src
     except Exception as e:
@@ -43,17 +63,17 @@ def read_raster(raster_path):
 
 def read_geojson(geojson_path):
     """
-    读取GeoJSON文件
+    读取树冠要素文件：GeoJSON，或 GeoParquet/FlatGeobuf (几何批量解码为Shapely对象，不经过JSON)
     
     Args:
-        geojson_path: GeoJSON文件路径
+        geojson_path: 要素文件路径 (.geojson / .parquet / .fgb)
     
     Returns:
         data: GeoJSON数据
+        crown_features: 树冠多边形特征列表
     """
     try:
-        with open(geojson_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = vector_io.read_features(geojson_path)
         
         # 检查是否是FeatureCollection
         if data.get('type') != 'FeatureCollection':
@@ -62,13 +82,313 @@ def read_geojson(geojson_path):
         # 过滤出树冠多边形
         crown_features = [f for f in data['features'] if f.get('properties', {}).get('type') == 'tree_crown']
         
-        logger.info(f"成功读取GeoJSON, 共有{len(crown_features)}个树冠多边形")
+        logger.info(f"成功读取树冠要素, 共有{len(crown_features)}个树冠多边形")
         
         return data, crown_features
     except Exception as e:
-        logger.error(f"读取GeoJSON文件失败: {str(e)}")
+        logger.error(f"读取树冠要素文件失败: {str(e)}")
         raise
 
+def _nodata_to_nan(values, nodata):
+    """将无效值 (nodata，未设置时为0) 置为NaN"""
+    values = values.astype('float32')
+    values[values == (nodata or 0)] = np.nan
+    return values
+
+def _crown_row_ranges(geoms, transform, height):
+    """
+    计算每个树冠多边形覆盖的栅格行范围，用于按条带筛选多边形
+    
+    Returns:
+        row_min, row_max: 每个多边形的起止行号 (含边界)；影像存在旋转时返回整幅范围
+    """
+    import shapely
+    
+    n = len(geoms)
+    if transform.b != 0 or transform.d != 0 or n == 0:
+        return np.zeros(n, dtype=np.int64), np.full(n, height - 1, dtype=np.int64)
+    
+    bounds = shapely.bounds(geoms)
+    rows_a = (bounds[:, 1] - transform.f) / transform.e
+    rows_b = (bounds[:, 3] - transform.f) / transform.e
+    row_min = np.floor(np.minimum(rows_a, rows_b)).astype(np.int64)
+    row_max = np.ceil(np.maximum(rows_a, rows_b)).astype(np.int64)
+    return row_min, row_max
+
+def _same_grid(src, ref):
+    """判断两个栅格是否共享同一像素网格 (坐标系未知时只比较形状和仿射变换)"""
+    if src.shape != ref.shape or src.transform != ref.transform:
+        return False
+    return src.crs is None or ref.crs is None or src.crs == ref.crs
+
+def _dem_window(dem_src, chm_src, window):
+    """
+    读取与CHM窗口逐像素对应的DEM值 (无效值为NaN)
+    
+    DEM与CHM网格一致时直接按窗口读取；否则只读取覆盖该窗口的DEM范围，
+    双线性重采样到CHM窗口网格
+    
+    Args:
+        dem_src: DEM栅格数据源
+        chm_src: CHM栅格数据源
+        window: CHM上的读取窗口
+    
+    Returns:
+        dem_values: 与窗口形状相同的DEM值 (float32)
+    """
+    if _same_grid(dem_src, chm_src):
+        return _nodata_to_nan(dem_src.read(1, window=window), dem_src.nodata)
+    
+    from rasterio.crs import CRS
+    from rasterio.warp import Resampling, reproject, transform_bounds
+    from rasterio.windows import bounds as window_bounds, from_bounds
+    
+    # 坐标系未知时视为与另一幅栅格相同
+    dst_crs = chm_src.crs or dem_src.crs or CRS.from_epsg(3857)
+    src_crs = dem_src.crs or dst_crs
+    
+    dem_window = Window(0, 0, dem_src.width, dem_src.height)
+    unrotated = (chm_src.transform.b == 0 and chm_src.transform.d == 0 and
+                 dem_src.transform.b == 0 and dem_src.transform.d == 0)
+    if unrotated:
+        left, bottom, right, top = window_bounds(window, chm_src.transform)
+        if src_crs != dst_crs:
+            left, bottom, right, top = transform_bounds(dst_crs, src_crs, left, bottom, right, top)
+        wanted = from_bounds(left, bottom, right, top, dem_src.transform)
+        # 外扩2个像素，供双线性插值使用
+        row0 = max(int(np.floor(wanted.row_off)) - 2, 0)
+        col0 = max(int(np.floor(wanted.col_off)) - 2, 0)
+        row1 = min(int(np.ceil(wanted.row_off + wanted.height)) + 2, dem_src.height)
+        col1 = min(int(np.ceil(wanted.col_off + wanted.width)) + 2, dem_src.width)
+        dem_window = Window(col0, row0, max(col1 - col0, 0), max(row1 - row0, 0))
+    
+    dem_values = np.full((int(window.height), int(window.width)), np.nan, dtype='float32')
+    if dem_window.width == 0 or dem_window.height == 0:
+        return dem_values
+    
+    reproject(
+        _nodata_to_nan(dem_src.read(1, window=dem_window), dem_src.nodata),
+        dem_values,
+        src_transform=window_transform(dem_window, dem_src.transform),
+        src_crs=src_crs,
+        src_nodata=np.nan,
+        dst_transform=window_transform(window, chm_src.transform),
+        dst_crs=dst_crs,
+        dst_nodata=np.nan,
+        resampling=Resampling.bilinear
+    )
+    return dem_values
+
+def _window_heights(chm_src, dem_src, window):
+    """读取窗口内的高度值 (无效值为NaN)，提供DEM时为相对高度 (CHM - DEM)"""
+    height_values = _nodata_to_nan(chm_src.read(1, window=window), chm_src.nodata)
+    if dem_src is not None:
+        height_values -= _dem_window(dem_src, chm_src, window)
+    return height_values
+
+def _overlapping_crowns(geoms):
+    """
+    找出与其他树冠内部相交的树冠 (仅边界相接的不算)
+    
+    这些树冠在同一张标签图像中会争用像素，需要逐个栅格化
+    
+    Returns:
+        overlapping: 每个树冠是否与其他树冠重叠的布尔数组
+    """
+    import shapely
+    
+    overlapping = np.zeros(len(geoms), dtype=bool)
+    if len(geoms) < 2:
+        return overlapping
+    
+    # 先按外接矩形筛选候选对，再检查内部是否相交
+    left, right = shapely.STRtree(geoms).query(geoms)
+    pairs = left < right
+    left, right = left[pairs], right[pairs]
+    inner = shapely.relate_pattern(geoms[left], geoms[right], 'T********')
+    overlapping[left[inner]] = True
+    overlapping[right[inner]] = True
+    return overlapping
+
+def _crown_max_height(geom, chm_src, dem_src=None):
+    """单独栅格化一个树冠，读取其外接窗口并返回最大高度，无有效像素时为NaN"""
+    from rasterio.errors import WindowError
+    
+    try:
+        window = features.geometry_window(chm_src, [geom])
+    except WindowError:
+        return np.nan
+    if window.width == 0 or window.height == 0:
+        return np.nan
+    
+    inside = features.geometry_mask(
+        [geom],
+        out_shape=(int(window.height), int(window.width)),
+        transform=window_transform(window, chm_src.transform),
+        invert=True
+    )
+    height_values = _window_heights(chm_src, dem_src, window)[inside]
+    height_values = height_values[~np.isnan(height_values)]
+    return height_values.max() if height_values.size else np.nan
+
+def zonal_max_height(geoms, chm_src, dem_src=None, strip_height=1024):
+    """
+    一次栅格化全部树冠，按条带读取CHM/DEM，向量化计算每个树冠的最大高度
+    
+    树冠多边形按条带栅格化为与CHM对齐的标签图像 (标签值为多边形序号+1)，
+    与逐个多边形调用 rasterio.mask 的像素选取规则一致 (像素中心落在多边形内)。
+    标签图像中每个像素只能属于一个树冠，因此相互重叠的树冠不参与标签图像，
+    改为逐个栅格化，共享的像素计入每个覆盖它的树冠
+    
+    Args:
+        geoms: 树冠多边形数组 (Shapely对象)
+        chm_src: CHM栅格数据源
+        dem_src: DEM栅格数据源(可选)，网格与CHM不同时重采样到CHM网格
+        strip_height: 每个条带的行数
+    
+    Returns:
+        max_height: 每个树冠的最大高度 (float32)，无有效像素时为NaN
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    n = len(geoms)
+    max_height = np.full(n, -np.inf, dtype=np.float32)
+    row_min, row_max = _crown_row_ranges(geoms, chm_src.transform, chm_src.height)
+    
+    if dem_src is not None and not _same_grid(dem_src, chm_src):
+        logger.info("DEM与CHM网格不一致，按条带将DEM重采样到CHM网格")
+    
+    overlapping = _overlapping_crowns(geoms)
+    if overlapping.any():
+        logger.info(f"{int(overlapping.sum())} 个树冠相互重叠，逐个计算最大高度")
+    
+    for row_off in range(0, chm_src.height, strip_height):
+        rows = min(strip_height, chm_src.height - row_off)
+        
+        # 只栅格化与当前条带相交且不与其他树冠重叠的树冠
+        selected = np.nonzero((row_max >= row_off) & (row_min < row_off + rows) & ~overlapping)[0]
+        if len(selected) == 0:
+            continue
+        
+        window = Window(0, row_off, chm_src.width, rows)
+        labels = features.rasterize(
+            ((geoms[i], i + 1) for i in selected),
+            out_shape=(rows, chm_src.width),
+            transform=window_transform(window, chm_src.transform),
+            fill=0,
+            dtype='int32'
+        )
+        
+        inside = labels > 0
+        if not inside.any():
+            continue
+        
+        height_values = _window_heights(chm_src, dem_src, window)
+        valid = inside & ~np.isnan(height_values)
+        np.maximum.at(max_height, labels[valid] - 1, height_values[valid])
+    
+    for i in np.nonzero(overlapping)[0]:
+        max_height[i] = _crown_max_height(geoms[i], chm_src, dem_src)
+    
+    max_height[np.isneginf(max_height)] = np.nan
+    return max_height
+
+def iter_attribute_chunks(tree_ids, areas, heights, centroid_x, centroid_y, a=0.05, b=2.0, c=1.0,
+                          carbon_factor=0.5, chunk_size=ATTRIBUTE_CHUNK_SIZE):
+    """
+    按分块计算每棵树的属性和碳储量，逐块产出 TreeTable
+    没有树木时产出一个空分块，保证下游写出表头和表结构；
+    编号整体解析一次 (见 tree_table.parse_tree_ids)，各分块的编号列类型一致
+    
+    Args:
+        tree_ids: 树木编号序列 (整数、"tree_<n>" 或其他任意形式)
+        areas: 树冠面积数组 (平方米)
+        heights: 树高数组 (米)
+        centroid_x, centroid_y: 树冠质心坐标数组
+        a, b, c: 生物量模型参数
+        carbon_factor: 生物量到碳的转换因子
+        chunk_size: 每个分块的树木数
+    
+    Yields:
+        chunk: TreeTable
+    """
+    numbers, ids = tree_table.parse_tree_ids(tree_ids)
+    for start in range(0, max(len(areas), 1), chunk_size):
+        stop = start + chunk_size
+        chunk = TreeTable.from_measurements(
+            numbers[start:stop], areas[start:stop], heights[start:stop],
+            centroid_x[start:stop], centroid_y[start:stop]
+        )
+        if ids is not None:
+            chunk.ids = ids[start:stop]
+        yield chunk.apply_allometry(a, b, c, carbon_factor)
+
+def build_tree_attributes(tree_ids, areas, heights, centroid_x, centroid_y, a=0.05, b=2.0, c=1.0, carbon_factor=0.5):
+    """
+    由树冠面积、树高和质心计算每棵树的属性和碳储量
+    
+    Args:
+        tree_ids: 树木编号序列 (整数、"tree_<n>" 或其他任意形式)
+        areas: 树冠面积数组 (平方米)
+        heights: 树高数组 (米)
+        centroid_x, centroid_y: 树冠质心坐标数组
+        a, b, c: 生物量模型参数
+        carbon_factor: 生物量到碳的转换因子
+    
+    Returns:
+        tree_table: TreeTable
+    """
+    tree_table = TreeTable.from_measurements(tree_ids, areas, heights, centroid_x, centroid_y)
+    tree_table.apply_allometry(a, b, c, carbon_factor)
+    
+    logger.info(f"成功计算 {len(tree_table)} 棵树的属性和碳储量")
+    return tree_table
+
+def measure_crowns(crown_features, chm_src, dem_src=None):
+    """
+    测量每个树冠的面积、树高和质心，结果与生物量系数无关，可缓存后复用
+    
+    Args:
+        crown_features: 树冠多边形特征列表 (几何为GeoJSON字典或Shapely对象)
+        chm_src: CHM栅格数据源
+        dem_src: DEM栅格数据源(可选)
+    
+    Returns:
+        tree_ids: 树木ID列表
+        areas: 树冠面积数组 (平方米)
+        heights: 树高数组 (米)
+        centroid_x, centroid_y: 树冠质心坐标数组
+    """
+    import shapely
+    from shapely.geometry import shape
+    
+    # 解析多边形几何，跳过无法解析的树冠
+    geoms, tree_ids, fallback_heights = [], [], []
+    for i, feature in enumerate(crown_features):
+        try:
+            geom = feature['geometry']
+            if not isinstance(geom, shapely.Geometry):
+                geom = shape(geom)
+            properties = feature['properties']
+            tree_id = properties.get('tree_id')
+            tree_ids.append(f"tree_{i+1}" if tree_id is None else str(tree_id))
+            fallback_heights.append(float(properties.get('height', 0)))
+            geoms.append(geom)
+        except Exception as e:
+            logger.warning(f"处理树冠 {i+1} 属性时出错: {str(e)}")
+    
+    geoms = np.array(geoms, dtype=object)
+    
+    # 计算树冠面积和质心坐标 (假设坐标单位为米)
+    areas = shapely.area(geoms)
+    centroids = shapely.centroid(geoms)
+    
+    # 获取树高(最大高度值)，没有有效高度值时使用属性中的高度
+    heights = zonal_max_height(geoms, chm_src, dem_src).astype(np.float64)
+    missing = np.isnan(heights)
+    heights[missing] = np.asarray(fallback_heights, dtype=np.float64)[missing]
+    
+    return tree_ids, areas, heights, shapely.get_x(centroids), shapely.get_y(centroids)
+
 def calculate_tree_attributes(crown_features, chm_src, dem_src=None, a=0.05, b=2.0, c=1.0, carbon_factor=0.5):
     """
     计算每棵树的属性和碳储量
@@ -83,171 +403,279 @@ def calculate_tree_attributes(crown_features, chm_src, dem_src=None, a=0.05, b=2
         carbon_factor: 生物量到碳的转换因子
     
     Returns:
-        tree_attributes: 包含树木属性的列表
+        tree_table: TreeTable
+    """
+    tree_ids, areas, heights, centroid_x, centroid_y = measure_crowns(crown_features, chm_src, dem_src)
+    return build_tree_attributes(tree_ids, areas, heights, centroid_x, centroid_y, a, b, c, carbon_factor)
+
+def measure_label_crowns(labels, chm, transform, chm_nodata=None, dem=None, dem_nodata=None, fallback_heights=None):
     """
-    tree_attributes = []
+    直接基于树冠标签图像测量每个树冠的面积、树高和质心，无需多边形和重新栅格化
     
-    for i, feature in enumerate(crown_features):
-        try:
-            # 获取多边形几何和ID
-            geom = shape(feature['geometry'])
-            tree_id = feature['properties'].get('tree_id', f"tree_{i+1}")
-            
-            # 计算树冠面积和等效直径
-            area_m2 = geom.area  # 假设坐标单位为米
-            crown_diameter = 2 * math.sqrt(area_m2 / math.pi)  # 等效直径
-            
-            # 获取质心坐标
-            centroid = geom.centroid
-            cx, cy = centroid.x, centroid.y
-            
-            # 提取CHM值
-            chm_masked, _ = mask(chm_src, [geom], crop=True, filled=True, nodata=chm_src.nodata or 0)
-            chm_values = chm_masked[0].astype('float32')
-            chm_values[chm_values == (chm_src.nodata or 0)] = np.nan
-            
-            # 如果提供了DEM，则计算相对高度，否则直接使用CHM
-            if dem_src is not None:
-                dem_masked, _ = mask(dem_src, [geom], crop=True, filled=True, nodata=dem_src.nodata or 0)
-                dem_values = dem_masked[0].astype('float32')
-                dem_values[dem_values == (dem_src.nodata or 0)] = np.nan
-                
-                # 计算相对高度 (CHM - DEM)
-                height_values = chm_values - dem_values
-            else:
-                height_values = chm_values
-            
-            # 获取树高(最大高度值)
-            if np.any(~np.isnan(height_values)):
-                height = float(np.nanmax(height_values))
-            else:
-                # 如果没有有效高度值，尝试使用属性中的高度
-                height = float(feature['properties'].get('height', 0))
-            
-            # 估算胸径(DBH) - 使用冠幅与胸径的经验关系
-            # 可以根据需要调整这个关系，这里使用简单的线性关系
-            dbh_cm = 10 * crown_diameter  # 简化假设: DBH (cm) = 10 * 冠幅直径 (m)
-            
-            # 计算生物量 (kg)
-            # 使用异速生长方程: M = a * (DBH^b) * (Height^c)
-            biomass_kg = a * (dbh_cm ** b) * (height ** c)
-            
-            # 计算碳储量 (kg)
-            carbon_kg = biomass_kg * carbon_factor
-            
-            # 将属性添加到结果列表
-            tree_attributes.append({
-                'tree_id': tree_id,
-                'height_m': height,
-                'crown_diameter_m': crown_diameter,
-                'crown_area_m2': area_m2,
-                'dbh_cm': dbh_cm,
-                'biomass_kg': biomass_kg,
-                'carbon_kg': carbon_kg,
-                'centroid_x': cx,
-                'centroid_y': cy
-            })
-            
-        except Exception as e:
-            logger.warning(f"处理树冠 {i+1} 属性时出错: {str(e)}")
+    面积、质心和最大高度均由按标签的 bincount 向量化统计得到；
+    对由像素边界构成的树冠多边形，结果与基于多边形的计算一致
     
-    logger.info(f"成功计算 {len(tree_attributes)} 棵树的属性和碳储量")
-    return tree_attributes
+    Args:
+        labels: 树冠标签图像 (标签值为树顶序号+1，0为背景)
+        chm: 与标签图像对齐的CHM数组
+        transform: 栅格数据的仿射变换
+        chm_nodata: CHM的无效值
+        dem: 与CHM对齐的DEM数组(可选)
+        dem_nodata: DEM的无效值
+        fallback_heights: 树顶高度数组，树冠内没有有效高度值时使用
+    
+    Returns:
+        tree_ids: 树木编号数组 (标签值)
+        areas, heights, centroid_x, centroid_y: 同 measure_crowns
+    """
+    flat = labels.ravel()
+    inside = np.flatnonzero(flat)
+    ids = flat[inside].astype(np.int64)
+    n = int(ids.max()) if len(ids) else 0
+    
+    # 按标签统计像素数和行列坐标之和
+    count = np.bincount(ids, minlength=n + 1)
+    rows, cols = np.divmod(inside, labels.shape[1])
+    sum_rows = np.bincount(ids, weights=rows, minlength=n + 1)
+    sum_cols = np.bincount(ids, weights=cols, minlength=n + 1)
+    
+    # 按标签统计最大高度
+    height_values = _nodata_to_nan(chm, chm_nodata).ravel()[inside]
+    if dem is not None:
+        height_values -= _nodata_to_nan(dem, dem_nodata).ravel()[inside]
+    valid = ~np.isnan(height_values)
+    max_height = np.full(n + 1, -np.inf, dtype=np.float32)
+    np.maximum.at(max_height, ids[valid], height_values[valid])
+    
+    present = np.nonzero(count[1:])[0] + 1
+    count = count[present]
+    
+    # 面积 = 像素数 * 像元面积；质心 = 像元中心坐标的均值
+    areas = count * abs(transform.a * transform.e - transform.b * transform.d)
+    centroid_x, centroid_y = transform * (sum_cols[present] / count + 0.5,
+                                          sum_rows[present] / count + 0.5)
+    
+    heights = max_height[present].astype(np.float64)
+    missing = np.isneginf(heights)
+    if fallback_heights is not None:
+        heights[missing] = np.asarray(fallback_heights, dtype=np.float64)[present[missing] - 1]
+    else:
+        heights[missing] = 0.0
+    
+    return present, areas, heights, centroid_x, centroid_y
 
-def write_csv(tree_attributes, output_path):
+def calculate_label_attributes(labels, chm, transform, chm_nodata=None, dem=None, dem_nodata=None,
+                               fallback_heights=None, a=0.05, b=2.0, c=1.0, carbon_factor=0.5):
     """
-    将树木属性写入CSV文件
+    直接基于树冠标签图像计算每棵树的属性和碳储量 (测量见 measure_label_crowns)
     
     Args:
-        tree_attributes: 树木属性列表
-        output_path: 输出CSV文件路径
+        labels: 树冠标签图像 (标签值为树顶序号+1，0为背景)
+        chm: 与标签图像对齐的CHM数组
+        transform: 栅格数据的仿射变换
+        chm_nodata: CHM的无效值
+        dem: 与CHM对齐的DEM数组(可选)
+        dem_nodata: DEM的无效值
+        fallback_heights: 树顶高度数组，树冠内没有有效高度值时使用
+        a, b, c: 生物量模型参数
+        carbon_factor: 生物量到碳的转换因子
+    
+    Returns:
+        tree_table: TreeTable
+    """
+    measurements = measure_label_crowns(labels, chm, transform, chm_nodata, dem, dem_nodata, fallback_heights)
+    return build_tree_attributes(*measurements, a, b, c, carbon_factor)
+
+def _csv_lines(chunk):
+    """
+    将一个属性分块格式化为CSV文本：各列整列转换为字符串后逐行拼接，
+    编号恢复为 "tree_<n>"，float32列输出最短的可还原表示 (float64列的 repr 转换更快)
+    """
+    fields = [chunk.tree_ids()]
+    for name in CSV_FIELDS[1:]:
+        values = chunk[name]
+        if values.dtype == np.float64:
+            fields.append(list(map(repr, values.tolist())))
+        else:
+            fields.append(values.astype(str).tolist())
+    return ''.join(line + '\r\n' for line in map(','.join, zip(*fields)))
+
+def _table_batch(chunk):
+    """将一个属性分块转换为列式输出的 (列, 质心点几何) 批次"""
+    return chunk.to_columns(), chunk.points()
+
+def _as_table(tree_attributes):
+    """属性表：TreeTable 原样返回，每棵树一个字典的列表转换为 TreeTable"""
+    if isinstance(tree_attributes, TreeTable):
+        return tree_attributes
+    return TreeTable.from_records(tree_attributes)
+
+def write_attribute_chunks(chunks, output_path, crs=None):
+    """
+    逐块写出树木属性，每个分块计算后立即写出，内存占用与树木总数无关
+    格式由扩展名决定：CSV，或以质心为点几何的 GeoParquet/FlatGeobuf
+    (列式格式中树木编号为整数列，属性为float32，质心坐标为float64)
+    
+    Args:
+        chunks: TreeTable 分块的可迭代对象 (见 iter_attribute_chunks)
+        output_path: 输出文件路径 (.csv / .parquet / .fgb)
+        crs: 坐标系 (列式格式)
     """
     try:
-        fieldnames = [
-            'tree_id', 
-            'height_m', 
-            'crown_diameter_m', 
-            'crown_area_m2', 
-            'dbh_cm', 
-            'biomass_kg', 
-            'carbon_kg', 
-            'centroid_x', 
-            'centroid_y'
-        ]
-        
-        with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for tree in tree_attributes:
-                writer.writerow(tree)
+        if vector_io.format_from_path(output_path) == 'csv':
+            with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
+                csvfile.write(','.join(CSV_FIELDS) + '\r\n')
+                for chunk in chunks:
+                    csvfile.write(_csv_lines(chunk))
+        else:
+            vector_io.write_table_batches(output_path, map(_table_batch, chunks), crs)
         
         logger.info(f"属性数据已保存至: {output_path}")
     except Exception as e:
-        logger.error(f"写入CSV文件失败: {str(e)}")
+        logger.error(f"写入属性文件失败: {str(e)}")
         raise
 
+def write_csv(tree_attributes, output_path):
+    """
+    将树木属性写入CSV文件
+    
+    Args:
+        tree_attributes: TreeTable (或树木属性字典列表)
+        output_path: 输出CSV文件路径
+    """
+    write_attribute_chunks(_as_table(tree_attributes).chunks(ATTRIBUTE_CHUNK_SIZE), output_path)
+
+def write_attributes(tree_attributes, output_path, crs=None):
+    """
+    按输出文件扩展名写出树木属性：CSV，或以质心为点几何的 GeoParquet/FlatGeobuf
+    
+    Args:
+        tree_attributes: TreeTable (或树木属性字典列表)
+        output_path: 输出文件路径 (.csv / .parquet / .fgb)
+        crs: 坐标系 (列式格式)
+    """
+    write_attribute_chunks(_as_table(tree_attributes).chunks(ATTRIBUTE_CHUNK_SIZE), output_path, crs)
+
 def calculate_summary(tree_attributes):
     """
     计算碳储量的汇总统计信息
     
     Args:
-        tree_attributes: 树木属性列表
+        tree_attributes: TreeTable (或树木属性字典列表)
     
     Returns:
         summary: 包含总碳储量和统计的字典
     """
-    summary = {
-        'total_trees': len(tree_attributes),
-        'total_carbon_kg': 0,
-        'total_biomass_kg': 0,
-        'total_crown_area_m2': 0,
-        'mean_height_m': 0,
-        'mean_dbh_cm': 0,
-        'mean_carbon_kg': 0
-    }
-    
-    if not tree_attributes:
-        return summary
-    
-    # 计算总计值
-    heights = []
-    dbhs = []
-    carbon_values = []
-    
-    for tree in tree_attributes:
-        summary['total_carbon_kg'] += tree['carbon_kg']
-        summary['total_biomass_kg'] += tree['biomass_kg']
-        summary['total_crown_area_m2'] += tree['crown_area_m2']
+    return _as_table(tree_attributes).summary()
+
+def tree_table_path(attributes_path):
+    """属性表输出对应的单株属性表 (TreeTable .npy) 路径"""
+    return os.path.splitext(attributes_path)[0] + '.npy'
+
+def stream_tree_attributes(measurements, output_path=None, a=0.05, b=2.0, c=1.0, carbon_factor=0.5,
+                           crs=None, chunk_size=ATTRIBUTE_CHUNK_SIZE, table_path=None):
+    """
+    流式计算树木属性：逐块计算属性、立即写出并累积汇总统计，不保留单株属性
+    
+    Args:
+        measurements: (tree_ids, areas, heights, centroid_x, centroid_y)，见 measure_crowns
+        output_path: 属性表输出路径 (.csv / .parquet / .fgb)，为None时只计算汇总统计
+        a, b, c: 生物量模型参数
+        carbon_factor: 生物量到碳的转换因子
+        crs: 坐标系 (列式格式)
+        chunk_size: 每个分块的树木数
+        table_path: 可选，同时把各分块写入内存映射的 TreeTable (.npy，原编号副数组见 tree_table.save_ids)，
+            供重新估算碳储量时直接读取
+    
+    Returns:
+        summary: 碳储量统计摘要
+    """
+    accumulator = AttributeSummary()
+    table = None
+    if table_path is not None:
+        table = np.lib.format.open_memmap(
+            table_path + '.tmp', mode='w+', dtype=TREE_TABLE_DTYPE, shape=(len(measurements[1]),)
+        )
+    
+    id_chunks = []
+    
+    def chunks():
+        offset = 0
+        for chunk in iter_attribute_chunks(*measurements, a, b, c, carbon_factor, chunk_size):
+            accumulator.update(chunk)
+            if table is not None:
+                table[offset:offset + len(chunk)] = chunk.data
+                offset += len(chunk)
+                if chunk.ids is not None:
+                    id_chunks.append(chunk.ids)
+            yield chunk
+    
+    try:
+        if output_path is None:
+            for _ in chunks():
+                pass
+        else:
+            logger.info(f"将属性数据写入: {output_path}")
+            write_attribute_chunks(chunks(), output_path, crs)
         
-        heights.append(tree['height_m'])
-        dbhs.append(tree['dbh_cm'])
-        carbon_values.append(tree['carbon_kg'])
-    
-    # 计算平均值
-    summary['mean_height_m'] = np.mean(heights)
-    summary['mean_dbh_cm'] = np.mean(dbhs)
-    summary['mean_carbon_kg'] = np.mean(carbon_values)
-    
-    # 转换单位 - 添加吨和公顷单位的值
-    summary['total_carbon_t'] = summary['total_carbon_kg'] / 1000
-    summary['total_biomass_t'] = summary['total_biomass_kg'] / 1000
-    summary['total_crown_area_ha'] = summary['total_crown_area_m2'] / 10000
-    
-    # 计算每公顷碳密度
-    if summary['total_crown_area_ha'] > 0:
-        summary['carbon_density_t_ha'] = summary['total_carbon_t'] / summary['total_crown_area_ha']
-    else:
-        summary['carbon_density_t_ha'] = 0
+        if table is not None:
+            table.flush()
+            del table
+            os.replace(table_path + '.tmp', table_path)
+            tree_table.save_ids(table_path, np.concatenate(id_chunks) if id_chunks else None)
+    finally:
+        if table_path is not None and os.path.exists(table_path + '.tmp'):
+            os.remove(table_path + '.tmp')
+    
+    logger.info(f"成功计算 {accumulator.count} 棵树的属性和碳储量")
+    return accumulator.summary()
+
+def load_tree_table(attributes_path):
+    """
+    读取保存的单株属性表：.npy 直接读取；属性表输出 (CSV/GeoParquet/FlatGeobuf) 旁有同名 .npy 时读取该文件，
+    否则GeoParquet按列读取
+    
+    Args:
+        attributes_path: .npy 文件或属性表输出路径
+    
+    Returns:
+        table: TreeTable
+    """
+    if attributes_path.lower().endswith('.npy'):
+        return TreeTable.load(attributes_path, mmap_mode='r')
     
-    # 转换为CO2当量 (二氧化碳当量) - 碳到CO2的转换系数是 44/12 ≈ 3.67
-    summary['total_co2e_t'] = summary['total_carbon_t'] * 3.67
-    summary['co2e_density_t_ha'] = summary['carbon_density_t_ha'] * 3.67
+    table_path = tree_table_path(attributes_path)
+    if os.path.exists(table_path):
+        return TreeTable.load(table_path, mmap_mode='r')
+    if vector_io.format_from_path(attributes_path) == 'parquet':
+        return TreeTable.load(attributes_path)
+    raise FileNotFoundError(f"找不到单株属性表: {table_path}")
+
+def reprice_tree_attributes(attributes_path, models=None, a=0.05, b=2.0, c=1.0, carbon_factor=0.5):
+    """
+    按新的生物量模型重新估算碳储量：读取保存的单株树高和胸径，不再读取CHM/DEM和树冠多边形
+    一次调用可估算多个模型 (如各森林亚类的模型)，各模型的计算按矩阵广播一次完成 (见 TreeTable.reprice)
     
-    logger.info(f"计算得总碳储量: {summary['total_carbon_t']:.2f} 吨，" 
-                f"CO2当量: {summary['total_co2e_t']:.2f} 吨CO2e，" 
-                f"碳密度: {summary['carbon_density_t_ha']:.2f} tC/ha")
+    Args:
+        attributes_path: 单株属性表 (.npy) 或属性表输出路径 (见 load_tree_table)
+        models: 模型列表，每个模型为含 a、b、c、carbon_factor 的字典，可附带 name 等标识；
+            为None时使用 a、b、c、carbon_factor 参数作为单个模型
+        a, b, c: 生物量模型参数
+        carbon_factor: 生物量到碳的转换因子
     
-    return summary
+    Returns:
+        results: 每个模型一项 {'model': 模型参数, 'summary': 碳储量统计摘要}
+    """
+    try:
+        table = load_tree_table(attributes_path)
+        if models is None:
+            models = [{'a': a, 'b': b, 'c': c, 'carbon_factor': carbon_factor}]
+        
+        logger.info(f"按 {len(models)} 个生物量模型重新估算 {len(table)} 棵树的碳储量")
+        return table.reprice(models)
+    except Exception as e:
+        logger.error(f"重新估算碳储量时出错: {str(e)}")
+        raise
 
 def process_tree_attributes(
     geojson_path, 
@@ -257,21 +685,28 @@ def process_tree_attributes(
     a=0.05, 
     b=2.0, 
     c=1.0, 
-    carbon_factor=0.5
+    carbon_factor=0.5,
+    use_cache=False,
+    cache_dir=None,
+    output_format='csv'
 ):
     """
-    处理树冠多边形，计算属性和碳储量，输出CSV和统计信息
+    处理树冠多边形，计算属性和碳储量，输出属性表 (CSV/GeoParquet/FlatGeobuf) 和统计信息
+    输入文件、参数和脚本均未变化时直接返回缓存的结果；只修改生物量系数时复用缓存的单株测量结果
     
     Args:
-        geojson_path: 树冠多边形GeoJSON文件路径
+        geojson_path: 树冠多边形文件路径 (GeoJSON/GeoParquet/FlatGeobuf)
         chm_path: CHM栅格文件路径
         dem_path: DEM栅格文件路径（可选）
         output_dir: 输出目录，默认与GeoJSON同目录
         a, b, c: 生物量模型参数
         carbon_factor: 生物量到碳的转换因子
+        use_cache: 是否使用结果缓存 (默认关闭；命中和写入缓存都会复制一份输出文件)
+        cache_dir: 结果缓存目录，默认使用 result_cache.DEFAULT_CACHE_DIR
+        output_format: 属性表输出格式: 'csv'、'parquet' (GeoParquet) 或 'fgb' (FlatGeobuf)
     
     Returns:
-        csv_path: 输出的CSV文件路径
+        csv_path: 输出的属性表文件路径
         summary: 碳储量统计摘要
     """
     try:
@@ -285,42 +720,105 @@ def process_tree_attributes(
         # 获取输入文件名（不含扩展名）
         base_name = os.path.splitext(os.path.basename(geojson_path))[0]
         
+        if output_format not in vector_io.TABLE_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}，可选: {', '.join(vector_io.TABLE_FORMATS)}")
+        
         # 设置输出文件路径
-        csv_path = os.path.join(output_dir, f"{base_name}_attributes.csv")
+        extension = vector_io.FORMAT_EXTENSIONS[output_format]
+        csv_path = os.path.join(output_dir, f"{base_name}_attributes{extension}")
+        table_path = tree_table_path(csv_path)
+        cached_attributes = CACHED_ATTRIBUTES + extension
         
-        # 读取数据
-        logger.info(f"读取GeoJSON文件: {geojson_path}")
-        data, crown_features = read_geojson(geojson_path)
+        # 结果缓存键：输入文件内容哈希 + 脚本、属性表和读写模块的源码哈希 (+ 生物量系数)
+        cache = result_cache.open_cache(cache_dir) if use_cache else None
+        if cache is not None:
+            inputs = [
+                cache.file_digest(geojson_path),
+                cache.file_digest(chm_path),
+                cache.file_digest(dem_path) if dem_path else None,
+                result_cache.code_version(
+                    __file__, tree_table.__file__, vector_io.__file__, raster_interchange.__file__
+                ),
+            ]
+            measure_key = cache.key('tree_measurements', inputs)
+            result_key = cache.key(
+                'tree_attributes', inputs, [float(v) for v in (a, b, c, carbon_factor)], output_format
+            )
+            
+            entry = cache.get(result_key)
+            if entry is not None and entry.has_file(cached_attributes):
+                try:
+                    entry.restore(cached_attributes, csv_path)
+                    if entry.has_file(CACHED_TABLE):
+                        entry.restore(CACHED_TABLE, table_path)
+                    if entry.has_file(CACHED_TABLE_IDS):
+                        entry.restore(CACHED_TABLE_IDS, tree_table.ids_path(table_path))
+                    else:
+                        tree_table.save_ids(table_path, None)
+                    logger.info("使用缓存的计算结果")
+                    return csv_path, entry.meta['summary']
+                except OSError:
+                    # 条目在复制时被其他进程淘汰，按未命中处理
+                    logger.warning("缓存条目已被淘汰，重新计算")
         
-        logger.info(f"读取CHM文件: {chm_path}")
-        chm_src = read_raster(chm_path)
+        # 单株测量结果与生物量系数无关，只修改系数时复用缓存的面积、树高和质心
+        measurements = None
+        entry = cache.get(measure_key) if cache is not None else None
+        if entry is not None:
+            try:
+                arrays = entry.arrays()
+                measurements = (
+                    arrays['tree_ids'], arrays['areas'], arrays['heights'],
+                    arrays['centroid_x'], arrays['centroid_y']
+                )
+                logger.info("使用缓存的单株测量结果")
+            except (OSError, KeyError):
+                logger.warning("缓存条目已被淘汰，重新计算")
         
-        dem_src = None
-        if dem_path:
-            logger.info(f"读取DEM文件: {dem_path}")
-            dem_src = read_raster(dem_path)
+        if measurements is None:
+            # 读取数据
+            logger.info(f"读取GeoJSON文件: {geojson_path}")
+            data, crown_features = read_geojson(geojson_path)
+            
+            logger.info(f"读取CHM文件: {chm_path}")
+            chm_src = read_raster(chm_path)
+            
+            dem_src = None
+            if dem_path:
+                logger.info(f"读取DEM文件: {dem_path}")
+                dem_src = read_raster(dem_path)
+            
+            try:
+                measurements = measure_crowns(crown_features, chm_src, dem_src)
+            finally:
+                # 关闭栅格数据源
+                chm_src.close()
+                if dem_src:
+                    dem_src.close()
+            
+            if cache is not None:
+                cache.put(measure_key, arrays=dict(zip(MEASUREMENT_FIELDS, map(np.asarray, measurements))))
+        
+        # 写出属性表，列式格式记录CHM的坐标系
+        crs = None
+        if output_format != 'csv':
+            with read_raster(chm_path) as src:
+                crs = src.crs
         
-        # 计算树木属性
+        # 逐块计算树木属性、写出属性表并累积统计摘要；同时保存单株属性表，供更换生物量模型时重新估算
         logger.info(f"开始计算树木属性，使用生物量系数a={a}, b={b}, c={c}, 碳因子={carbon_factor}")
-        tree_attributes = calculate_tree_attributes(
-            crown_features, chm_src, dem_src, a, b, c, carbon_factor
+        summary = stream_tree_attributes(
+            measurements, csv_path, a, b, c, carbon_factor, crs, table_path=table_path
         )
         
-        # 计算统计摘要
-        logger.info("计算碳储量统计摘要")
-        summary = calculate_summary(tree_attributes)
-        
-        # 将属性写入CSV
-        logger.info(f"将属性数据写入CSV: {csv_path}")
-        write_csv(tree_attributes, csv_path)
-        
-        # 关闭栅格数据源
-        chm_src.close()
-        if dem_src:
-            dem_src.close()
+        if cache is not None:
+            files = {cached_attributes: csv_path, CACHED_TABLE: table_path}
+            if os.path.exists(tree_table.ids_path(table_path)):
+                files[CACHED_TABLE_IDS] = tree_table.ids_path(table_path)
+            cache.put(result_key, files=files, meta={'summary': summary})
         
         return csv_path, summary
-        
+    
     except Exception as e:
         logger.error(f"处理树木属性时出错: {str(e)}")
         raise
@@ -328,18 +826,47 @@ def process_tree_attributes(
 def main():
     """命令行入口函数"""
     parser = argparse.ArgumentParser(description='从树冠多边形、CHM和DEM中提取树木属性和计算碳储量')
-    parser.add_argument('--geojson', '-i', required=True, help='输入树冠多边形GeoJSON文件路径')
-    parser.add_argument('--chm', required=True, help='输入冠层高度模型CHM栅格文件路径')
+    parser.add_argument('--geojson', '-i', help='输入树冠多边形文件路径 (GeoJSON/GeoParquet/FlatGeobuf)')
+    parser.add_argument('--chm', help='输入冠层高度模型CHM栅格文件路径')
     parser.add_argument('--dem', help='输入数字高程模型DEM栅格文件路径（可选）')
     parser.add_argument('--output-dir', '-o', help='输出目录路径')
     parser.add_argument('--a', type=float, default=0.05, help='生物量模型系数a（默认: 0.05）')
     parser.add_argument('--b', type=float, default=2.0, help='生物量模型指数b（胸径）（默认: 2.0）')
     parser.add_argument('--c', type=float, default=1.0, help='生物量模型指数c（树高）（默认: 1.0）')
     parser.add_argument('--carbon-factor', type=float, default=0.5, help='碳转换因子（默认: 0.5）')
+    parser.add_argument('--format', choices=vector_io.TABLE_FORMATS, default='csv',
+                        help='属性表输出格式: csv、parquet (GeoParquet) 或 fgb (FlatGeobuf) (默认: csv)')
+    parser.add_argument('--cache', action='store_true', help='使用结果缓存，输入、参数和脚本未变化时直接复用上次的结果')
+    parser.add_argument('--cache-dir', help='结果缓存目录，指定后启用结果缓存 (默认: 系统临时目录下的 forest_result_cache)')
+    parser.add_argument('--reprice', metavar='PATH',
+                        help='按新的生物量模型重新估算已有结果：单株属性表 (.npy) 或属性表输出路径，不读取栅格')
+    parser.add_argument('--models',
+                        help='重新估算时使用的模型列表：JSON文件路径或JSON字符串 (每个模型含 a、b、c、carbon_factor)')
+    parser.add_argument('--profile-imports', action='store_true', help='输出各依赖模块的导入耗时 (标准错误)')
     
     args = parser.parse_args()
+    if args.reprice is None and not (args.geojson and args.chm):
+        parser.error('需要 --geojson 和 --chm (或使用 --reprice 重新估算已有结果)')
     
     try:
+        if args.reprice is not None:
+            models = None
+            if args.models:
+                if os.path.exists(args.models):
+                    with open(args.models, 'r', encoding='utf-8') as f:
+                        models = json.load(f)
+                else:
+                    models = json.loads(args.models)
+            
+            results = reprice_tree_attributes(
+                args.reprice, models, args.a, args.b, args.c, args.carbon_factor
+            )
+            if models is None:
+                print(f"SUMMARY: {json.dumps(results[0]['summary'])}")
+            else:
+                print(f"SUMMARIES: {json.dumps(results)}")
+            return 0
+        
         # 处理树木属性
         csv_path, summary = process_tree_attributes(
             args.geojson,
@@ -349,7 +876,10 @@ def main():
             args.a,
             args.b,
             args.c,
-            args.carbon_factor
+            args.carbon_factor,
+            use_cache=args.cache or bool(args.cache_dir),
+            cache_dir=args.cache_dir,
+            output_format=args.format
         )
         
         # 输出结果路径和摘要
@@ -9,27 +9,48 @@
 
 import sys
 import os
-import json
 import argparse
+import tempfile
+import logging
+from collections import OrderedDict
+
+# 命令行传入 --profile-imports 时，在导入依赖之前开始记录导入耗时
+if __name__ == "__main__":
+    import import_profiler
+    import_profiler.enable_if_requested()
+
+# 读取CHM所需的轻量依赖；scipy、scikit-image、shapely和matplotlib在用到的函数中按需导入
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import rasterio
 from rasterio import features
-from rasterio.transform import xy
-from shapely.geometry import shape, mapping, Point
-from scipy import ndimage as ndi
-from skimage.feature import peak_local_max
-from skimage.segmentation import watershed
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-import logging
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+
+import raster_interchange
+import result_cache
+import vector_io
+from vector_io import FORMAT_EXTENSIONS, FEATURE_FORMATS, crown_geometries, write_features
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 分块处理的默认参数 (像素)
+DEFAULT_TILE_SIZE = 1024
+DEFAULT_CROWN_RADIUS = 20
+
+# 可变窗口树顶检测：高度分箱宽度 (米)，以及树高-冠幅模型系数 (冠幅 = a + b * 树高², 米)
+HEIGHT_BIN_SIZE = 0.5
+CROWN_WIDTH_INTERCEPT = 2.51503
+CROWN_WIDTH_QUADRATIC = 0.00901
+
+# 结果缓存中的文件名 (树冠要素文件的扩展名随输出格式变化)
+CACHED_FEATURES = 'trees'
+CACHED_VISUALIZATION = 'trees.png'
+
 def read_chm(chm_path):
     """
-    读取CHM GeoTIFF文件
+    读取CHM GeoTIFF文件；存在可用的内存映射中间数组时直接映射，不再解码GeoTIFF
     
     Args:
         chm_path: CHM文件路径
@@ -41,7 +62,7 @@ def read_chm(chm_path):
         meta: 元数据
     """
     try:
-        with rasterio.open(chm_path) as src:
+        with raster_interchange.open_raster(chm_path) as src:
             chm = src.read(1)  # 读取第一个波段
             transform = src.transform
             crs = src.crs
@@ -50,7 +71,7 @@ def read_chm(chm_path):
             # 检查数据有效性
             if np.all(chm == 0) or np.all(np.isnan(chm)):
                 raise ValueError("CHM数据无效，可能全为0或NaN")
-                
+            
             logger.info(f"成功读取CHM, 形状: {chm.shape}, 范围: [{np.nanmin(chm)}, {np.nanmax(chm)}]")
             
             return chm, transform, crs, meta
@@ -58,28 +79,46 @@ def read_chm(chm_path):
         logger.error(f"读取CHM文件失败: {str(e)}")
         raise
 
-def preprocess_chm(chm, min_height=2.0, smooth_sigma=1.0):
+def chm_crs(chm_path):
+    """读取CHM的坐标系 (只读取头信息)"""
+    with raster_interchange.open_raster(chm_path) as src:
+        return src.crs
+
+def smooth_chm(chm, smooth_sigma=1.0):
     """
-    预处理CHM数据，包括平滑和高度阈值过滤
+    将NaN替换为0并进行高斯平滑；结果与高度阈值无关，调整阈值时可以复用
     
     Args:
         chm: CHM数组
-        min_height: 最小树高阈值，低于此值的像素被视为非树区域
-        smooth_sigma: 高斯平滑的标准差
+        smooth_sigma: 高斯平滑的标准差，不大于0时不平滑
     
     Returns:
-        processed_chm: 处理后的CHM
-        mask: 树木区域掩膜 (True表示树木区域)
+        chm_smoothed: 平滑后的CHM
     """
+    from scipy import ndimage as ndi
+    
     # 处理NaN值
     chm_cleaned = np.nan_to_num(chm, nan=0.0)
     
     # 高斯平滑以减少噪声
     if smooth_sigma > 0:
-        chm_smoothed = ndi.gaussian_filter(chm_cleaned, sigma=smooth_sigma)
-    else:
-        chm_smoothed = chm_cleaned
-        
+        return ndi.gaussian_filter(chm_cleaned, sigma=smooth_sigma)
+    return chm_cleaned
+
+def threshold_chm(chm_smoothed, min_height=2.0):
+    """
+    按高度阈值生成树木区域掩膜，并将掩膜外的像素置0
+    
+    Args:
+        chm_smoothed: 平滑后的CHM
+        min_height: 最小树高阈值，低于此值的像素被视为非树区域
+    
+    Returns:
+        processed_chm: 处理后的CHM
+        mask: 树木区域掩膜 (True表示树木区域)
+    """
+    from scipy import ndimage as ndi
+    
     # 创建树木区域掩膜 (高于min_height的区域)
     mask = chm_smoothed > min_height
     
@@ -94,77 +133,320 @@ def preprocess_chm(chm, min_height=2.0, smooth_sigma=1.0):
     
     return processed_chm, mask
 
-def detect_tree_tops(chm, mask, min_distance=5, min_height=2.0):
+def preprocess_chm(chm, min_height=2.0, smooth_sigma=1.0):
     """
-    使用局部极大值检测树顶
+    预处理CHM数据，包括平滑和高度阈值过滤
     
     Args:
         chm: CHM数组
+        min_height: 最小树高阈值，低于此值的像素被视为非树区域
+        smooth_sigma: 高斯平滑的标准差
+    
+    Returns:
+        processed_chm: 处理后的CHM
+        mask: 树木区域掩膜 (True表示树木区域)
+    """
+    return threshold_chm(smooth_chm(chm, smooth_sigma), min_height)
+
+def crown_window_radius(pixel_size, min_distance=5, intercept=CROWN_WIDTH_INTERCEPT, quadratic=CROWN_WIDTH_QUADRATIC):
+    """
+    由树高-冠幅关系 (冠幅 = intercept + quadratic * 树高², 单位米) 构建可变搜索窗口半径函数
+    
+    Args:
+        pixel_size: 像元大小 (米)
+        min_distance: 最小窗口半径 (像素)
+        intercept, quadratic: 冠幅模型系数
+    
+    Returns:
+        window_radius: 输入高度数组 (米)、返回窗口半径 (像素) 的函数
+    """
+    def window_radius(heights):
+        crown_width = intercept + quadratic * np.square(heights)
+        return np.maximum(min_distance, np.rint(crown_width / 2 / pixel_size))
+    return window_radius
+
+def crown_radius_limit(pixel_size, crown_radius=DEFAULT_CROWN_RADIUS, min_distance=5,
+                       intercept=CROWN_WIDTH_INTERCEPT, quadratic=CROWN_WIDTH_QUADRATIC):
+    """
+    由树高-冠幅关系构建分水岭分割的最大树冠半径函数：以模型冠幅 (直径) 作为半径上限，
+    为模型残差留出一倍余量，并限制在 [min_distance, crown_radius] 之间
+    
+    Args:
+        pixel_size: 像元大小 (米)
+        crown_radius: 最大树冠半径上限 (像素)
+        min_distance: 最大树冠半径下限 (像素)
+        intercept, quadratic: 冠幅模型系数
+    
+    Returns:
+        max_radius: 输入高度数组 (米)、返回最大树冠半径 (像素) 的函数
+    """
+    def max_radius(heights):
+        crown_width = intercept + quadratic * np.square(heights)
+        return np.clip(np.rint(crown_width / pixel_size), min_distance, crown_radius)
+    return max_radius
+
+def _window_max_at(chm, rows, cols, radius):
+    """
+    计算指定点处 (2*radius+1) 方窗内的最大值
+    逐级构建倍增的块最大值 (第k级为 2^k × 2^k 块的最大值，每级由上一级的4个块合并)，
+    任意窗口的最大值由4个相互重叠的块查表得到；窗口超出影像边界的点直接截取窗口计算
+    
+    Args:
+        chm: CHM数组
+        rows, cols: 点的行列号
+        radius: 每个点的窗口半径 (像素)
+    
+    Returns:
+        window_max: 每个点的窗口最大值
+    """
+    height, width = chm.shape
+    window_max = np.empty(len(rows), dtype=chm.dtype)
+    
+    # 窗口超出边界的点逐个计算 (只有影像边缘附近的少量点)
+    border = (rows < radius) | (cols < radius) | (rows + radius >= height) | (cols + radius >= width)
+    for i in np.flatnonzero(border):
+        r, c, w = rows[i], cols[i], radius[i]
+        window_max[i] = chm[max(r - w, 0):r + w + 1, max(c - w, 0):c + w + 1].max()
+    
+    interior = np.flatnonzero(~border)
+    if len(interior) == 0:
+        return window_max
+    
+    size = 2 * radius[interior] + 1
+    level_of = np.floor(np.log2(size)).astype(np.int64)
+    
+    level = chm
+    for k in range(1, int(level_of.max()) + 1):
+        half = 1 << (k - 1)
+        merged = np.maximum(level[:-half, :-half], level[half:, :-half])
+        np.maximum(merged, level[:-half, half:], out=merged)
+        np.maximum(merged, level[half:, half:], out=merged)
+        level = merged
+        
+        selected = level_of == k
+        if not selected.any():
+            continue
+        index = interior[selected]
+        top = rows[index] - radius[index]
+        left = cols[index] - radius[index]
+        offset = size[selected] - (1 << k)
+        window_max[index] = np.maximum(
+            np.maximum(level[top, left], level[top + offset, left]),
+            np.maximum(level[top, left + offset], level[top + offset, left + offset])
+        )
+    
+    return window_max
+
+def _ensure_spacing(rows, cols, heights, radii):
+    """
+    去除平顶上的重复极大值：候选点按 (高度从高到低, 栅格顺序) 依次贪心保留，
+    距已保留树顶 (切比雪夫距离) 小于窗口半径的等高候选点被舍弃，与 peak_local_max 的 ensure_spacing 一致
+    (高度不同的候选点不可能位于对方窗口内，只需处理等高的点对)
+    
+    Returns:
+        keep: 布尔数组，与候选点一一对应
+    """
+    from scipy.sparse import csr_matrix
+    from scipy.spatial import cKDTree
+    
+    n = len(rows)
+    keep = np.ones(n, dtype=bool)
+    coords = np.column_stack([rows, cols])
+    pairs = cKDTree(coords).query_pairs(r=int(radii.max()), p=np.inf, output_type='ndarray')
+    if len(pairs) == 0:
+        return keep
+    
+    i, j = pairs[:, 0], pairs[:, 1]
+    distance = np.abs(coords[i] - coords[j]).max(axis=1)
+    tie = (heights[i] == heights[j]) & (distance < np.minimum(radii[i], radii[j]))
+    if not tie.any():
+        return keep
+    i, j = i[tie], j[tie]
+    
+    # 只有参与等高点对的候选点需要逐个处理，按贪心顺序排列
+    graph = csr_matrix(
+        (np.ones(2 * len(i), dtype=np.int8), (np.concatenate([i, j]), np.concatenate([j, i]))), shape=(n, n)
+    )
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.argsort(-heights, kind='stable')] = np.arange(n)
+    nodes = np.unique(np.concatenate([i, j]))
+    nodes = nodes[np.argsort(rank[nodes])]
+    
+    for node in nodes:
+        if keep[node]:
+            keep[graph.indices[graph.indptr[node]:graph.indptr[node + 1]]] = False
+    return keep
+
+def detect_tree_tops(chm, mask, min_distance=5, min_height=2.0, window_radius=None, bin_size=HEIGHT_BIN_SIZE):
+    """
+    使用可变窗口局部极大值检测树顶
+    
+    按高度分箱预先计算窗口半径 (高树冠幅大、窗口大)。先用可分离的一维最大值滤波 (先按列、再按行)
+    求最小窗口的局部极大值，耗时与像素数成线性；较大窗口的极大值一定也是最小窗口的极大值，
+    因此只在这些候选点上用倍增块最大值查表复核，最后按 peak_local_max 的贪心规则去除平顶上的重复极大值。
+    window_radius 为空时所有高度使用 min_distance，结果与 peak_local_max(min_distance=min_distance) 一致
+    
+    Args:
+        chm: CHM数组 (掩膜外像素应已置0，threshold_chm 的输出满足)
         mask: 树木区域掩膜
-        min_distance: 局部极大值之间的最小距离 (像素)
+        min_distance: 局部极大值之间的最小距离 (像素)，即固定窗口半径
         min_height: 最小树高阈值
+        window_radius: 可选，输入高度数组 (米)、返回窗口半径 (像素) 的函数，见 crown_window_radius
+        bin_size: 高度分箱宽度 (米)
     
     Returns:
-        tree_tops: 包含树顶坐标的数组 (行,列)
+        tree_tops: 包含树顶坐标的数组 (行,列)，按高度从高到低排列
         tree_heights: 每个树顶对应的高度值
     """
-    # 确保CHM掩膜区域之外的值不会被检测为树顶
-    chm_masked = chm.copy()
-    chm_masked[~mask] = 0
-    
-    # 使用局部极大值找出树顶点
-    coordinates = peak_local_max(
-        chm_masked, 
-        min_distance=min_distance,
-        threshold_abs=min_height,
-        exclude_border=False,
-        indices=True
-    )
+    from scipy import ndimage as ndi
+    
+    # 掩膜外仍有正值时才复制一份CHM并置0，避免掩膜外像素压制掩膜内的极大值
+    if chm.max(initial=0, where=~mask) > 0:
+        chm = np.where(mask, chm, 0)
+    
+    # 每个高度分箱的窗口半径
+    if window_radius is None:
+        bin_radii = np.array([int(min_distance)])
+    else:
+        centers = np.arange(min_height, float(chm.max(initial=min_height)) + bin_size, bin_size) + bin_size / 2
+        bin_radii = np.maximum(np.asarray(window_radius(centers), dtype=np.int64), 1)
+    base_radius = int(bin_radii.min())
+    
+    # 最小窗口的局部极大值：掩膜内、高于阈值、且等于窗口内的最大值
+    size = 2 * base_radius + 1
+    window_max = ndi.maximum_filter1d(chm, size, axis=0, mode='nearest')
+    window_max = ndi.maximum_filter1d(window_max, size, axis=1, mode='nearest')
+    rows, cols = np.nonzero(mask & (chm > min_height) & (chm == window_max))
+    del window_max
     
     # 如果没有检测到树顶
-    if len(coordinates) == 0:
+    if len(rows) == 0:
         logger.warning("未检测到树顶，请检查CHM质量或调整参数")
         return np.array([]), np.array([])
     
-    # 获取树顶高度
-    tree_heights = np.array([chm_masked[r, c] for r, c in coordinates])
+    # 按高度分箱查出每个候选点的窗口半径，在更大的窗口内复核
+    heights = chm[rows, cols]
+    bins = np.clip(((heights - min_height) / bin_size).astype(np.int64), 0, len(bin_radii) - 1)
+    radii = bin_radii[bins]
+    larger = np.flatnonzero(radii > base_radius)
+    if len(larger):
+        is_max = _window_max_at(chm, rows[larger], cols[larger], radii[larger]) <= heights[larger]
+        keep = np.ones(len(rows), dtype=bool)
+        keep[larger[~is_max]] = False
+        rows, cols, heights, radii = rows[keep], cols[keep], heights[keep], radii[keep]
+    
+    keep = _ensure_spacing(rows, cols, heights, radii)
+    rows, cols, heights = rows[keep], cols[keep], heights[keep]
+    
+    # 与 peak_local_max 一致，按高度从高到低排列 (等高时保持栅格顺序)
+    order = np.argsort(-heights, kind='stable')
+    coordinates = np.column_stack([rows[order], cols[order]])
+    tree_heights = heights[order]
     
     logger.info(f"检测到 {len(coordinates)} 个树顶点")
     
     return coordinates, tree_heights
 
-def segment_crowns(chm, tree_tops, mask, use_markers=True):
+def label_dtype(count):
+    """标签栅格的数据类型：树木数量小于65535时使用uint16，否则使用uint32"""
+    return np.uint16 if count < np.iinfo(np.uint16).max else np.uint32
+
+def _crown_reach(mask, tree_tops, radii):
+    """
+    将树木区域掩膜限制在各树顶 (2r+1) 方形邻域的并集内，每种半径用两次可分离最大值滤波扩张一次
+    
+    Returns:
+        reach: 布尔数组
+    """
+    from scipy import ndimage as ndi
+    
+    reach = np.zeros(mask.shape, dtype=bool)
+    seeds = np.zeros(mask.shape, dtype=np.uint8)
+    grown = np.empty_like(seeds)
+    for radius in np.unique(radii):
+        selected = radii == radius
+        seeds[:] = 0
+        seeds[tree_tops[selected, 0], tree_tops[selected, 1]] = 1
+        size = 2 * int(radius) + 1
+        ndi.maximum_filter1d(seeds, size, axis=0, output=grown, mode='constant')
+        ndi.maximum_filter1d(grown, size, axis=1, output=seeds, mode='constant')
+        reach |= seeds.view(bool)
+    del seeds, grown
+    
+    reach &= mask
+    return reach
+
+def _clip_crown_radius(labels, tree_tops, radii, strip_height=256):
+    """将到所属树顶的距离超过该树最大树冠半径的像素置为背景 (按行条带处理，限制临时数组大小)"""
+    top_rows = tree_tops[:, 0].astype(np.int64)
+    top_cols = tree_tops[:, 1].astype(np.int64)
+    limit = np.square(radii.astype(np.int64))
+    
+    for row_off in range(0, labels.shape[0], strip_height):
+        strip = labels[row_off:row_off + strip_height]
+        rows, cols = np.nonzero(strip)
+        index = strip[rows, cols].astype(np.int64) - 1
+        far = np.square(rows + row_off - top_rows[index]) + np.square(cols - top_cols[index]) > limit[index]
+        strip[rows[far], cols[far]] = 0
+
+def segment_crowns(chm, tree_tops, mask, use_markers=True, max_radius=None, tree_heights=None, compactness=0.0):
     """
     使用分水岭算法分割树冠
     
+    标签栅格按树木数量使用uint16或uint32；CHM原地取负后泛洪、完成后恢复，不另外复制。
+    指定最大树冠半径时，泛洪限制在各树顶方形邻域的并集内，
+    分割后再把超出所属树顶半径 (欧氏距离) 的像素置为背景，避免树冠越过林窗无限扩张
+    
     Args:
         chm: CHM数组
         tree_tops: 树顶坐标 (行,列)
         mask: 树木区域掩膜
         use_markers: 是否使用树顶作为标记
+        max_radius: 最大树冠半径 (像素)：整数，或输入树顶高度数组、返回半径的函数；为空时不限制
+        tree_heights: 树顶高度，max_radius 为函数时使用，默认取树顶处的CHM值
+        compactness: 紧凑分水岭参数，大于0时树冠形状更规则
     
     Returns:
         labels: 分割后的标签图像 (每个像素值表示所属的树冠ID)
     """
+    from skimage.segmentation import watershed
+    
     # 如果没有检测到树顶，返回空标签图
     if len(tree_tops) == 0:
         logger.warning("没有树顶点，无法进行分水岭分割")
-        return np.zeros_like(chm, dtype=np.int32)
+        return np.zeros(chm.shape, dtype=np.uint16)
+    
+    tree_tops = np.asarray(tree_tops)
     
     # 创建标记图像
-    markers = np.zeros_like(chm, dtype=np.int32)
-    for i, (r, c) in enumerate(tree_tops):
-        markers[r, c] = i + 1  # 标记从1开始
+    markers = None
+    if use_markers:
+        markers = np.zeros(chm.shape, dtype=label_dtype(len(tree_tops)))
+        markers[tree_tops[:, 0], tree_tops[:, 1]] = np.arange(1, len(tree_tops) + 1)  # 标记从1开始
     
-    # 对CHM取负值，因为分水岭算法是从低到高"填充"
-    neg_chm = -chm.copy()
+    # 每棵树的最大树冠半径，泛洪范围限制在其邻域内
+    radii = None
+    if max_radius is not None and use_markers:
+        if callable(max_radius):
+            if tree_heights is None:
+                tree_heights = chm[tree_tops[:, 0], tree_tops[:, 1]]
+            radii = np.maximum(np.asarray(max_radius(np.asarray(tree_heights)), dtype=np.int64), 1)
+        else:
+            radii = np.full(len(tree_tops), int(max_radius), dtype=np.int64)
+        mask = _crown_reach(mask, tree_tops, radii)
     
-    # 执行分水岭分割
-    if use_markers:
-        labels = watershed(neg_chm, markers, mask=mask)
-    else:
-        # 不使用标记的简化版分水岭
-        labels = watershed(neg_chm, mask=mask)
+    # 分水岭算法从低到高"填充"，因此对CHM取负；可写的浮点CHM原地取负，完成后恢复
+    in_place = chm.dtype.kind == 'f' and chm.flags.writeable
+    neg_chm = np.negative(chm, out=chm if in_place else None)
+    try:
+        # 不使用标记时为简化版分水岭
+        labels = watershed(neg_chm, markers, mask=mask, compactness=compactness)
+    finally:
+        if in_place:
+            np.negative(chm, out=chm)
+    
+    if radii is not None:
+        _clip_crown_radius(labels, tree_tops, radii)
     
     logger.info(f"分水岭分割完成，识别出 {len(np.unique(labels)) - 1} 个树冠区域")
     
@@ -183,87 +465,102 @@ def extract_crown_polygons(labels, transform, tree_tops, tree_heights):
     Returns:
         geojson: 包含树冠多边形和树顶点的GeoJSON FeatureCollection
     """
-    # 提取树冠轮廓
-    crown_shapes = []
-    for shape, value in features.shapes(
-            labels.astype(np.int32), 
-            mask=labels > 0, 
-            transform=transform,
-            connectivity=8):
-        if value > 0:  # 忽略背景 (value=0)
-            crown_shapes.append((shape, value))
+    # 提取树冠轮廓 (背景 value=0 已由掩膜排除)；rasterio不支持uint32，此时转换为int32
+    if labels.dtype != np.uint16:
+        labels = labels.astype(np.int32, copy=False)
+    crown_shapes = list(features.shapes(
+        labels,
+        mask=labels > 0,
+        transform=transform,
+        connectivity=8))
     
-    # 创建GeoJSON特征集合
-    features_list = []
+    return build_tree_geojson(crown_shapes, transform, tree_tops, tree_heights)
+
+def tree_top_coordinates(tree_tops, transform):
+    """将树顶像素坐标 (行,列) 转换为像元中心的地理坐标 (N, 2)，与 rasterio.transform.xy 一致"""
+    tree_tops = np.asarray(tree_tops, dtype=np.float64).reshape(-1, 2)
+    a, b, c, d, e, f = tuple(transform)[:6]
+    cols = tree_tops[:, 1] + 0.5
+    rows = tree_tops[:, 0] + 0.5
+    return np.column_stack([a * cols + b * rows + c, d * cols + e * rows + f])
+
+def build_tree_geojson(crown_shapes, transform, tree_tops, tree_heights):
+    """
+    由树冠形状和树顶坐标构建GeoJSON
+    树顶坐标一次性做仿射变换；树冠多边形批量构建、校验和计算面积，
+    有效多边形直接复用输入的GeoJSON几何，只有修复过的多边形重新转换
+    
+    Args:
+        crown_shapes: (几何, 标签值) 列表，几何为GeoJSON字典或Shapely对象
+        transform: 栅格数据的仿射变换
+        tree_tops: 树顶坐标 (行,列)
+        tree_heights: 树顶高度
+    
+    Returns:
+        geojson: 包含树冠多边形和树顶点的GeoJSON FeatureCollection
+    """
+    import shapely
+    from shapely.geometry import mapping
+    
+    tree_heights = np.asarray(tree_heights, dtype=np.float64).reshape(-1)
     
     # 为树顶创建点特征
-    for i, (r, c) in enumerate(tree_tops):
-        try:
-            # 将像素坐标转换为地理坐标
-            x, y = xy(transform, r, c)
-            
-            # 创建点几何特征
-            point_geom = {
-                "type": "Point",
-                "coordinates": [x, y]
-            }
-            
-            # 创建特征属性
-            props = {
-                "id": f"tree_{i+1}",
-                "height": float(tree_heights[i]),
-                "type": "tree_top"
-            }
-            
-            # 添加点特征到特征列表
-            features_list.append({
-                "type": "Feature",
-                "geometry": point_geom,
-                "properties": props
-            })
-        except Exception as e:
-            logger.error(f"处理树顶 {i+1} 时出错: {str(e)}")
+    coordinates = tree_top_coordinates(tree_tops, transform).tolist()
+    features_list = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": point},
+            "properties": {"id": f"tree_{i+1}", "height": height, "type": "tree_top"}
+        }
+        for i, (point, height) in enumerate(zip(coordinates, tree_heights.tolist()))
+    ]
     
     # 为树冠创建多边形特征
-    for i, (geom, value) in enumerate(crown_shapes):
-        try:
-            # 使用Shapely处理几何体
-            polygon = shape(geom)
-            
-            # 如果多边形无效，尝试修复
-            if not polygon.is_valid:
-                polygon = polygon.buffer(0)
-                if not polygon.is_valid:
-                    logger.warning(f"无法修复无效多边形 (ID: {value})，已跳过")
-                    continue
-            
-            # 计算面积 (平方米)
-            area = polygon.area
-            
-            # 获取对应的树顶高度
-            tree_index = value - 1  # 标签从1开始，而索引从0开始
-            if 0 <= tree_index < len(tree_heights):
-                height = float(tree_heights[tree_index])
-            else:
-                height = 0.0
-            
-            # 创建特征属性
-            props = {
+    geoms = [geom for geom, _ in crown_shapes]
+    # features.shapes 返回的标签值为浮点数，转换为整数编号
+    values = np.array([value for _, value in crown_shapes], dtype=np.float64).astype(np.int64)
+    polygons = crown_geometries(geoms)
+    
+    # 无效多边形批量用 buffer(0) 修复，仍无效的跳过
+    valid = shapely.is_valid(polygons)
+    repaired = np.flatnonzero(~valid)
+    if len(repaired):
+        polygons[repaired] = shapely.buffer(polygons[repaired], 0)
+        fixed = shapely.is_valid(polygons[repaired])
+        for value in values[repaired[~fixed]]:
+            logger.warning(f"无法修复无效多边形 (ID: {value})，已跳过")
+        repaired = repaired[fixed]
+        valid[repaired] = True
+    
+    # 计算面积 (平方米)
+    areas = shapely.area(polygons)
+    
+    # 获取对应的树顶高度 (标签从1开始，而索引从0开始)
+    tree_index = values - 1
+    has_top = (tree_index >= 0) & (tree_index < len(tree_heights))
+    heights = np.zeros(len(values))
+    heights[has_top] = tree_heights[tree_index[has_top]]
+    
+    repaired = set(repaired.tolist())
+    for i, (value, height, area) in enumerate(zip(values.tolist(), heights.tolist(), areas.tolist())):
+        if not valid[i]:
+            continue
+        
+        geom = geoms[i]
+        if i in repaired or not isinstance(geom, dict):
+            geom = mapping(polygons[i])
+        
+        features_list.append({
+            "type": "Feature",
+            "geometry": geom,
+            "properties": {
                 "id": f"crown_{value}",
                 "tree_id": f"tree_{value}",
                 "height": height,
                 "area": area,
                 "type": "tree_crown"
             }
-            
-            # 添加多边形特征到特征列表
-            features_list.append({
-                "type": "Feature",
-                "geometry": mapping(polygon),
-                "properties": props
-            })
-        except Exception as e:
-            logger.error(f"处理树冠 {value} 时出错: {str(e)}")
+        })
     
     # 创建GeoJSON FeatureCollection
     geojson = {
@@ -285,13 +582,16 @@ def create_visualization(chm, labels, tree_tops, output_path):
         tree_tops: 树顶坐标
         output_path: 输出图像路径
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+    
     # 创建彩色标签图像
     n_labels = len(np.unique(labels))
     
     # 创建一个有足够颜色的colormap
     if n_labels > 0:
         # 使用tab20颜色图，它有20种颜色
-        cmap = plt.cm.get_cmap('tab20', 20)
+        cmap = plt.get_cmap('tab20', 20)
         colors = [cmap(i % 20) for i in range(n_labels)]
         # 背景设为黑色
         colors[0] = (0, 0, 0, 1)  
@@ -328,16 +628,565 @@ def create_visualization(chm, labels, tree_tops, output_path):
     
     logger.info(f"可视化图像已保存到 {output_path}")
 
+def check_crown_radius(crown_radius, limit=None):
+    """
+    校验最大树冠半径：必须为正数，超过上限时截断到上限
+    
+    Args:
+        crown_radius: 最大树冠半径 (像素)，None表示不限制
+        limit: 可选，半径上限 (像素)：分块处理时为分块大小，整幅处理时为影像对角线长度
+    
+    Returns:
+        crown_radius: 校验后的半径，输入为None时返回None
+    """
+    if crown_radius is None:
+        return None
+    if not crown_radius > 0:
+        raise ValueError(f"最大树冠半径必须为正数: {crown_radius}")
+    if limit is not None and crown_radius > limit:
+        logger.warning(f"最大树冠半径 {crown_radius} 超过上限 {limit:g}，按上限处理")
+        crown_radius = int(np.ceil(limit))
+    return crown_radius
+
+def raster_diagonal(chm_path):
+    """CHM对角线长度 (像素，只读取头信息)，作为整幅处理时树冠半径的上限"""
+    with raster_interchange.open_raster(chm_path) as src:
+        return float(np.hypot(src.height, src.width))
+
+def compute_tile_halo(min_distance=5, smooth_sigma=1.0, crown_radius=DEFAULT_CROWN_RADIUS):
+    """
+    计算分块处理所需的重叠边缘宽度 (像素)
+    
+    边缘需覆盖树顶检测距离、树冠半径以及高斯平滑和形态学开运算的影响范围，
+    保证核心区域内的树顶和树冠与整幅处理时一致
+    
+    Args:
+        min_distance: 树顶检测的最小距离 (像素)
+        smooth_sigma: 高斯平滑参数
+        crown_radius: 最大树冠半径 (像素)
+    
+    Returns:
+        halo: 重叠边缘宽度 (像素)
+    """
+    # gaussian_filter 默认截断在 4 倍标准差处，开运算再向外影响 1 个像素
+    smooth_radius = int(4.0 * smooth_sigma + 0.5) if smooth_sigma > 0 else 0
+    return int(min_distance) + int(crown_radius) + smooth_radius + 1
+
+def iter_tiles(height, width, tile_size, halo):
+    """
+    将栅格划分为带重叠边缘的分块
+    
+    Args:
+        height: 栅格行数
+        width: 栅格列数
+        tile_size: 分块核心区域大小 (像素)
+        halo: 重叠边缘宽度 (像素)
+    
+    Yields:
+        core: 核心区域窗口 (不重叠，覆盖整幅栅格)
+        padded: 含重叠边缘的读取窗口 (裁剪到栅格范围内)
+    """
+    for row_off in range(0, height, tile_size):
+        for col_off in range(0, width, tile_size):
+            core = Window(col_off, row_off,
+                          min(tile_size, width - col_off),
+                          min(tile_size, height - row_off))
+            pad_row = max(row_off - halo, 0)
+            pad_col = max(col_off - halo, 0)
+            padded = Window(pad_col, pad_row,
+                            min(col_off + core.width + halo, width) - pad_col,
+                            min(row_off + core.height + halo, height) - pad_row)
+            yield core, padded
+
+def read_chm_window(src, window):
+    """
+    读取CHM的一个窗口
+    
+    Args:
+        src: 打开的CHM栅格数据源
+        window: 读取窗口
+    
+    Returns:
+        chm: 窗口内的CHM数组 (float32)
+    """
+    return src.read(1, window=window).astype(np.float32, copy=False)
+
+def _in_window(rows, cols, window):
+    """判断像素坐标是否位于窗口内"""
+    return ((rows >= window.row_off) & (rows < window.row_off + window.height) &
+            (cols >= window.col_off) & (cols < window.col_off + window.width))
+
+def detect_tile_tree_tops(src, core, padded, min_height=2.0, smooth_sigma=1.0, min_distance=5):
+    """
+    在单个分块中检测树顶，只保留落在核心区域内的树顶，避免相邻分块重复计数
+    
+    Args:
+        src: 打开的CHM栅格数据源
+        core: 核心区域窗口
+        padded: 含重叠边缘的读取窗口
+        min_height: 最小树高阈值
+        smooth_sigma: 高斯平滑参数
+        min_distance: 树顶检测的最小距离
+    
+    Returns:
+        tree_tops: 全局像素坐标的树顶数组 (N, 2)
+        tree_heights: 树顶高度数组 (N,)
+    """
+    chm = read_chm_window(src, padded)
+    processed_chm, mask = preprocess_chm(chm, min_height=min_height, smooth_sigma=smooth_sigma)
+    tree_tops, tree_heights = detect_tree_tops(
+        processed_chm, mask, min_distance=min_distance, min_height=min_height
+    )
+    
+    if len(tree_tops) == 0:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float32)
+    
+    # 转换为全局像素坐标并按核心区域归属过滤
+    tree_tops = np.asarray(tree_tops, dtype=np.int64) + [padded.row_off, padded.col_off]
+    inside = _in_window(tree_tops[:, 0], tree_tops[:, 1], core)
+    
+    return tree_tops[inside], np.asarray(tree_heights, dtype=np.float32)[inside]
+
+def segment_tile_crowns(src, core, padded, tree_tops, min_height=2.0, smooth_sigma=1.0,
+                        crown_radius=DEFAULT_CROWN_RADIUS, compactness=0.0):
+    """
+    在单个分块中分割树冠，使用全局树顶编号作为标记，只输出核心区域内的树冠片段
+    
+    Args:
+        src: 打开的CHM栅格数据源
+        core: 核心区域窗口
+        padded: 含重叠边缘的读取窗口
+        tree_tops: 全局树顶坐标，按 (行,列) 排序
+        min_height: 最小树高阈值
+        smooth_sigma: 高斯平滑参数
+        crown_radius: 最大树冠半径 (像素)，不超过重叠边缘宽度，保证核心区域内的树冠完整
+        compactness: 紧凑分水岭参数
+    
+    Returns:
+        crown_shapes: (GeoJSON几何, 全局标签值) 列表
+    """
+    # 利用行排序定位重叠窗口内的树顶，标签值即全局序号+1
+    start, stop = np.searchsorted(
+        tree_tops[:, 0], [padded.row_off, padded.row_off + padded.height]
+    )
+    index = np.arange(start, stop)
+    index = index[_in_window(tree_tops[index, 0], tree_tops[index, 1], padded)]
+    
+    if len(index) == 0:
+        return []
+    
+    chm = read_chm_window(src, padded)
+    processed_chm, mask = preprocess_chm(chm, min_height=min_height, smooth_sigma=smooth_sigma)
+    
+    local_tops = tree_tops[index] - [padded.row_off, padded.col_off]
+    local_labels = segment_crowns(
+        processed_chm, local_tops, mask, max_radius=crown_radius, compactness=compactness
+    )
+    
+    # 将局部标签映射为全局标签，并裁剪到核心区域
+    global_ids = np.concatenate([[0], index + 1]).astype(np.int32)
+    row0 = core.row_off - padded.row_off
+    col0 = core.col_off - padded.col_off
+    labels = global_ids[local_labels[row0:row0 + core.height, col0:col0 + core.width]]
+    
+    crown_shapes = []
+    for geom, value in features.shapes(
+            labels,
+            mask=labels > 0,
+            transform=window_transform(core, src.transform),
+            connectivity=8):
+        if value > 0:
+            crown_shapes.append((geom, value))
+    
+    return crown_shapes
+
+def merge_crown_pieces(crown_shapes):
+    """
+    合并跨越分块边界的树冠片段
+    
+    Args:
+        crown_shapes: 各分块输出的 (几何, 标签值) 列表
+    
+    Returns:
+        merged: 按标签值排序的 (几何, 标签值) 列表
+    """
+    from shapely.geometry import shape, mapping
+    from shapely.ops import unary_union
+    
+    pieces = {}
+    for geom, value in crown_shapes:
+        pieces.setdefault(value, []).append(geom)
+    
+    merged = []
+    for value in sorted(pieces):
+        geoms = pieces[value]
+        if len(geoms) == 1:
+            merged.append((geoms[0], value))
+            continue
+        
+        # 相邻分块的片段共享像素边界，合并后恢复完整树冠
+        union = unary_union([shape(g) for g in geoms])
+        for part in getattr(union, 'geoms', [union]):
+            merged.append((mapping(part), value))
+    
+    return merged
+
+# 分块工作进程中打开的CHM数据源，由 _init_tile_worker 初始化
+_tile_src = None
+
+def _init_tile_worker(chm_path):
+    """分块工作进程初始化：每个进程只打开一次CHM，按窗口直接读取像素"""
+    global _tile_src
+    _tile_src = raster_interchange.open_raster(chm_path)
+
+def _detect_tile_task(task):
+    """树顶检测任务 (在工作进程中执行)"""
+    core, padded, min_height, smooth_sigma, min_distance = task
+    return detect_tile_tree_tops(_tile_src, core, padded, min_height, smooth_sigma, min_distance)
+
+def _segment_tile_task(task):
+    """树冠分割任务 (在工作进程中执行)，全局树顶通过内存映射文件共享"""
+    core, padded, tops_path, min_height, smooth_sigma, crown_radius, compactness = task
+    tree_tops = np.load(tops_path, mmap_mode='r')
+    return segment_tile_crowns(
+        _tile_src, core, padded, tree_tops, min_height, smooth_sigma, crown_radius, compactness
+    )
+
+def detect_crowns_tiled(
+    chm_path,
+    min_height=2.0,
+    smooth_sigma=1.0,
+    min_distance=5,
+    tile_size=DEFAULT_TILE_SIZE,
+    crown_radius=DEFAULT_CROWN_RADIUS,
+    workers=1,
+    compactness=0.0
+):
+    """
+    分块窗口化处理CHM，内存占用只与分块大小有关，而与整幅影像大小无关
+    
+    第一遍逐块检测树顶并按核心区域归属去重，得到全局唯一的树顶编号；
+    第二遍逐块以全局编号为标记进行分水岭分割，最后合并跨越分块边界的树冠。
+    workers > 1 时分块分发到多个进程并行处理，各进程按窗口自行读取CHM，
+    全局树顶通过内存映射文件共享；分块划分和合并顺序与进程数无关，结果完全一致
+    
+    Args:
+        chm_path: CHM文件路径
+        min_height: 最小树高阈值
+        smooth_sigma: 高斯平滑参数
+        min_distance: 树顶检测的最小距离
+        tile_size: 分块核心区域大小 (像素)
+        crown_radius: 最大树冠半径 (像素)，决定重叠边缘宽度，超过分块大小时按分块大小处理
+        workers: 并行工作进程数
+        compactness: 紧凑分水岭参数
+    
+    Returns:
+        geojson: 包含树冠多边形和树顶点的GeoJSON FeatureCollection
+    """
+    crown_radius = check_crown_radius(crown_radius, tile_size)
+    halo = compute_tile_halo(min_distance, smooth_sigma, crown_radius)
+    
+    with raster_interchange.open_raster(chm_path) as src:
+        transform = src.transform
+        tiles = list(iter_tiles(src.height, src.width, tile_size, halo))
+        logger.info(f"分块处理CHM, 形状: {src.shape}, 分块数: {len(tiles)}, "
+                    f"分块大小: {tile_size}, 重叠边缘: {halo}像素, 进程数: {workers}")
+    
+    if workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_tile_worker, initargs=(chm_path,)
+        )
+        run_tasks = executor.map
+    else:
+        executor = None
+        _init_tile_worker(chm_path)
+        run_tasks = map
+    
+    try:
+        # 第一遍：检测树顶 (map 保持分块顺序)
+        detect_tasks = [(core, padded, min_height, smooth_sigma, min_distance)
+                        for core, padded in tiles]
+        tops_list, heights_list = zip(*run_tasks(_detect_tile_task, detect_tasks))
+        
+        tree_tops = np.concatenate(tops_list)
+        tree_heights = np.concatenate(heights_list)
+        
+        if len(tree_tops) == 0:
+            logger.warning("未检测到树顶，请检查CHM质量或调整参数")
+            return build_tree_geojson([], transform, tree_tops, tree_heights)
+        
+        # 按 (行,列) 排序，使编号与分块划分无关
+        order = np.lexsort((tree_tops[:, 1], tree_tops[:, 0]))
+        tree_tops = tree_tops[order]
+        tree_heights = tree_heights[order]
+        logger.info(f"分块检测共得到 {len(tree_tops)} 个树顶点")
+        
+        # 第二遍：分割树冠
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tops_path = os.path.join(tmp_dir, 'tree_tops.npy')
+            np.save(tops_path, tree_tops)
+            
+            segment_tasks = [(core, padded, tops_path, min_height, smooth_sigma, crown_radius, compactness)
+                             for core, padded in tiles]
+            crown_shapes = []
+            for tile_shapes in run_tasks(_segment_tile_task, segment_tasks):
+                crown_shapes.extend(tile_shapes)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        else:
+            _tile_src.close()
+    
+    crown_shapes = merge_crown_pieces(crown_shapes)
+    
+    return build_tree_geojson(crown_shapes, transform, tree_tops, tree_heights)
+
+def detect_crowns(chm, min_height=2.0, smooth_sigma=1.0, min_distance=5, window_radius=None,
+                  max_radius=None, compactness=0.0):
+    """
+    在内存中的CHM上依次执行预处理、树顶检测和树冠分割
+    
+    Args:
+        chm: CHM数组
+        min_height: 最小树高阈值
+        smooth_sigma: 高斯平滑参数
+        min_distance: 树顶检测的最小距离
+        window_radius: 可选，随树高变化的检测窗口半径函数 (见 crown_window_radius)
+        max_radius: 可选，最大树冠半径 (像素)，或随树高变化的半径函数 (见 crown_radius_limit)
+        compactness: 紧凑分水岭参数
+    
+    Returns:
+        processed_chm: 处理后的CHM
+        tree_tops: 树顶坐标 (行,列)
+        tree_heights: 树顶高度
+        labels: 树冠标签图像 (标签值为树顶序号+1)
+    """
+    # 预处理CHM
+    logger.info("预处理CHM，应用平滑和高度阈值过滤")
+    processed_chm, mask = preprocess_chm(chm, min_height=min_height, smooth_sigma=smooth_sigma)
+    
+    # 检测树顶
+    logger.info(f"检测树顶，最小距离={min_distance}像素，最小高度={min_height}米")
+    tree_tops, tree_heights = detect_tree_tops(
+        processed_chm, mask, min_distance=min_distance, min_height=min_height, window_radius=window_radius
+    )
+    
+    # 分割树冠
+    logger.info("使用分水岭算法分割树冠")
+    labels = segment_crowns(
+        processed_chm, tree_tops, mask, max_radius=max_radius, tree_heights=tree_heights, compactness=compactness
+    )
+    
+    return processed_chm, tree_tops, tree_heights, labels
+
+# 阶段记忆化：每个阶段保留的最近结果数，以及常驻进程中保留的CHM数量
+DEFAULT_STAGE_ENTRIES = 4
+MAX_STAGE_GRAPHS = 2
+
+class ChmStages:
+    """
+    CHM处理的记忆化阶段图: read → smooth → threshold → detect → segment → polygonize
+    
+    每个阶段的结果按其上游参数记录：smooth 只依赖 smooth_sigma，threshold 增加 min_height，
+    detect 及其下游再增加 min_distance。参数变化时只重新计算受影响的阶段及其下游，
+    例如只修改 min_distance 时直接复用平滑和阈值结果
+    """
+    
+    def __init__(self, chm_path, max_entries=DEFAULT_STAGE_ENTRIES):
+        self.chm_path = chm_path
+        self.stamp = _file_stamp(chm_path)
+        self.max_entries = max_entries
+        self.memo = {}
+    
+    def _memo(self, stage, key, compute):
+        """查找阶段结果，未命中时计算；每个阶段只保留最近使用的 max_entries 个结果"""
+        results = self.memo.setdefault(stage, OrderedDict())
+        if key in results:
+            results.move_to_end(key)
+            return results[key]
+        
+        value = compute()
+        results[key] = value
+        while len(results) > self.max_entries:
+            results.popitem(last=False)
+        return value
+    
+    def is_current(self):
+        """CHM文件是否未被修改"""
+        try:
+            return _file_stamp(self.chm_path) == self.stamp
+        except OSError:
+            return False
+    
+    def read(self):
+        """读取CHM，返回 (chm, transform, crs, meta)"""
+        return self._memo('read', (), lambda: read_chm(self.chm_path))
+    
+    def smooth(self, smooth_sigma):
+        """平滑后的CHM"""
+        return self._memo('smooth', (smooth_sigma,), lambda: smooth_chm(self.read()[0], smooth_sigma))
+    
+    def threshold(self, smooth_sigma, min_height):
+        """阈值处理后的CHM和树木区域掩膜"""
+        return self._memo(
+            'threshold', (smooth_sigma, min_height),
+            lambda: threshold_chm(self.smooth(smooth_sigma), min_height)
+        )
+    
+    def detect(self, smooth_sigma, min_height, min_distance, variable_window=False):
+        """树顶坐标和高度；variable_window 为真时按树高-冠幅模型使用可变检测窗口"""
+        def compute():
+            processed_chm, mask = self.threshold(smooth_sigma, min_height)
+            window_radius = None
+            if variable_window:
+                window_radius = crown_window_radius(abs(self.read()[1].a), min_distance)
+            logger.info(f"检测树顶，最小距离={min_distance}像素，最小高度={min_height}米")
+            return detect_tree_tops(
+                processed_chm, mask, min_distance=min_distance, min_height=min_height, window_radius=window_radius
+            )
+        return self._memo('detect', (smooth_sigma, min_height, min_distance, variable_window), compute)
+    
+    def segment(self, smooth_sigma, min_height, min_distance, variable_window=False,
+                crown_radius=None, compactness=0.0):
+        """
+        树冠标签图像；crown_radius 不为None时树冠半径不超过 crown_radius，variable_window 为真时再按树高-冠幅模型收紧 (见 crown_radius_limit)
+        """
+        def compute():
+            processed_chm, mask = self.threshold(smooth_sigma, min_height)
+            tree_tops, tree_heights = self.detect(smooth_sigma, min_height, min_distance, variable_window)
+            max_radius = crown_radius
+            if variable_window and crown_radius is not None:
+                max_radius = crown_radius_limit(abs(self.read()[1].a), crown_radius, min_distance)
+            logger.info("使用分水岭算法分割树冠")
+            return segment_crowns(
+                processed_chm, tree_tops, mask,
+                max_radius=max_radius, tree_heights=tree_heights, compactness=compactness
+            )
+        key = (smooth_sigma, min_height, min_distance, variable_window, crown_radius, compactness)
+        return self._memo('segment', key, compute)
+    
+    def polygonize(self, smooth_sigma, min_height, min_distance, variable_window=False,
+                   crown_radius=None, compactness=0.0):
+        """树冠多边形和树顶点的GeoJSON"""
+        def compute():
+            transform = self.read()[1]
+            tree_tops, tree_heights = self.detect(smooth_sigma, min_height, min_distance, variable_window)
+            labels = self.segment(smooth_sigma, min_height, min_distance, variable_window, crown_radius, compactness)
+            logger.info("提取树冠多边形并生成GeoJSON")
+            return extract_crown_polygons(labels, transform, tree_tops, tree_heights)
+        key = (smooth_sigma, min_height, min_distance, variable_window, crown_radius, compactness)
+        return self._memo('polygonize', key, compute)
+
+def _file_stamp(path):
+    """文件的大小和修改时间，用于判断记忆化结果是否过期"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+# 常驻进程 (worker_service) 中按CHM路径保留的阶段图，只在 process_chm(reuse_stages=True) 时使用
+_stage_graphs = OrderedDict()
+
+def get_stage_graph(chm_path):
+    """
+    获取CHM的阶段图；同一进程中重复处理同一CHM时复用已计算的阶段结果，CHM文件变化后重新创建
+    
+    Args:
+        chm_path: CHM文件路径
+    
+    Returns:
+        graph: ChmStages
+    """
+    key = os.path.abspath(chm_path)
+    graph = _stage_graphs.get(key)
+    if graph is None or not graph.is_current():
+        graph = ChmStages(chm_path)
+        _stage_graphs[key] = graph
+    
+    _stage_graphs.move_to_end(key)
+    while len(_stage_graphs) > MAX_STAGE_GRAPHS:
+        _stage_graphs.popitem(last=False)
+    return graph
+
+def clear_stage_graphs():
+    """释放记忆化的阶段结果"""
+    _stage_graphs.clear()
+
+# 参数扫描可以停止的阶段
+SWEEP_STAGES = ('detect', 'segment', 'polygonize')
+
+def sweep_chm(chm_path, min_heights=(2.0,), min_distances=(5,), smooth_sigmas=(1.0,), stage='detect'):
+    """
+    在参数网格上评估树冠检测，共享的中间结果只计算一次
+    按 smooth_sigma → min_height → min_distance 的顺序遍历，平滑结果按 smooth_sigma 复用，
+    阈值结果按 (smooth_sigma, min_height) 复用
+    
+    Args:
+        chm_path: CHM文件路径
+        min_heights: 最小树高阈值列表
+        min_distances: 树顶检测最小距离列表
+        smooth_sigmas: 高斯平滑参数列表
+        stage: 计算到哪个阶段 (detect: 只检测树顶; segment: 分割树冠; polygonize: 生成GeoJSON)
+    
+    Returns:
+        results: 每组参数一个结果字典，包含参数、树顶坐标 (行,列) 和高度、树木数量，
+                 segment 阶段增加各树冠面积 (像素)，polygonize 阶段增加GeoJSON
+    """
+    if stage not in SWEEP_STAGES:
+        raise ValueError(f"不支持的阶段: {stage}，可选: {', '.join(SWEEP_STAGES)}")
+    
+    # 按遍历顺序，每个阶段只需保留最近一个结果
+    graph = ChmStages(chm_path, max_entries=1)
+    transform = graph.read()[1]
+    
+    results = []
+    for smooth_sigma in smooth_sigmas:
+        for min_height in min_heights:
+            for min_distance in min_distances:
+                params = (smooth_sigma, min_height, min_distance)
+                tree_tops, tree_heights = graph.detect(*params)
+                result = {
+                    'smooth_sigma': smooth_sigma,
+                    'min_height': min_height,
+                    'min_distance': min_distance,
+                    'tree_count': len(tree_tops),
+                    'tree_tops': tree_tops,
+                    'tree_heights': tree_heights,
+                    'transform': tuple(transform)[:6],
+                }
+                
+                if stage in ('segment', 'polygonize'):
+                    labels = graph.segment(*params)
+                    result['crown_areas_px'] = np.bincount(labels.ravel(), minlength=len(tree_tops) + 1)[1:]
+                
+                if stage == 'polygonize':
+                    result['geojson'] = graph.polygonize(*params)
+                
+                results.append(result)
+                logger.info(f"参数 smooth_sigma={smooth_sigma}, min_height={min_height}, "
+                            f"min_distance={min_distance}: {len(tree_tops)} 棵树")
+    
+    return results
+
 def process_chm(
     chm_path, 
     output_dir=None,
     min_height=2.0,
     smooth_sigma=1.0,
     min_distance=5,
-    visualization=True
+    visualization=True,
+    tile_size=None,
+    crown_radius=None,
+    workers=None,
+    use_cache=False,
+    cache_dir=None,
+    reuse_stages=False,
+    output_format='geojson',
+    variable_window=False,
+    compactness=0.0
 ):
     """
-    处理CHM，提取树顶和树冠，生成GeoJSON和可视化
+    处理CHM，提取树顶和树冠，生成树冠要素文件 (GeoJSON/GeoParquet/FlatGeobuf) 和可视化
+    CHM内容、参数和脚本均未变化时直接返回缓存的结果；
+    开启 reuse_stages 后，同一进程中只修改部分参数时复用未受影响的阶段结果 (见 ChmStages)
     
     Args:
         chm_path: CHM文件路径
@@ -346,9 +1195,20 @@ def process_chm(
         smooth_sigma: 高斯平滑参数
         min_distance: 树顶检测的最小距离
         visualization: 是否创建可视化图像
+        tile_size: 分块大小 (像素)，指定后按窗口分块处理，适用于超大CHM
+        crown_radius: 最大树冠半径 (像素)，限制分水岭分割的范围，分块处理时同时决定重叠边缘宽度；
+            为None时整幅处理不限制树冠范围，分块处理使用 DEFAULT_CROWN_RADIUS
+        workers: 并行工作进程数，指定后按分块并行处理 (未指定分块大小时使用默认值)
+        use_cache: 是否使用结果缓存 (默认关闭；命中和写入缓存都会复制一份输出文件)
+        cache_dir: 结果缓存目录，默认使用 result_cache.DEFAULT_CACHE_DIR
+        reuse_stages: 是否在进程内记忆化各阶段结果 (整幅处理模式)；各阶段的整幅数组在作业结束后仍常驻进程内存，
+            只在同一进程中反复调整参数时开启，不再需要时调用 clear_stage_graphs 释放
+        output_format: 树冠要素的输出格式: 'geojson'、'parquet' (GeoParquet) 或 'fgb' (FlatGeobuf)
+        variable_window: 是否按树高-冠幅模型使用随树高变化的检测窗口和最大树冠半径 (整幅处理模式)
+        compactness: 紧凑分水岭参数，大于0时树冠形状更规则
     
     Returns:
-        geojson_path: 输出的GeoJSON文件路径
+        geojson_path: 输出的树冠要素文件路径
         visualization_path: 输出的可视化图像路径
     """
     try:
@@ -362,37 +1222,95 @@ def process_chm(
         # 获取输入文件名（不含扩展名）
         base_name = os.path.splitext(os.path.basename(chm_path))[0]
         
+        if output_format not in FEATURE_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}，可选: {', '.join(FEATURE_FORMATS)}")
+        
         # 设置输出文件路径
-        geojson_path = os.path.join(output_dir, f"{base_name}_trees.geojson")
+        extension = FORMAT_EXTENSIONS[output_format]
+        geojson_path = os.path.join(output_dir, f"{base_name}_trees{extension}")
+        cached_features = CACHED_FEATURES + extension
         visualization_path = os.path.join(output_dir, f"{base_name}_trees.png")
         
-        # 读取CHM
-        logger.info(f"读取CHM文件: {chm_path}")
-        chm, transform, crs, meta = read_chm(chm_path)
-        
-        # 预处理CHM
-        logger.info("预处理CHM，应用平滑和高度阈值过滤")
-        processed_chm, mask = preprocess_chm(chm, min_height=min_height, smooth_sigma=smooth_sigma)
-        
-        # 检测树顶
-        logger.info(f"检测树顶，最小距离={min_distance}像素，最小高度={min_height}米")
-        tree_tops, tree_heights = detect_tree_tops(
-            processed_chm, mask, min_distance=min_distance, min_height=min_height
-        )
+        # 结果缓存键：CHM内容哈希 + 影响结果的参数 + 脚本及读写模块的源码哈希 (进程数不影响结果)
+        tiled = bool(tile_size or workers)
+        if tiled and crown_radius is None:
+            crown_radius = DEFAULT_CROWN_RADIUS
+        # 树冠半径不超过分块大小 (重叠边缘随半径增大) 或影像对角线，截断后的半径参与缓存键
+        if crown_radius is not None:
+            crown_radius = check_crown_radius(
+                crown_radius, (tile_size or DEFAULT_TILE_SIZE) if tiled else raster_diagonal(chm_path)
+            )
+        cache = result_cache.open_cache(cache_dir) if use_cache else None
+        if cache is not None:
+            params = {
+                'min_height': float(min_height), 'smooth_sigma': float(smooth_sigma),
+                'min_distance': int(min_distance), 'output_format': output_format,
+                'crown_radius': crown_radius, 'compactness': float(compactness)
+            }
+            if tiled:
+                params.update(tile_size=tile_size or DEFAULT_TILE_SIZE)
+            else:
+                params.update(visualization=visualization, variable_window=bool(variable_window))
+            cache_key = cache.key(
+                'process_chm', cache.file_digest(chm_path), params,
+                result_cache.code_version(__file__, vector_io.__file__, raster_interchange.__file__)
+            )
+            
+            entry = cache.get(cache_key)
+            if entry is not None and entry.has_file(cached_features):
+                try:
+                    entry.restore(cached_features, geojson_path)
+                    if entry.has_file(CACHED_VISUALIZATION):
+                        entry.restore(CACHED_VISUALIZATION, visualization_path)
+                    else:
+                        visualization_path = None
+                    logger.info("使用缓存的检测结果")
+                    return geojson_path, visualization_path
+                except OSError:
+                    # 条目在复制时被其他进程淘汰，按未命中处理
+                    logger.warning("缓存条目已被淘汰，重新计算")
         
-        # 分割树冠
-        logger.info("使用分水岭算法分割树冠")
-        labels = segment_crowns(processed_chm, tree_tops, mask)
+        # 分块处理模式：不读取整幅CHM，也不生成需要整幅数组的可视化图像
+        if tiled:
+            geojson = detect_crowns_tiled(
+                chm_path,
+                min_height=min_height,
+                smooth_sigma=smooth_sigma,
+                min_distance=min_distance,
+                tile_size=tile_size or DEFAULT_TILE_SIZE,
+                crown_radius=crown_radius,
+                workers=workers or 1,
+                compactness=compactness
+            )
+            
+            write_features(geojson, geojson_path, crs=chm_crs(chm_path))
+            
+            logger.info(f"树冠要素已保存到: {geojson_path}")
+            
+            if visualization:
+                logger.warning("分块处理模式不生成可视化图像")
+            if variable_window:
+                logger.warning("分块处理模式使用固定检测窗口")
+            
+            if cache is not None:
+                cache.put(cache_key, files={cached_features: geojson_path})
+            
+            return geojson_path, None
         
-        # 提取树冠多边形，生成GeoJSON
-        logger.info("提取树冠多边形并生成GeoJSON")
-        geojson = extract_crown_polygons(labels, transform, tree_tops, tree_heights)
+        # 读取、预处理、检测树顶、分割树冠并生成GeoJSON，各阶段结果按参数记忆化
+        logger.info(f"读取CHM文件: {chm_path}")
+        graph = get_stage_graph(chm_path) if reuse_stages else ChmStages(chm_path, max_entries=1)
+        params = (smooth_sigma, min_height, min_distance, bool(variable_window))
+        segment_params = params + (crown_radius, float(compactness))
+        processed_chm, _ = graph.threshold(smooth_sigma, min_height)
+        tree_tops, tree_heights = graph.detect(*params)
+        labels = graph.segment(*segment_params)
+        geojson = graph.polygonize(*segment_params)
         
-        # 保存GeoJSON
-        with open(geojson_path, 'w') as f:
-            json.dump(geojson, f)
+        # 保存树冠要素
+        write_features(geojson, geojson_path, crs=graph.read()[2])
         
-        logger.info(f"GeoJSON已保存到: {geojson_path}")
+        logger.info(f"树冠要素已保存到: {geojson_path}")
         
         # 生成可视化图像
         if visualization:
@@ -401,22 +1319,43 @@ def process_chm(
         else:
             visualization_path = None
         
+        if cache is not None:
+            files = {cached_features: geojson_path}
+            if visualization_path:
+                files[CACHED_VISUALIZATION] = visualization_path
+            cache.put(cache_key, files=files)
+        
         # 返回输出文件路径
         return geojson_path, visualization_path
-        
+    
     except Exception as e:
         logger.error(f"处理CHM时出错: {str(e)}")
         raise
 
 def main():
     """命令行入口函数"""
-    parser = argparse.ArgumentParser(description='从CHM中提取树顶和树冠')
+    # --min-height 沿用 -h 简写，帮助信息使用 --help
+    parser = argparse.ArgumentParser(description='从CHM中提取树顶和树冠', conflict_handler='resolve')
     parser.add_argument('chm_path', help='CHM GeoTIFF文件路径')
     parser.add_argument('--output-dir', '-o', help='输出目录路径')
     parser.add_argument('--min-height', '-h', type=float, default=2.0, help='最小树高阈值 (默认: 2.0)')
     parser.add_argument('--smooth', '-s', type=float, default=1.0, help='高斯平滑标准差 (默认: 1.0)')
     parser.add_argument('--min-distance', '-d', type=int, default=5, help='树顶检测的最小距离 (像素) (默认: 5)')
     parser.add_argument('--no-viz', action='store_true', help='禁用可视化图像生成')
+    parser.add_argument('--variable-window', action='store_true',
+                        help='按树高-冠幅模型使用随树高变化的检测窗口，最小距离作为最小窗口半径')
+    parser.add_argument('--tile-size', type=int, help='分块处理的分块大小 (像素)，用于超大CHM')
+    parser.add_argument('--crown-radius', type=int,
+                        help=f'最大树冠半径 (像素)，限制分水岭分割范围并决定分块重叠宽度 '
+                             f'(默认: 整幅处理不限制，分块处理为 {DEFAULT_CROWN_RADIUS})')
+    parser.add_argument('--compactness', type=float, default=0.0,
+                        help='紧凑分水岭参数，大于0时树冠形状更规则 (默认: 0，普通分水岭)')
+    parser.add_argument('--workers', type=int, help='并行工作进程数，指定后按分块并行处理')
+    parser.add_argument('--format', choices=FEATURE_FORMATS, default='geojson',
+                        help='树冠要素输出格式: geojson、parquet (GeoParquet) 或 fgb (FlatGeobuf) (默认: geojson)')
+    parser.add_argument('--cache', action='store_true', help='使用结果缓存，输入、参数和脚本未变化时直接复用上次的结果')
+    parser.add_argument('--cache-dir', help='结果缓存目录，指定后启用结果缓存 (默认: 系统临时目录下的 forest_result_cache)')
+    parser.add_argument('--profile-imports', action='store_true', help='输出各依赖模块的导入耗时 (标准错误)')
     
     args = parser.parse_args()
     
@@ -428,7 +1367,15 @@ def main():
             min_height=args.min_height,
             smooth_sigma=args.smooth,
             min_distance=args.min_distance,
-            visualization=not args.no_viz
+            visualization=not args.no_viz,
+            tile_size=args.tile_size,
+            crown_radius=args.crown_radius,
+            workers=args.workers,
+            use_cache=args.cache or bool(args.cache_dir),
+            cache_dir=args.cache_dir,
+            output_format=args.format,
+            variable_window=args.variable_window,
+            compactness=args.compactness
         )
         
         # 输出结果路径
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+单株检测与碳储量估算一体化脚本
+在同一进程中完成树冠检测、单株属性提取和碳储量统计，
+CHM、仿射变换和树冠标签图像在各步骤间直接共享，树冠要素和属性表仅作为可选输出
+(GeoJSON/CSV，或列式的 GeoParquet/FlatGeobuf)
+"""
+
+import sys
+import os
+import json
+import math
+import argparse
+import logging
+
+# 命令行传入 --profile-imports 时，在导入依赖之前开始记录导入耗时
+if __name__ == "__main__":
+    import import_profiler
+    import_profiler.enable_if_requested()
+
+import raster_interchange
+from tree_crown_detection import (
+    read_chm, detect_crowns, detect_crowns_tiled, extract_crown_polygons,
+    create_visualization, crown_window_radius, crown_radius_limit, check_crown_radius, DEFAULT_CROWN_RADIUS,
+    DEFAULT_TILE_SIZE
+)
+from tree_attributes import read_raster, measure_crowns, measure_label_crowns, stream_tree_attributes, tree_table_path
+from vector_io import FORMAT_EXTENSIONS, FEATURE_FORMATS, TABLE_FORMATS, write_features
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def read_dem(dem_path, chm_shape, chm_transform):
+    """
+    读取与CHM网格一致的DEM
+    
+    Args:
+        dem_path: DEM文件路径
+        chm_shape: CHM数组形状
+        chm_transform: CHM仿射变换
+    
+    Returns:
+        dem: DEM数组
+        nodata: DEM无效值
+    """
+    with raster_interchange.open_raster(dem_path) as src:
+        if src.shape != chm_shape or src.transform != chm_transform:
+            raise ValueError("DEM与CHM的网格不一致，无法逐像素计算相对高度")
+        return src.read(1), src.nodata
+
+def run_tree_pipeline(
+    chm_path,
+    dem_path=None,
+    output_dir=None,
+    min_height=2.0,
+    smooth_sigma=1.0,
+    min_distance=5,
+    a=0.05,
+    b=2.0,
+    c=1.0,
+    carbon_factor=0.5,
+    write_geojson=True,
+    write_attributes=True,
+    visualization=False,
+    tile_size=None,
+    crown_radius=None,
+    workers=None,
+    crown_format='geojson',
+    attribute_format='csv',
+    variable_window=False,
+    compactness=0.0
+):
+    """
+    一次性完成树冠检测、单株属性提取和碳储量统计
+    
+    Args:
+        chm_path: CHM文件路径
+        dem_path: DEM文件路径（可选）
+        output_dir: 输出目录，默认与CHM同目录
+        min_height: 最小树高阈值
+        smooth_sigma: 高斯平滑参数
+        min_distance: 树顶检测的最小距离
+        a, b, c: 生物量模型参数
+        carbon_factor: 生物量到碳的转换因子
+        write_geojson: 是否输出树冠要素文件
+        write_attributes: 是否输出属性表
+        visualization: 是否创建可视化图像
+        tile_size: 分块大小 (像素)，指定后按窗口分块检测
+        crown_radius: 最大树冠半径 (像素)，限制分水岭分割的范围，分块处理时同时决定重叠边缘宽度；
+            为None时整幅处理不限制树冠范围，分块处理使用 DEFAULT_CROWN_RADIUS
+        workers: 并行工作进程数，指定后按分块并行检测
+        crown_format: 树冠要素输出格式: 'geojson'、'parquet' (GeoParquet) 或 'fgb' (FlatGeobuf)
+        attribute_format: 属性表输出格式: 'csv'、'parquet' 或 'fgb'
+        variable_window: 是否按树高-冠幅模型使用随树高变化的检测窗口和最大树冠半径 (整幅处理模式)
+        compactness: 紧凑分水岭参数，大于0时树冠形状更规则
+    
+    Returns:
+        result: 包含输出文件路径、树木数量和碳储量统计摘要的字典
+    """
+    try:
+        # 如果未指定输出目录，使用输入文件所在目录
+        if output_dir is None:
+            output_dir = os.path.dirname(chm_path)
+        
+        # 确保输出目录存在
+        os.makedirs(output_dir, exist_ok=True)
+        
+        if crown_format not in FEATURE_FORMATS:
+            raise ValueError(f"不支持的树冠输出格式: {crown_format}，可选: {', '.join(FEATURE_FORMATS)}")
+        if attribute_format not in TABLE_FORMATS:
+            raise ValueError(f"不支持的属性表输出格式: {attribute_format}，可选: {', '.join(TABLE_FORMATS)}")
+        
+        # 输出文件命名与分步脚本保持一致
+        base_name = os.path.splitext(os.path.basename(chm_path))[0]
+        geojson_path = os.path.join(output_dir, f"{base_name}_trees{FORMAT_EXTENSIONS[crown_format]}")
+        csv_path = os.path.join(output_dir, f"{base_name}_trees_attributes{FORMAT_EXTENSIONS[attribute_format]}")
+        visualization_path = os.path.join(output_dir, f"{base_name}_trees.png")
+        
+        if tile_size or workers:
+            # 分块模式：树冠以多边形形式汇总，直接在内存中交给属性计算，不经过GeoJSON文件
+            geojson = detect_crowns_tiled(
+                chm_path,
+                min_height=min_height,
+                smooth_sigma=smooth_sigma,
+                min_distance=min_distance,
+                tile_size=tile_size or DEFAULT_TILE_SIZE,
+                crown_radius=DEFAULT_CROWN_RADIUS if crown_radius is None else crown_radius,
+                workers=workers or 1,
+                compactness=compactness
+            )
+            crown_features = [f for f in geojson['features'] if f['properties']['type'] == 'tree_crown']
+            tree_count = len(geojson['features']) - len(crown_features)
+            
+            chm_src = read_raster(chm_path)
+            crs = chm_src.crs
+            dem_src = read_raster(dem_path) if dem_path else None
+            try:
+                measurements = measure_crowns(crown_features, chm_src, dem_src)
+            finally:
+                chm_src.close()
+                if dem_src:
+                    dem_src.close()
+            
+            if visualization:
+                logger.warning("分块处理模式不生成可视化图像")
+            if variable_window:
+                logger.warning("分块处理模式使用固定检测窗口")
+            visualization_path = None
+        else:
+            # 整幅模式：直接使用分水岭标签图像统计单株属性
+            logger.info(f"读取CHM文件: {chm_path}")
+            chm, transform, crs, meta = read_chm(chm_path)
+            
+            crown_radius = check_crown_radius(crown_radius, math.hypot(*chm.shape))
+            window_radius, max_radius = None, crown_radius
+            if variable_window:
+                window_radius = crown_window_radius(abs(transform.a), min_distance)
+                if crown_radius is not None:
+                    max_radius = crown_radius_limit(abs(transform.a), crown_radius, min_distance)
+            processed_chm, tree_tops, tree_heights, labels = detect_crowns(
+                chm, min_height=min_height, smooth_sigma=smooth_sigma, min_distance=min_distance,
+                window_radius=window_radius, max_radius=max_radius, compactness=compactness
+            )
+            tree_count = len(tree_tops)
+            
+            geojson = None
+            if write_geojson:
+                logger.info("提取树冠多边形并生成GeoJSON")
+                geojson = extract_crown_polygons(labels, transform, tree_tops, tree_heights)
+            
+            dem, dem_nodata = None, None
+            if dem_path:
+                logger.info(f"读取DEM文件: {dem_path}")
+                dem, dem_nodata = read_dem(dem_path, chm.shape, transform)
+            
+            measurements = measure_label_crowns(
+                labels, chm, transform,
+                chm_nodata=meta.get('nodata'),
+                dem=dem,
+                dem_nodata=dem_nodata,
+                fallback_heights=tree_heights
+            )
+            
+            if visualization:
+                logger.info("创建分割结果可视化图像")
+                create_visualization(processed_chm, labels, tree_tops, visualization_path)
+            else:
+                visualization_path = None
+        
+        # 可选输出
+        if write_geojson:
+            write_features(geojson, geojson_path, crs=crs)
+            logger.info(f"树冠要素已保存到: {geojson_path}")
+        else:
+            geojson_path = None
+        
+        if write_attributes:
+            table_path = tree_table_path(csv_path)
+        else:
+            csv_path = None
+            table_path = None
+        
+        # 逐块计算树木属性，写出属性表和单株属性表 (可选) 并累积统计摘要
+        logger.info(f"开始计算树木属性，使用生物量系数a={a}, b={b}, c={c}, 碳因子={carbon_factor}")
+        summary = stream_tree_attributes(
+            measurements, csv_path, a, b, c, carbon_factor, crs, table_path=table_path
+        )
+        
+        return {
+            'geojson': geojson_path,
+            'csv': csv_path,
+            'table': table_path,
+            'visualization': visualization_path,
+            'tree_count': tree_count,
+            'summary': summary
+        }
+    
+    except Exception as e:
+        logger.error(f"一体化处理时出错: {str(e)}")
+        raise
+
+def main():
+    """命令行入口函数"""
+    parser = argparse.ArgumentParser(description='从CHM一次性完成树冠检测、单株属性提取和碳储量估算')
+    parser.add_argument('chm_path', help='CHM GeoTIFF文件路径')
+    parser.add_argument('--dem', help='输入数字高程模型DEM栅格文件路径（可选）')
+    parser.add_argument('--output-dir', '-o', help='输出目录路径')
+    parser.add_argument('--min-height', type=float, default=2.0, help='最小树高阈值 (默认: 2.0)')
+    parser.add_argument('--smooth', '-s', type=float, default=1.0, help='高斯平滑标准差 (默认: 1.0)')
+    parser.add_argument('--min-distance', '-d', type=int, default=5, help='树顶检测的最小距离 (像素) (默认: 5)')
+    parser.add_argument('--a', type=float, default=0.05, help='生物量模型系数a（默认: 0.05）')
+    parser.add_argument('--b', type=float, default=2.0, help='生物量模型指数b（胸径）（默认: 2.0）')
+    parser.add_argument('--c', type=float, default=1.0, help='生物量模型指数c（树高）（默认: 1.0）')
+    parser.add_argument('--carbon-factor', type=float, default=0.5, help='碳转换因子（默认: 0.5）')
+    parser.add_argument('--no-geojson', action='store_true', help='不输出树冠要素文件')
+    parser.add_argument('--no-csv', action='store_true', help='不输出属性表')
+    parser.add_argument('--crown-format', choices=FEATURE_FORMATS, default='geojson',
+                        help='树冠要素输出格式: geojson、parquet (GeoParquet) 或 fgb (FlatGeobuf) (默认: geojson)')
+    parser.add_argument('--attribute-format', choices=TABLE_FORMATS, default='csv',
+                        help='属性表输出格式: csv、parquet (GeoParquet) 或 fgb (FlatGeobuf) (默认: csv)')
+    parser.add_argument('--viz', action='store_true', help='生成可视化图像')
+    parser.add_argument('--variable-window', action='store_true',
+                        help='按树高-冠幅模型使用随树高变化的检测窗口，最小距离作为最小窗口半径')
+    parser.add_argument('--tile-size', type=int, help='分块处理的分块大小 (像素)，用于超大CHM')
+    parser.add_argument('--crown-radius', type=int,
+                        help=f'最大树冠半径 (像素)，限制分水岭分割范围并决定分块重叠宽度 '
+                             f'(默认: 整幅处理不限制，分块处理为 {DEFAULT_CROWN_RADIUS})')
+    parser.add_argument('--compactness', type=float, default=0.0,
+                        help='紧凑分水岭参数，大于0时树冠形状更规则 (默认: 0，普通分水岭)')
+    parser.add_argument('--workers', type=int, help='并行工作进程数，指定后按分块并行处理')
+    parser.add_argument('--profile-imports', action='store_true', help='输出各依赖模块的导入耗时 (标准错误)')
+    
+    args = parser.parse_args()
+    
+    try:
+        result = run_tree_pipeline(
+            args.chm_path,
+            dem_path=args.dem,
+            output_dir=args.output_dir,
+            min_height=args.min_height,
+            smooth_sigma=args.smooth,
+            min_distance=args.min_distance,
+            a=args.a,
+            b=args.b,
+            c=args.c,
+            carbon_factor=args.carbon_factor,
+            write_geojson=not args.no_geojson,
+            write_attributes=not args.no_csv,
+            visualization=args.viz,
+            tile_size=args.tile_size,
+            crown_radius=args.crown_radius,
+            workers=args.workers,
+            crown_format=args.crown_format,
+            attribute_format=args.attribute_format,
+            variable_window=args.variable_window,
+            compactness=args.compactness
+        )
+        
+        # 输出格式与分步脚本一致，便于后端解析
+        if result['geojson']:
+            print(f"GeoJSON: {result['geojson']}")
+        if result['visualization']:
+            print(f"Visualization: {result['visualization']}")
+        if result['csv']:
+            print(f"CSV: {result['csv']}")
+        print(f"SUMMARY: {json.dumps(result['summary'])}")
+        
+        return 0
+    except Exception as e:
+        logger.error(f"处理失败: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
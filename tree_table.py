@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+单株属性表
+每棵树一行的列式表，底层为numpy结构化数组：整数编号、float32属性列、float64质心坐标，每棵树44字节。
+异速生长模型和汇总统计都是整列的数组运算；表可保存为 .npy (结构化数组，可内存映射读取)
+或 .parquet (GeoParquet，质心为点几何)，输出CSV时编号恢复为 "tree_<n>" 形式。
+输入编号不全是 "tree_<n>" 形式时 (如用户提供的树冠文件)，原编号保存在字符串副数组中原样输出
+"""
+
+import os
+import math
+import logging
+import numpy as np
+
+import vector_io
+
+logger = logging.getLogger(__name__)
+
+# float32属性列，以及CSV的列顺序
+ATTRIBUTE_FIELDS = ('height_m', 'crown_diameter_m', 'crown_area_m2', 'dbh_cm', 'biomass_kg', 'carbon_kg')
+CSV_FIELDS = ('tree_id',) + ATTRIBUTE_FIELDS + ('centroid_x', 'centroid_y')
+
+# 结构化数组的字段类型
+TREE_TABLE_DTYPE = np.dtype(
+    [('tree_id', np.int32)]
+    + [(name, np.float32) for name in ATTRIBUTE_FIELDS]
+    + [('centroid_x', np.float64), ('centroid_y', np.float64)]
+)
+
+# 编号在CSV和要素中的前缀
+TREE_ID_PREFIX = 'tree_'
+
+# .npy 表的原编号副数组文件后缀
+IDS_SUFFIX = '.ids.npy'
+
+# 汇总统计中累计总量和均值/标准差的属性列 (属性列 -> 汇总字段名)
+SUMMARY_TOTALS = {'carbon_kg': 'total_carbon_kg', 'biomass_kg': 'total_biomass_kg', 'crown_area_m2': 'total_crown_area_m2'}
+SUMMARY_MOMENTS = {'height_m': 'height_m', 'dbh_cm': 'dbh_cm', 'carbon_kg': 'carbon_kg'}
+
+# 碳到CO2的转换系数 (44/12 ≈ 3.67)
+CO2_PER_CARBON = 3.67
+
+# 默认生物量模型参数
+DEFAULT_MODEL = {'a': 0.05, 'b': 2.0, 'c': 1.0, 'carbon_factor': 0.5}
+
+# 多模型重新估算时每个分块的树木数 (分块内各模型的生物量为 模型数 × 树木数 的矩阵)
+REPRICE_CHUNK_SIZE = 65536
+
+def allometric_biomass(dbh_cm, height_m, a=0.05, b=2.0, c=1.0):
+    """
+    异速生长方程 M = a * (DBH^b) * (Height^c)，按float64计算；负高度等无效输入得到NaN
+    
+    Args:
+        dbh_cm: 胸径数组 (厘米)
+        height_m: 树高数组 (米)
+        a, b, c: 生物量模型参数 (标量，或可相互广播的数组)
+    
+    Returns:
+        biomass_kg: 生物量 (千克)
+    """
+    dbh_cm = np.asarray(dbh_cm, dtype=np.float64)
+    height_m = np.asarray(height_m, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return a * np.power(dbh_cm, b) * np.power(height_m, c)
+
+class TreeTable:
+    """
+    单株属性的列式表 (结构化数组)
+    
+    table['height_m'] 返回列视图，table[start:stop] 返回共享内存的子表；
+    ids 为原编号的字符串数组 (编号不能无损转换为整数时，见 parse_tree_ids)，此时 tree_id 列为行序号
+    """
+    
+    def __init__(self, data=None, ids=None):
+        if data is None:
+            data = np.zeros(0, dtype=TREE_TABLE_DTYPE)
+        self.data = data
+        self.ids = ids
+    
+    @classmethod
+    def empty(cls, size):
+        """创建指定行数、各列为0的表"""
+        return cls(np.zeros(size, dtype=TREE_TABLE_DTYPE))
+    
+    def set_tree_ids(self, tree_ids):
+        """设置编号列 (见 parse_tree_ids)"""
+        self.data['tree_id'], self.ids = parse_tree_ids(tree_ids)
+    
+    @classmethod
+    def from_measurements(cls, tree_ids, areas, heights, centroid_x, centroid_y):
+        """
+        由单株测量结果创建表，填充树高、冠幅、面积、胸径和质心 (生物量见 apply_allometry)
+        
+        Args:
+            tree_ids: 整数编号，或 "tree_<n>" 形式 (及其他任意形式) 的编号
+            areas: 树冠面积数组 (平方米)
+            heights: 树高数组 (米)
+            centroid_x, centroid_y: 树冠质心坐标数组
+        
+        Returns:
+            table: TreeTable
+        """
+        table = cls.empty(len(areas))
+        table.set_tree_ids(tree_ids)
+        
+        areas = np.asarray(areas, dtype=np.float64)
+        crown_diameter = 2 * np.sqrt(areas / np.pi)  # 等效直径
+        
+        table.data['height_m'] = heights
+        table.data['crown_diameter_m'] = crown_diameter
+        table.data['crown_area_m2'] = areas
+        
+        # 估算胸径(DBH) - 使用冠幅与胸径的经验关系
+        # 可以根据需要调整这个关系，这里使用简单的线性关系
+        table.data['dbh_cm'] = 10 * crown_diameter  # 简化假设: DBH (cm) = 10 * 冠幅直径 (m)
+        
+        table.data['centroid_x'] = centroid_x
+        table.data['centroid_y'] = centroid_y
+        return table
+    
+    @classmethod
+    def from_records(cls, tree_attributes):
+        """由每棵树一个字典的属性列表创建表"""
+        table = cls.empty(len(tree_attributes))
+        table.set_tree_ids([tree['tree_id'] for tree in tree_attributes])
+        for name in CSV_FIELDS[1:]:
+            table.data[name] = [tree[name] for tree in tree_attributes]
+        return table
+    
+    @classmethod
+    def from_columns(cls, columns):
+        """由列名到数组的字典创建表 (缺少的列为NaN)"""
+        size = len(columns['tree_id'])
+        table = cls.empty(size)
+        table.set_tree_ids(columns['tree_id'])
+        for name in CSV_FIELDS[1:]:
+            table.data[name] = columns[name] if name in columns else np.nan
+        return table
+    
+    def __len__(self):
+        return len(self.data)
+    
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.data[key]
+        return TreeTable(self.data[key], None if self.ids is None else self.ids[key])
+    
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+    
+    def apply_allometry(self, a=0.05, b=2.0, c=1.0, carbon_factor=0.5):
+        """
+        按异速生长模型计算生物量和碳储量 (原地更新，返回自身)
+        
+        Args:
+            a, b, c: 生物量模型参数
+            carbon_factor: 生物量到碳的转换因子
+        """
+        biomass_kg = allometric_biomass(self.data['dbh_cm'], self.data['height_m'], a, b, c)
+        self.data['biomass_kg'] = biomass_kg
+        self.data['carbon_kg'] = biomass_kg * carbon_factor
+        return self
+    
+    def chunks(self, chunk_size):
+        """按行切分为共享内存的子表；空表产出一个空子表"""
+        for start in range(0, max(len(self), 1), chunk_size):
+            yield self[start:start + chunk_size]
+    
+    def tree_ids(self):
+        """原编号列表 ("tree_<n>" 形式，或副数组中的原编号)"""
+        if self.ids is not None:
+            return self.ids.tolist()
+        return [f"{TREE_ID_PREFIX}{value}" for value in self.data['tree_id'].tolist()]
+    
+    def to_columns(self):
+        """列名到数组 (列视图) 的字典；有原编号副数组时编号列为字符串"""
+        columns = {name: self.data[name] for name in CSV_FIELDS}
+        if self.ids is not None:
+            columns['tree_id'] = self.ids.astype(object)
+        return columns
+    
+    def to_records(self):
+        """转换为每棵树一个字典的属性列表 (编号为原编号，数值为Python float)"""
+        columns = [self.tree_ids()] + [self.data[name].tolist() for name in CSV_FIELDS[1:]]
+        return [dict(zip(CSV_FIELDS, row)) for row in zip(*columns)]
+    
+    def points(self):
+        """质心点几何数组"""
+        import shapely
+        return shapely.points(self.data['centroid_x'], self.data['centroid_y'])
+    
+    def summary(self):
+        """碳储量汇总统计 (见 AttributeSummary)"""
+        accumulator = AttributeSummary()
+        accumulator.update(self)
+        return accumulator.summary()
+    
+    def reprice(self, models, chunk_size=REPRICE_CHUNK_SIZE):
+        """
+        按一组生物量模型重新估算碳储量，只使用表中的树高和胸径列，不修改表
+        各模型的参数排成列向量，与分块内的树高、胸径广播为 模型数 × 树木数 的矩阵一次计算；
+        生物量和碳储量与 apply_allometry 一样舍入为float32后汇总，结果与逐个模型重新计算一致
+        
+        Args:
+            models: 模型列表，每个模型为含 a、b、c、carbon_factor 的字典 (缺省取 DEFAULT_MODEL，其他键原样保留)
+            chunk_size: 每个分块的树木数
+        
+        Returns:
+            results: 与 models 顺序一致的列表，每项为 {'model': 模型参数, 'summary': 汇总统计}
+        """
+        models = [dict(DEFAULT_MODEL, **model) for model in models]
+        params = np.array([[model[name] for name in DEFAULT_MODEL] for model in models], dtype=np.float64)
+        a, b, c, carbon_factor = params.reshape(len(models), len(DEFAULT_MODEL), 1).transpose(1, 0, 2)
+        
+        accumulators = [AttributeSummary() for _ in models]
+        for chunk in self.chunks(chunk_size):
+            biomass_kg = allometric_biomass(chunk['dbh_cm'], chunk['height_m'], a, b, c)
+            carbon_kg = (biomass_kg * carbon_factor).astype(np.float32)
+            biomass_kg = biomass_kg.astype(np.float32)
+            
+            columns = {name: chunk[name] for name in ('height_m', 'crown_area_m2', 'dbh_cm')}
+            for k, accumulator in enumerate(accumulators):
+                columns['biomass_kg'] = biomass_kg[k]
+                columns['carbon_kg'] = carbon_kg[k]
+                accumulator.update(columns)
+        
+        return [{'model': model, 'summary': accumulator.summary()} for model, accumulator in zip(models, accumulators)]
+    
+    def save(self, path, crs=None):
+        """
+        保存表：.npy 保存结构化数组 (有原编号副数组时另存为 <文件名>.ids.npy)，
+        .parquet 保存为以质心为点几何的GeoParquet
+        
+        Args:
+            path: 输出文件路径
+            crs: 坐标系 (GeoParquet)
+        
+        Returns:
+            path: 输出文件路径
+        """
+        if os.path.splitext(path)[1].lower() == '.npy':
+            np.save(path, self.data)
+            save_ids(path, self.ids)
+            return path
+        if vector_io.format_from_path(path) != 'parquet':
+            raise ValueError(f"单株属性表只能保存为 .npy 或 .parquet: {path}")
+        return vector_io.write_geoparquet(path, self.to_columns(), self.points(), crs)
+    
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        读取 save 保存的表
+        
+        Args:
+            path: .npy 或 .parquet 文件路径
+            mmap_mode: .npy 的内存映射模式 (如 'r')，默认读入内存
+        
+        Returns:
+            table: TreeTable
+        """
+        if os.path.splitext(path)[1].lower() == '.npy':
+            data = np.load(path, mmap_mode=mmap_mode)
+            if data.dtype != TREE_TABLE_DTYPE:
+                if data.dtype.names is None or set(data.dtype.names) != set(TREE_TABLE_DTYPE.names):
+                    raise ValueError(f"不是单株属性表: {path}")
+                data = data.astype(TREE_TABLE_DTYPE)
+            ids = None
+            if os.path.exists(ids_path(path)):
+                ids = np.load(ids_path(path))
+            return cls(data, ids)
+        
+        columns, _ = vector_io.read_table(path)
+        return cls.from_columns(columns)
+
+def parse_tree_ids(tree_ids):
+    """
+    将编号转换为int32编号列：整数直接使用，全部为 "tree_<n>" 形式时取数字部分；
+    否则 (如 "plotA_12" 与 "plotB_12") 编号列为行序号 (1, 2, ...)，原编号保存在字符串副数组中
+    
+    Returns:
+        numbers: int32编号列
+        ids: 原编号的字符串数组，编号可无损转换为整数时为None
+    """
+    values = np.asarray(tree_ids)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int32), None
+    
+    ids = values.astype(str)
+    numbers = vector_io.parse_ids(ids.tolist(), TREE_ID_PREFIX)
+    if numbers is not None and (len(numbers) == 0 or
+                                (numbers.min() >= 0 and numbers.max() <= np.iinfo(np.int32).max)):
+        return numbers.astype(np.int32), None
+    return np.arange(1, len(ids) + 1, dtype=np.int32), ids
+
+def ids_path(path):
+    """.npy 表对应的原编号副数组路径"""
+    return os.path.splitext(path)[0] + IDS_SUFFIX
+
+def save_ids(path, ids):
+    """保存 .npy 表的原编号副数组；没有副数组时删除旧文件"""
+    if ids is not None:
+        np.save(ids_path(path), np.asarray(ids, dtype=str))
+    elif os.path.exists(ids_path(path)):
+        os.remove(ids_path(path))
+
+class AttributeSummary:
+    """
+    碳储量汇总统计的流式累积器：逐块累加总量和树木数，
+    均值和方差按 Welford 方法的分块合并形式 (Chan 等) 更新，不保留单株数据
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.totals = dict.fromkeys(SUMMARY_TOTALS, 0.0)
+        self.means = dict.fromkeys(SUMMARY_MOMENTS, 0.0)
+        self.m2 = dict.fromkeys(SUMMARY_MOMENTS, 0.0)
+    
+    def update(self, table):
+        """合并一个属性分块 (TreeTable，或列名到数组的字典)"""
+        n = len(table['carbon_kg'])
+        if n == 0:
+            return
+        
+        for name in SUMMARY_TOTALS:
+            self.totals[name] += float(np.sum(table[name], dtype=np.float64))
+        
+        total = self.count + n
+        for name in SUMMARY_MOMENTS:
+            values = np.asarray(table[name], dtype=np.float64)
+            batch_mean = float(np.mean(values))
+            batch_m2 = float(np.sum(np.square(values - batch_mean)))
+            delta = batch_mean - self.means[name]
+            self.means[name] += delta * n / total
+            self.m2[name] += batch_m2 + delta * delta * self.count * n / total
+        self.count = total
+    
+    def summary(self):
+        """
+        生成汇总统计
+        
+        Returns:
+            summary: 包含总碳储量和统计的字典
+        """
+        summary = {
+            'total_trees': self.count,
+            'total_carbon_kg': 0,
+            'total_biomass_kg': 0,
+            'total_crown_area_m2': 0,
+            'mean_height_m': 0,
+            'mean_dbh_cm': 0,
+            'mean_carbon_kg': 0
+        }
+        
+        if self.count == 0:
+            return summary
+        
+        for name, field in SUMMARY_TOTALS.items():
+            summary[field] = self.totals[name]
+        
+        # 平均值和 (总体) 标准差
+        for name, field in SUMMARY_MOMENTS.items():
+            summary[f'mean_{field}'] = self.means[name]
+        for name, field in SUMMARY_MOMENTS.items():
+            summary[f'std_{field}'] = math.sqrt(self.m2[name] / self.count)
+        
+        # 转换单位 - 添加吨和公顷单位的值
+        summary['total_carbon_t'] = summary['total_carbon_kg'] / 1000
+        summary['total_biomass_t'] = summary['total_biomass_kg'] / 1000
+        summary['total_crown_area_ha'] = summary['total_crown_area_m2'] / 10000
+        
+        # 计算每公顷碳密度
+        if summary['total_crown_area_ha'] > 0:
+            summary['carbon_density_t_ha'] = summary['total_carbon_t'] / summary['total_crown_area_ha']
+        else:
+            summary['carbon_density_t_ha'] = 0
+        
+        # 转换为CO2当量 (二氧化碳当量)
+        summary['total_co2e_t'] = summary['total_carbon_t'] * CO2_PER_CARBON
+        summary['co2e_density_t_ha'] = summary['carbon_density_t_ha'] * CO2_PER_CARBON
+        
+        logger.info(f"计算得总碳储量: {summary['total_carbon_t']:.2f} 吨，"
+                    f"CO2当量: {summary['total_co2e_t']:.2f} 吨CO2e，"
+                    f"碳密度: {summary['carbon_density_t_ha']:.2f} tC/ha")
+        
+        return summary
\ No newline at end of file
@@ -0,0 +1,629 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+矢量结果读写
+树冠/树顶要素和单株属性表可输出为 GeoJSON、GeoParquet (pyarrow) 或 FlatGeobuf (GDAL/OGR，带空间索引)，
+格式由输出文件扩展名决定。列式格式中属性为定类型的列 (整数编号、float32高度和面积)，
+几何保存为WKB，按批写出；读取时批量解码为Shapely对象，下游阶段不再解析JSON
+"""
+
+import os
+import json
+import math
+import itertools
+import numpy as np
+
+# 格式名与文件扩展名
+FORMAT_EXTENSIONS = {
+    'geojson': '.geojson',
+    'parquet': '.parquet',
+    'fgb': '.fgb',
+    'csv': '.csv',
+}
+
+# 树冠要素支持的格式，以及单株属性表支持的格式
+FEATURE_FORMATS = ('geojson', 'parquet', 'fgb')
+TABLE_FORMATS = ('csv', 'parquet', 'fgb')
+
+# 每批写出的要素数
+WRITE_BATCH_SIZE = 10000
+
+# GeoParquet 元数据版本和几何列名
+GEOPARQUET_VERSION = '1.0.0'
+GEOMETRY_COLUMN = 'geometry'
+
+# FlatGeobuf 图层名
+FGB_LAYER_NAME = 'trees'
+
+def format_from_path(path):
+    """
+    由文件扩展名判断格式
+    
+    Args:
+        path: 文件路径
+    
+    Returns:
+        format: 'geojson'、'parquet'、'fgb' 或 'csv'
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.json', '.geojson'):
+        return 'geojson'
+    if ext in ('.parquet', '.geoparquet'):
+        return 'parquet'
+    if ext == '.fgb':
+        return 'fgb'
+    if ext == '.csv':
+        return 'csv'
+    raise ValueError(f"无法识别的矢量文件格式: {path}")
+
+def _import_ogr():
+    """按需导入OGR，兼容旧版本的顶层 ogr/osr 模块"""
+    try:
+        from osgeo import ogr, osr
+    except ImportError:
+        try:
+            import ogr
+            import osr
+        except ImportError:
+            raise ImportError("写出或读取FlatGeobuf需要GDAL的Python绑定 (osgeo.ogr)")
+    ogr.UseExceptions()
+    return ogr, osr
+
+def _crs_wkt(crs):
+    """坐标系 (WKT字符串或带 to_wkt() 方法的对象) 转换为WKT，未设置时返回None"""
+    if crs is None or isinstance(crs, str):
+        return crs or None
+    return crs.to_wkt()
+
+def _crs_projjson(crs):
+    """坐标系转换为PROJJSON字典 (GeoParquet元数据)，无法转换时返回None"""
+    wkt = _crs_wkt(crs)
+    if wkt is None:
+        return None
+    try:
+        from rasterio.crs import CRS
+        return CRS.from_wkt(wkt).to_dict(projjson=True)
+    except Exception:
+        return None
+
+def crown_geometries(geoms):
+    """
+    批量构建几何对象
+    features.shapes 输出的Polygon字典先把所有环的坐标拼接为一个数组并记录环和多边形的偏移，
+    再用 shapely.from_ragged_array 一次性构建；Point字典批量构建；其他几何逐个转换
+    
+    Args:
+        geoms: GeoJSON几何字典或Shapely对象的序列
+    
+    Returns:
+        polygons: Shapely几何对象数组
+    """
+    import shapely
+    from shapely.geometry import shape
+    
+    polygons = np.empty(len(geoms), dtype=object)
+    
+    rings = []
+    ring_counts = []
+    polygon_index = []
+    points = []
+    point_index = []
+    for i, geom in enumerate(geoms):
+        geom_type = geom.get('type') if isinstance(geom, dict) else None
+        if geom_type == 'Polygon':
+            rings.extend(geom['coordinates'])
+            ring_counts.append(len(geom['coordinates']))
+            polygon_index.append(i)
+        elif geom_type == 'Point':
+            points.append(geom['coordinates'][:2])
+            point_index.append(i)
+        else:
+            polygons[i] = geom if isinstance(geom, shapely.Geometry) else shape(geom)
+    
+    if polygon_index:
+        ring_sizes = np.fromiter(map(len, rings), dtype=np.int64, count=len(rings))
+        coords = np.fromiter(
+            itertools.chain.from_iterable(itertools.chain.from_iterable(rings)),
+            dtype=np.float64, count=2 * int(ring_sizes.sum())
+        ).reshape(-1, 2)
+        ring_offsets = np.concatenate([[0], np.cumsum(ring_sizes)])
+        polygon_offsets = np.concatenate([[0], np.cumsum(ring_counts)])
+        polygons[polygon_index] = shapely.from_ragged_array(
+            shapely.GeometryType.POLYGON, coords, (ring_offsets, polygon_offsets))
+    
+    if point_index:
+        polygons[point_index] = shapely.points(np.asarray(points, dtype=np.float64))
+    
+    return polygons
+
+def _finite_or_none(obj):
+    """将嵌套结构中的NaN和无穷大替换为None (与orjson的编码结果一致)"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite_or_none(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite_or_none(value) for value in obj]
+    return obj
+
+def _json_dumps(obj):
+    """
+    标准库编码，输出格式与orjson相同：紧凑分隔符、UTF-8原样输出、NaN和无穷大写为 null
+    (标准JSON不允许NaN，只在出现时才逐层替换)
+    """
+    try:
+        text = json.dumps(obj, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    except ValueError:
+        text = json.dumps(_finite_or_none(obj), separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    return text.encode('utf-8')
+
+def write_geojson(geojson, output_path, chunk_size=WRITE_BATCH_SIZE):
+    """
+    流式写出GeoJSON FeatureCollection
+    json.dump 使用纯Python编码器逐个片段写出，特征较多时很慢；这里按块用C编码器
+    (json.dumps，安装了orjson时使用orjson) 序列化特征，逐块写入文件；
+    两种编码器的输出格式一致 (见 _json_dumps)，同样的输入在不同主机上得到相同的文件
+    
+    Args:
+        geojson: GeoJSON FeatureCollection 字典
+        output_path: 输出文件路径
+        chunk_size: 每块序列化的特征数
+    
+    Returns:
+        output_path: 输出文件路径
+    """
+    try:
+        import orjson
+        dumps = lambda obj: orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    except ImportError:
+        dumps = _json_dumps
+    
+    features_list = geojson.get('features', [])
+    
+    # 特征数组放在最后：先写出特征数组为空时编码结果的前缀，再逐块写出特征
+    header = dumps({**{k: v for k, v in geojson.items() if k != 'features'}, 'features': []})
+    
+    with open(output_path, 'wb') as f:
+        f.write(header[:-2])
+        for start in range(0, len(features_list), chunk_size):
+            if start:
+                f.write(b',')
+            f.write(dumps(features_list[start:start + chunk_size])[1:-1])
+        f.write(header[-2:])
+    
+    return output_path
+
+def parse_ids(ids, prefix='tree_'):
+    """
+    将 "tree_12" 形式的编号转换为整数数组，只在可以无损还原时转换
+    
+    Args:
+        ids: 编号序列
+        prefix: 编号前缀
+    
+    Returns:
+        numbers: int64数组；存在不能由 "<前缀><整数>" 原样还原的编号 (如 "plotA_12"、"tree_012") 时返回None
+    """
+    ids = [str(value) for value in ids]
+    try:
+        numbers = [int(value[len(prefix):]) if value.startswith(prefix) else None for value in ids]
+    except ValueError:
+        return None
+    if any(number is None or f"{prefix}{number}" != value for number, value in zip(numbers, ids)):
+        return None
+    return np.array(numbers, dtype=np.int64)
+
+def id_column(ids):
+    """编号列：全部为 "tree_<整数>" 形式时保存为int32 (读出时还原为原编号)，否则按原编号保存为字符串"""
+    numbers = parse_ids(ids)
+    if numbers is not None and (len(numbers) == 0 or
+                                (numbers.min() >= 0 and numbers.max() <= np.iinfo(np.int32).max)):
+        return numbers.astype(np.int32)
+    return np.asarray([str(value) for value in ids], dtype=object)
+
+def features_to_columns(features_list):
+    """
+    将树顶/树冠要素转换为定类型的列
+    
+    Args:
+        features_list: build_tree_geojson 输出的要素列表
+    
+    Returns:
+        columns: 列名到数组的字典 (tree_id为整数编号，type为要素类型，height/area为float32，树顶面积为NaN)
+        geometries: Shapely几何对象数组
+    """
+    properties = [feature['properties'] for feature in features_list]
+    tree_ids = [p.get('tree_id', p.get('id')) for p in properties]
+    columns = {
+        'tree_id': id_column(tree_ids),
+        'type': np.asarray([p.get('type', '') for p in properties], dtype=object),
+        'height': np.array([p.get('height', np.nan) for p in properties], dtype=np.float32),
+        'area': np.array([p.get('area', np.nan) for p in properties], dtype=np.float32),
+    }
+    geometries = crown_geometries([feature['geometry'] for feature in features_list])
+    return columns, geometries
+
+def columns_to_features(columns, geometries):
+    """
+    由列和几何重建树顶/树冠要素，编号恢复为 "tree_<n>"、"crown_<n>" 形式，几何为Shapely对象
+    
+    Args:
+        columns: features_to_columns 格式的列
+        geometries: Shapely几何对象数组
+    
+    Returns:
+        features_list: 要素列表
+    """
+    tree_ids = [f"tree_{value}" if isinstance(value, int) else value for value in columns['tree_id'].tolist()]
+    types = columns['type'].tolist()
+    heights = np.asarray(columns['height'], dtype=np.float64).tolist()
+    areas = np.asarray(columns['area'], dtype=np.float64).tolist()
+    
+    features_list = []
+    for i, (tree_id, feature_type, height) in enumerate(zip(tree_ids, types, heights)):
+        if feature_type == 'tree_crown':
+            suffix = tree_id.rsplit('_', 1)[-1]
+            properties = {"id": f"crown_{suffix}", "tree_id": tree_id, "height": height,
+                          "area": areas[i], "type": feature_type}
+        else:
+            properties = {"id": tree_id, "height": height, "type": feature_type}
+        features_list.append({"type": "Feature", "geometry": geometries[i], "properties": properties})
+    return features_list
+
+_GEOMETRY_TYPE_NAMES = {0: 'Point', 1: 'LineString', 3: 'Polygon', 4: 'MultiPoint',
+                        5: 'MultiLineString', 6: 'MultiPolygon', 7: 'GeometryCollection'}
+
+def _geoparquet_metadata(geometry_types, bounds, crs):
+    """
+    GeoParquet 的 "geo" 文件元数据
+    
+    Args:
+        geometry_types: Shapely几何类型编号集合
+        bounds: 全部几何的外包框 (xmin, ymin, xmax, ymax)，未知时为None
+        crs: 坐标系
+    """
+    column = {
+        'encoding': 'WKB',
+        'geometry_types': [_GEOMETRY_TYPE_NAMES[t] for t in sorted(geometry_types) if t in _GEOMETRY_TYPE_NAMES],
+        # 未设置坐标系时显式写为null (未知)，不能省略 (省略表示 OGC:CRS84)
+        'crs': _crs_projjson(crs),
+    }
+    if bounds is not None and np.all(np.isfinite(bounds)):
+        column['bbox'] = [float(v) for v in bounds]
+    return {'version': GEOPARQUET_VERSION, 'primary_column': GEOMETRY_COLUMN, 'columns': {GEOMETRY_COLUMN: column}}
+
+def _merge_bounds(bounds, geometries):
+    """将一批几何的外包框合并到已有外包框"""
+    import shapely
+    
+    if len(geometries) == 0:
+        return bounds
+    batch_bounds = shapely.total_bounds(geometries)
+    if not np.all(np.isfinite(batch_bounds)):
+        return bounds
+    if bounds is None:
+        return batch_bounds
+    return np.concatenate([np.minimum(bounds[:2], batch_bounds[:2]), np.maximum(bounds[2:], batch_bounds[2:])])
+
+def table_batches(columns, geometries, batch_size=WRITE_BATCH_SIZE):
+    """
+    将整表按行切分为 (columns, geometries) 批次；空表也输出一个空批次，保证写出表结构
+    
+    Args:
+        columns: 列名到numpy数组的字典
+        geometries: Shapely几何对象数组，可为None
+        batch_size: 每批的行数
+    """
+    n = len(geometries) if geometries is not None else len(next(iter(columns.values()), ()))
+    for start in range(0, max(n, 1), batch_size):
+        batch = {name: np.asarray(values)[start:start + batch_size] for name, values in columns.items()}
+        yield batch, (geometries[start:start + batch_size] if geometries is not None else None)
+
+def _arrow_column(values):
+    """numpy列转换为Arrow数组：浮点NaN写为空值，字符串列使用字典编码"""
+    import pyarrow as pa
+    
+    values = np.asarray(values)
+    if values.dtype == object:
+        return pa.array(values.tolist(), type=pa.string()).dictionary_encode()
+    if values.dtype.kind == 'f':
+        return pa.array(values, mask=np.isnan(values))
+    return pa.array(values)
+
+def write_geoparquet(output_path, columns, geometries, crs=None, batch_size=WRITE_BATCH_SIZE):
+    """
+    按批写出GeoParquet (几何列为WKB，文件元数据中记录 "geo" 信息)
+    
+    Args:
+        output_path: 输出文件路径
+        columns: 列名到numpy数组的字典
+        geometries: Shapely几何对象数组，None时只写出属性列
+        crs: 坐标系
+        batch_size: 每批 (行组) 的行数
+    
+    Returns:
+        output_path: 输出文件路径
+    """
+    return write_geoparquet_batches(output_path, table_batches(columns, geometries, batch_size), crs)
+
+def write_geoparquet_batches(output_path, batches, crs=None):
+    """
+    逐批写出GeoParquet，每批一个行组，内存占用只与批大小有关；
+    几何类型和外包框随写出累积，关闭文件前写入 "geo" 元数据
+    
+    Args:
+        output_path: 输出文件路径
+        batches: (columns, geometries) 批次的可迭代对象，各批的列和类型须一致
+        crs: 坐标系
+    
+    Returns:
+        output_path: 输出文件路径
+    """
+    import shapely
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    writer = None
+    has_geometry = False
+    geometry_types = set()
+    bounds = None
+    try:
+        for columns, geometries in batches:
+            arrays = {name: _arrow_column(values) for name, values in columns.items()}
+            if geometries is not None:
+                has_geometry = True
+                arrays[GEOMETRY_COLUMN] = pa.array(shapely.to_wkb(geometries).tolist(), type=pa.binary())
+                geometry_types.update(shapely.get_type_id(geometries).tolist())
+                bounds = _merge_bounds(bounds, geometries)
+            
+            table = pa.table(arrays)
+            if writer is None:
+                # 不保存Arrow表结构，使文件级 "geo" 元数据在读取时出现在表结构元数据中
+                writer = pq.ParquetWriter(output_path, table.schema, store_schema=False)
+            writer.write_table(table)
+        
+        if writer is not None and has_geometry:
+            metadata = _geoparquet_metadata(geometry_types, bounds, crs)
+            writer.add_key_value_metadata({'geo': json.dumps(metadata)})
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    return output_path
+
+def read_geoparquet(path):
+    """
+    读取GeoParquet
+    
+    Returns:
+        columns: 列名到numpy数组的字典 (字符串列为对象数组，空值浮点为NaN)
+        geometries: Shapely几何对象数组，文件没有几何列时为None
+    """
+    import shapely
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    geometry_column = None
+    if b'geo' in metadata:
+        geometry_column = json.loads(metadata[b'geo']).get('primary_column', GEOMETRY_COLUMN)
+    
+    columns = {}
+    geometries = None
+    for name in table.column_names:
+        column = table.column(name)
+        if name == geometry_column:
+            geometries = shapely.from_wkb(np.asarray(column.to_pylist(), dtype=object))
+        elif pa.types.is_dictionary(column.type) or pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            columns[name] = np.asarray(column.to_pylist(), dtype=object)
+        else:
+            values = column.to_numpy(zero_copy_only=False)
+            columns[name] = values.astype(np.float64) if values.dtype == object else values
+    return columns, geometries
+
+def write_flatgeobuf(output_path, columns, geometries, crs=None, batch_size=WRITE_BATCH_SIZE):
+    """
+    写出带空间索引的FlatGeobuf (GDAL/OGR)
+    
+    Args:
+        output_path: 输出文件路径
+        columns: 列名到numpy数组的字典
+        geometries: Shapely几何对象数组
+        crs: 坐标系
+        batch_size: 每批转换的要素数
+    
+    Returns:
+        output_path: 输出文件路径
+    """
+    import shapely
+    
+    # 图层几何类型须在创建时确定：全部几何类型一致时使用该类型
+    type_ids = set(shapely.get_type_id(geometries).tolist())
+    geometry_type = type_ids.pop() if len(type_ids) == 1 else None
+    return write_flatgeobuf_batches(
+        output_path, table_batches(columns, geometries, batch_size), crs, geometry_type
+    )
+
+def write_flatgeobuf_batches(output_path, batches, crs=None, geometry_type=None):
+    """
+    逐批写出带空间索引的FlatGeobuf (GDAL/OGR)，空间索引在关闭数据源时生成
+    
+    Args:
+        output_path: 输出文件路径
+        batches: (columns, geometries) 批次的可迭代对象，各批的列和类型须一致
+        crs: 坐标系
+        geometry_type: 图层几何类型 (Shapely类型编号)，为None时取第一批几何的类型 (类型不一致时为未知类型)
+    
+    Returns:
+        output_path: 输出文件路径
+    """
+    import shapely
+    
+    ogr, osr = _import_ogr()
+    
+    driver = ogr.GetDriverByName('FlatGeobuf')
+    if os.path.exists(output_path):
+        driver.DeleteDataSource(output_path)
+    ds = driver.CreateDataSource(output_path)
+    
+    srs = None
+    wkt = _crs_wkt(crs)
+    if wkt:
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(wkt)
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    
+    layer = None
+    names = None
+    for columns, geometries in batches:
+        if layer is None:
+            if geometry_type is None:
+                type_ids = set(shapely.get_type_id(geometries).tolist())
+                geometry_type = type_ids.pop() if len(type_ids) == 1 else None
+            geom_type = {0: ogr.wkbPoint, 3: ogr.wkbPolygon}.get(geometry_type, ogr.wkbUnknown)
+            layer = ds.CreateLayer(FGB_LAYER_NAME, srs, geom_type, options=['SPATIAL_INDEX=YES'])
+            
+            # 字段类型：整数、float32/float64 实数、字符串
+            names = list(columns)
+            for name in names:
+                values = np.asarray(columns[name])
+                if values.dtype.kind in 'iu':
+                    field = ogr.FieldDefn(name, ogr.OFTInteger if values.dtype.itemsize <= 4 else ogr.OFTInteger64)
+                elif values.dtype.kind == 'f':
+                    field = ogr.FieldDefn(name, ogr.OFTReal)
+                    if values.dtype == np.float32:
+                        field.SetSubType(ogr.OFSTFloat32)
+                else:
+                    field = ogr.FieldDefn(name, ogr.OFTString)
+                layer.CreateField(field)
+            defn = layer.GetLayerDefn()
+        
+        wkbs = shapely.to_wkb(geometries)
+        rows = zip(*(np.asarray(columns[name]).tolist() for name in names))
+        for wkb, row in zip(wkbs, rows):
+            feature = ogr.Feature(defn)
+            for field_index, value in enumerate(row):
+                if value is None or (isinstance(value, float) and np.isnan(value)):
+                    feature.SetFieldNull(field_index)
+                else:
+                    feature.SetField(field_index, value)
+            feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb))
+            layer.CreateFeature(feature)
+    
+    # 关闭数据源时生成空间索引并写出文件
+    layer = None
+    ds = None
+    return output_path
+
+def read_flatgeobuf(path):
+    """
+    读取FlatGeobuf (GDAL/OGR)
+    
+    Returns:
+        columns: 列名到numpy数组的字典
+        geometries: Shapely几何对象数组
+    """
+    import shapely
+    
+    ogr, _ = _import_ogr()
+    
+    ds = ogr.Open(path)
+    if ds is None:
+        raise ValueError(f"无法打开FlatGeobuf文件: {path}")
+    layer = ds.GetLayer(0)
+    defn = layer.GetLayerDefn()
+    
+    fields = []
+    for i in range(defn.GetFieldCount()):
+        field = defn.GetFieldDefn(i)
+        field_type = field.GetType()
+        if field_type == ogr.OFTInteger:
+            dtype = np.int32
+        elif field_type == ogr.OFTInteger64:
+            dtype = np.int64
+        elif field_type == ogr.OFTReal:
+            dtype = np.float32 if field.GetSubType() == ogr.OFSTFloat32 else np.float64
+        else:
+            dtype = object
+        fields.append((field.GetName(), dtype))
+    
+    values = {name: [] for name, _ in fields}
+    wkbs = []
+    layer.ResetReading()
+    for feature in layer:
+        for i, (name, dtype) in enumerate(fields):
+            if feature.IsFieldNull(i):
+                values[name].append(np.nan if dtype in (np.float32, np.float64) else None)
+            else:
+                values[name].append(feature.GetField(i))
+        geometry = feature.GetGeometryRef()
+        wkbs.append(bytes(geometry.ExportToWkb()) if geometry is not None else None)
+    ds = None
+    
+    columns = {name: np.asarray(values[name], dtype=dtype) for name, dtype in fields}
+    return columns, shapely.from_wkb(np.asarray(wkbs, dtype=object))
+
+def write_table(output_path, columns, geometries, crs=None, batch_size=WRITE_BATCH_SIZE):
+    """按输出文件扩展名写出GeoParquet或FlatGeobuf"""
+    output_format = format_from_path(output_path)
+    if output_format == 'parquet':
+        return write_geoparquet(output_path, columns, geometries, crs, batch_size)
+    if output_format == 'fgb':
+        return write_flatgeobuf(output_path, columns, geometries, crs, batch_size)
+    raise ValueError(f"不支持的列式输出格式: {output_path}")
+
+def write_table_batches(output_path, batches, crs=None):
+    """按输出文件扩展名逐批写出GeoParquet或FlatGeobuf，batches 为 (columns, geometries) 批次的可迭代对象"""
+    output_format = format_from_path(output_path)
+    if output_format == 'parquet':
+        return write_geoparquet_batches(output_path, batches, crs)
+    if output_format == 'fgb':
+        return write_flatgeobuf_batches(output_path, batches, crs)
+    raise ValueError(f"不支持的列式输出格式: {output_path}")
+
+def read_table(path):
+    """按文件扩展名读取GeoParquet或FlatGeobuf，返回 (columns, geometries)"""
+    input_format = format_from_path(path)
+    if input_format == 'parquet':
+        return read_geoparquet(path)
+    if input_format == 'fgb':
+        return read_flatgeobuf(path)
+    raise ValueError(f"不支持的列式输入格式: {path}")
+
+def write_features(geojson, output_path, crs=None, batch_size=WRITE_BATCH_SIZE):
+    """
+    写出树顶/树冠要素，格式由扩展名决定 (.geojson / .parquet / .fgb)
+    
+    Args:
+        geojson: build_tree_geojson 输出的 FeatureCollection
+        output_path: 输出文件路径
+        crs: 坐标系 (GeoJSON输出不记录坐标系)
+        batch_size: 每批写出的要素数
+    
+    Returns:
+        output_path: 输出文件路径
+    """
+    if format_from_path(output_path) == 'geojson':
+        return write_geojson(geojson, output_path, batch_size)
+    
+    columns, geometries = features_to_columns(geojson['features'])
+    return write_table(output_path, columns, geometries, crs, batch_size)
+
+def read_features(path):
+    """
+    读取树顶/树冠要素；GeoParquet/FlatGeobuf 的几何批量解码为Shapely对象，不经过JSON
+    
+    Args:
+        path: .geojson / .parquet / .fgb 文件路径
+    
+    Returns:
+        geojson: FeatureCollection 字典 (列式格式中几何为Shapely对象)
+    """
+    if format_from_path(path) == 'geojson':
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    columns, geometries = read_table(path)
+    return {"type": "FeatureCollection", "features": columns_to_features(columns, geometries)}
\ No newline at end of file
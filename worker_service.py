@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Python常驻工作服务
+启动一组常驻工作进程，通过标准输入/输出的JSON行协议调用各分析脚本的函数，
+numpy、scipy、rasterio、cv2等依赖的导入开销只在工作进程启动时支付一次
+
+协议 (每行一个JSON对象):
+    请求: {"id": "1", "method": "process_chm", "params": {"chm_path": "..."}}
+    进度: {"id": "1", "type": "progress", "message": "..."}
+    结果: {"id": "1", "type": "result", "result": {...}}
+    错误: {"id": "1", "type": "error", "error": "..."}
+服务就绪后输出 {"type": "ready", "pool_size": N}
+"""
+
+import sys
+import os
+import io
+import json
+import argparse
+import importlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 常驻服务没有图形界面，matplotlib使用非交互后端
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+# 配置日志 (输出到标准错误，标准输出保留给协议消息)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 可调用的方法: 方法名 -> (模块, 函数)
+METHODS = {
+    'process_chm': ('tree_crown_detection', 'process_chm'),
+    'sweep_chm': ('tree_crown_detection', 'sweep_chm'),
+    'calibrate_detection': ('calibrate_detection', 'calibrate_detection'),
+    'process_tree_attributes': ('tree_attributes', 'process_tree_attributes'),
+    'reprice_tree_attributes': ('tree_attributes', 'reprice_tree_attributes'),
+    'run_tree_pipeline': ('tree_pipeline', 'run_tree_pipeline'),
+    'calculate_indices': ('calculate_indices', 'compute_indices'),
+    'calculate_ndvi': ('calculate_indices', 'calculate_ndvi'),
+    'calculate_evi': ('calculate_indices', 'calculate_evi'),
+    'calculate_savi': ('calculate_indices', 'calculate_savi'),
+    'register_images': ('register_image', 'register_images'),
+    'adjust_image': ('adjust_image', 'adjust_image'),
+    'apply_shift': ('adjust_image', 'apply_shift'),
+}
+
+# 返回元组的方法，结果按以下字段名转换为字典
+RESULT_FIELDS = {
+    'process_chm': ('geojson', 'visualization'),
+    'process_tree_attributes': ('csv', 'summary'),
+}
+
+# 工作进程启动时预先导入的模块
+# 分析脚本中的重量级依赖按需导入，这里显式列出以便在服务启动时一次性完成导入
+PRELOAD_MODULES = [
+    'tree_crown_detection',
+    'tree_attributes',
+    'tree_pipeline',
+    'calculate_indices',
+    'register_image',
+    'adjust_image',
+    'scipy.ndimage',
+    'scipy.spatial',
+    'skimage.segmentation',
+    'shapely',
+    'matplotlib.pyplot',
+    'cv2',
+    'osgeo.gdal',
+]
+
+# 工作进程状态，由 _init_worker 初始化
+_progress_queue = None
+_current_job = None
+
+class _ProgressStream(io.TextIOBase):
+    """将脚本中 print 输出的每一行转发为当前作业的进度消息"""
+    
+    def write(self, text):
+        for line in text.splitlines():
+            if line.strip() and _current_job is not None:
+                _progress_queue.put((_current_job, line.strip()))
+        return len(text)
+
+class _ProgressHandler(logging.Handler):
+    """将脚本的日志记录转发为当前作业的进度消息"""
+    
+    def emit(self, record):
+        if _current_job is not None:
+            _progress_queue.put((_current_job, record.getMessage()))
+
+def _init_worker(progress_queue, preload):
+    """工作进程初始化：预先导入依赖，并接管进度输出"""
+    global _progress_queue
+    _progress_queue = progress_queue
+    sys.stdout = _ProgressStream()
+    
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning(f"预加载模块 {module} 失败: {str(e)}")
+    
+    handler = _ProgressHandler()
+    handler.setLevel(logging.INFO)
+    logging.getLogger().addHandler(handler)
+
+def _warmup():
+    """空任务，用于在服务启动时拉起全部工作进程"""
+    return os.getpid()
+
+def _run_job(job_id, method, params):
+    """在工作进程中执行一个作业"""
+    global _current_job
+    _current_job = job_id
+    try:
+        module_name, func_name = METHODS[method]
+        func = getattr(importlib.import_module(module_name), func_name)
+        result = func(**params)
+    finally:
+        _current_job = None
+    
+    if method in RESULT_FIELDS and isinstance(result, tuple):
+        result = dict(zip(RESULT_FIELDS[method], result))
+    return result
+
+def _json_default(obj):
+    """序列化numpy标量和数组"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+class WorkerService:
+    """
+    常驻工作服务：维护进程池和作业队列，并把进度和结果写到协议输出流
+    """
+    
+    def __init__(self, pool_size=2, preload=True, output=None):
+        self.pool_size = pool_size
+        self.preload = PRELOAD_MODULES if preload else []
+        self.output = output or sys.stdout
+        self.lock = threading.Lock()
+        self.progress_queue = multiprocessing.Queue()
+        self.executor = None
+        self.progress_thread = threading.Thread(target=self._forward_progress, daemon=True)
+    
+    def send(self, message):
+        """写出一条协议消息"""
+        line = json.dumps(message, ensure_ascii=False, default=_json_default)
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+    
+    def _forward_progress(self):
+        """将工作进程的进度消息转发到协议输出流"""
+        while True:
+            item = self.progress_queue.get()
+            if item is None:
+                break
+            job_id, message = item
+            self.send({'id': job_id, 'type': 'progress', 'message': message})
+    
+    def _create_executor(self):
+        """创建进程池，并拉起全部工作进程完成依赖导入"""
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.pool_size,
+            initializer=_init_worker,
+            initargs=(self.progress_queue, self.preload)
+        )
+        warmups = [self.executor.submit(_warmup) for _ in range(self.pool_size)]
+        for future in warmups:
+            future.result()
+    
+    def start(self):
+        """启动进度转发线程和进程池"""
+        self.progress_thread.start()
+        self._create_executor()
+        self.send({'type': 'ready', 'pool_size': self.pool_size})
+    
+    def _on_done(self, job_id, future):
+        """作业完成回调"""
+        try:
+            self.send({'id': job_id, 'type': 'result', 'result': future.result()})
+        except Exception as e:
+            self.send({'id': job_id, 'type': 'error', 'error': str(e) or type(e).__name__})
+    
+    def submit(self, request):
+        """提交一个作业请求，超出进程池大小的作业在队列中等待"""
+        job_id = request.get('id')
+        method = request.get('method')
+        params = request.get('params') or {}
+        
+        if method not in METHODS:
+            self.send({'id': job_id, 'type': 'error', 'error': f"未知方法: {method}"})
+            return
+        
+        try:
+            future = self.executor.submit(_run_job, job_id, method, params)
+        except BrokenProcessPool:
+            # 工作进程异常退出后重建进程池
+            logger.warning("进程池已损坏，重新创建工作进程")
+            self.executor.shutdown(wait=False)
+            self._create_executor()
+            future = self.executor.submit(_run_job, job_id, method, params)
+        
+        self.send({'id': job_id, 'type': 'progress', 'message': 'Job queued'})
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+    
+    def serve(self, input_stream=None):
+        """逐行读取请求，直到输入流关闭"""
+        for line in input_stream or sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.send({'id': None, 'type': 'error', 'error': f"无效的请求: {str(e)}"})
+                continue
+            self.submit(request)
+    
+    def shutdown(self):
+        """等待已提交的作业完成后退出"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.progress_queue.put(None)
+        self.progress_thread.join()
+
+def main():
+    """命令行入口函数"""
+    parser = argparse.ArgumentParser(description='Python常驻工作服务 (标准输入/输出JSON行协议)')
+    parser.add_argument('--pool-size', type=int, default=2, help='工作进程数 (默认: 2)')
+    parser.add_argument('--no-preload', action='store_true', help='工作进程启动时不预先导入分析脚本')
+    
+    args = parser.parse_args()
+    
+    # 标准输出只用于协议消息，其余输出重定向到标准错误
+    protocol_output = sys.stdout
+    sys.stdout = sys.stderr
+    
+    service = WorkerService(
+        pool_size=max(1, args.pool_size),
+        preload=not args.no_preload,
+        output=protocol_output
+    )
+    
+    try:
+        service.start()
+        service.serve()
+    finally:
+        service.shutdown()
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file